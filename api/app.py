@@ -1,13 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 import joblib
 import shap
 import pandas as pd
 import numpy as np
 import traceback
+import threading
+import time
+import json
+import os
+import sys
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket channel is optional
+    Sock = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+
+from linear_vitals import LinearVitalsModel
+from delta_scoring import DeltaSession, SessionStore
+from score_channel import CoalescingInbox
+from what_if import sensitivity_grid
+from single_flight import SingleFlight, canonical_key
+from vitals_cache import VitalsCache, model_version
+from stage_timing import stage, record, start_collecting, stop_collecting, server_timing_header, render_prometheus
+from tracing import start_span, end_span, parse_traceparent
+from response_format import shape, negotiate, encode, parse_precision
+import memory_profile
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "http://localhost:3001"]}})
+sock = Sock(app) if Sock else None
 
 # ============================
 # CONFIGURATION
@@ -75,10 +99,11 @@ FEATURE_COLUMNS = [
 # MODEL LOADING
 # ============================
 
-MODEL_PATH = r"D:\Pulmo\orchids-vital-signs-simulation-component\models\vitals_model.pkl"
+MODEL_PATH = os.environ.get("VITALS_MODEL_PATH") or r"D:\Pulmo\orchids-vital-signs-simulation-component\models\vitals_model.pkl"
 
 try:
-    vitals_model = joblib.load(MODEL_PATH)
+    with stage("api", "model_load"):
+        vitals_model = joblib.load(MODEL_PATH)
     scaler = vitals_model.named_steps["scaler"]
     clf = vitals_model.named_steps["clf"]
 
@@ -94,6 +119,12 @@ try:
         feature_names=FEATURE_COLUMNS
     )
     
+    # Closed-form weights for the incremental session API
+    linear_model = LinearVitalsModel.from_components(scaler, clf)
+
+    # Memoized /predict responses keyed on quantized vitals
+    predict_cache = VitalsCache.from_env(version=model_version(MODEL_PATH), namespace="predict")
+    
     print("✅ Model loaded successfully!")
     MODEL_LOADED = True
 except Exception as e:
@@ -103,6 +134,16 @@ except Exception as e:
     scaler = None
     clf = None
     explainer = None
+    linear_model = None
+    predict_cache = None
+
+sessions = SessionStore()
+predict_flight = SingleFlight()
+
+def after_fork():
+    """Per-process state a prefork worker must not share with the master (see prefork.py)"""
+    if predict_cache is not None:
+        predict_cache.after_fork()
 
 # ============================
 # HELPER FUNCTIONS
@@ -134,6 +175,126 @@ def interpret_shap_contributors(top_contributors):
         explanations.append(FEATURE_EXPLANATIONS[feature][key])
     return explanations[:3]  # Return top 3
 
+def build_prediction(vitals, age_group, prob, shap_dict, top_contributors, base_value):
+    """Assembles the /predict response body"""
+    return {
+        "vitals_probability": float(prob),
+        "top_contributors": top_contributors,
+        "risk_factors_text": interpret_shap_contributors(top_contributors),
+        "age_adjusted_flags": age_adjusted_interpretation(vitals, age_group),
+        "shap_values": shap_dict,
+        "base_value": float(base_value)
+    }
+
+def run_prediction(vitals, age_group):
+    """Scaler, classifier and SHAP explainer for one vitals dict"""
+    with stage("api", "features"):
+        X = pd.DataFrame([vitals])[FEATURE_COLUMNS]
+    with stage("api", "scale"):
+        X_scaled = scaler.transform(X)
+    with stage("api", "predict_proba"):
+        prob = clf.predict_proba(X_scaled)[0][1]
+    with stage("api", "shap"):
+        shap_vals = explainer.shap_values(X_scaled)[0]
+    shap_dict = dict(zip(FEATURE_COLUMNS, shap_vals.tolist()))
+
+    # Prepare top contributors
+    sorted_features = sorted(shap_dict.items(), key=lambda x: abs(x[1]), reverse=True)
+    top_contributors = [{"feature": f, "contribution": float(v)} for f, v in sorted_features[:5]]
+
+    # Return full SHAP result with human explanations
+    base_value = explainer.expected_value if hasattr(explainer, 'expected_value') else 0.15
+    return build_prediction(vitals, age_group, prob, shap_dict, top_contributors, base_value)
+
+def session_response(session_id, session):
+    """Prediction body for the current state of a scoring session"""
+    body = build_prediction(
+        session.vitals(),
+        session.age_group,
+        session.probability,
+        session.shap_values(),
+        session.top_contributors(),
+        linear_model.expected_value
+    )
+    body["session_id"] = session_id
+    return body
+
+# ============================
+# RESPONSE FORMAT
+# ============================
+
+def response_options():
+    """fields / explanations / precision from the query string, else the JSON body"""
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+
+    def option(name, default=None):
+        return request.args.get(name) or data.get(name) or default
+
+    return option("fields"), option("explanations", "text"), parse_precision(option("precision"))
+
+def error_response(message, status):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+def respond(body, status=200, keep=()):
+    """
+    Scoring response in the negotiated encoding (Accept: application/msgpack
+    or JSON), reduced to the requested fields (see response_format.py).
+    Codes replace the top 3 risk_factors_text sentences like-for-like.
+    """
+    media_type = negotiate(request.headers.get("Accept"))
+    if media_type is None:
+        return error_response("application/msgpack is unavailable (msgpack not installed); accept application/json", 406)
+    try:
+        fields, explanations, precision = response_options()
+        body = shape(body, fields, explanations, FEATURE_EXPLANATIONS, limit=3, keep=keep)
+    except (TypeError, ValueError) as e:
+        return error_response(str(e), 400)
+    with stage("api", "encode"):
+        payload = encode(body, media_type, precision)
+    response = Response(payload, status=status, mimetype=media_type)
+    response.vary.add("Accept")
+    return response
+
+# ============================
+# REQUEST TIMING
+# ============================
+
+# SERVER_TIMING=1 returns each request's stage durations in a Server-Timing header
+SERVER_TIMING = os.environ.get("SERVER_TIMING") == "1"
+
+@app.before_request
+def start_request_timing():
+    g.timings, g.timing_token = start_collecting()
+    # Continues the caller's trace when a traceparent header is sent, else starts one
+    g.span = start_span(
+        f"{request.method} {request.path}", service="flask",
+        parent=parse_traceparent(request.headers.get("traceparent"))
+    )
+    g.started = time.perf_counter()
+
+@app.after_request
+def finish_request_timing(response):
+    if not hasattr(g, "timing_token"):
+        return response
+    elapsed = time.perf_counter() - g.started
+    g.span.attributes["status_code"] = response.status_code
+    end_span(g.span)
+    stop_collecting(g.timing_token)
+    record("http", request.url_rule.rule if request.url_rule else "unmatched", elapsed)
+    response.headers["traceparent"] = g.span.traceparent
+    if SERVER_TIMING:
+        g.timings.append(("total", elapsed))
+        response.headers["Server-Timing"] = server_timing_header(g.timings)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage and request latency histograms (plus stage memory under MEMORY_PROFILE=1) in Prometheus text format"""
+    return Response(render_prometheus() + memory_profile.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 # ============================
 # API ENDPOINTS
 # ============================
@@ -144,12 +305,17 @@ def health_check():
     return jsonify({
         "status": "healthy" if MODEL_LOADED else "unhealthy",
         "model_loaded": MODEL_LOADED,
-        "message": "Backend is running" if MODEL_LOADED else "Model failed to load"
+        "message": "Backend is running" if MODEL_LOADED else "Model failed to load",
+        "single_flight": {"predict": predict_flight.stats()},
+        "cache": {"predict": predict_cache.stats() if predict_cache else None}
     })
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    """Main prediction endpoint"""
+    """
+    Main prediction endpoint. ?fields=, ?explanations=codes, ?precision=
+    and Accept: application/msgpack shape the response (see respond())
+    """
     if not MODEL_LOADED:
         return jsonify({"error": "Model not loaded. Check server logs."}), 500
 
@@ -166,30 +332,12 @@ def predict():
             if col not in vitals:
                 return jsonify({"error": f"Missing vital: {col}"}), 400
         
-        # Run prediction pipeline
-        X = pd.DataFrame([vitals])[FEATURE_COLUMNS]
-        X_scaled = scaler.transform(X)
-        prob = clf.predict_proba(X_scaled)[0][1]
-        shap_vals = explainer.shap_values(X_scaled)[0]
-        shap_dict = dict(zip(FEATURE_COLUMNS, shap_vals.tolist()))
-        
-        # Prepare top contributors
-        sorted_features = sorted(shap_dict.items(), key=lambda x: abs(x[1]), reverse=True)
-        top_contributors = [{"feature": f, "contribution": float(v)} for f, v in sorted_features[:5]]
-        
-        # Generate human explanations
-        risk_explanations = interpret_shap_contributors(top_contributors)
-        age_flags = age_adjusted_interpretation(vitals, age_group)
-        
-        # Return full SHAP result
-        return jsonify({
-            "vitals_probability": float(prob),
-            "top_contributors": top_contributors,
-            "risk_factors_text": risk_explanations,
-            "age_adjusted_flags": age_flags,
-            "shap_values": shap_dict,
-            "base_value": float(explainer.expected_value) if hasattr(explainer, 'expected_value') else 0.15
-        })
+        # Repeated vitals are served from the cache; identical concurrent misses share one pipeline run
+        def compute(quantized, age_group):
+            key = canonical_key({"vitals": quantized, "age_group": age_group})
+            return predict_flight.do(key, lambda: run_prediction(quantized, age_group))
+
+        return respond(predict_cache.get_or_compute(vitals, age_group, compute))
         
     except Exception as e:
         traceback.print_exc()
@@ -198,10 +346,211 @@ def predict():
             "details": "Check server logs for full traceback"
         }), 500
 
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Starts an incremental scoring session from a full vitals dict"""
+    if not MODEL_LOADED:
+        return jsonify({"error": "Model not loaded. Check server logs."}), 500
+
+    data = request.get_json()
+    if not isinstance(data, dict) or 'vitals' not in data or 'age_group' not in data:
+        return jsonify({"error": "Missing 'vitals' or 'age_group' in request"}), 400
+    if not isinstance(data['vitals'], dict):
+        return jsonify({"error": "'vitals' must be an object"}), 400
+
+    for col in FEATURE_COLUMNS:
+        if col not in data['vitals']:
+            return jsonify({"error": f"Missing vital: {col}"}), 400
+
+    try:
+        session_id, session = sessions.create(linear_model, data['vitals'], data['age_group'])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return respond(session_response(session_id, session), 201, keep=("session_id",))
+
+@app.route('/sessions/<session_id>/delta', methods=['POST'])
+def update_session(session_id):
+    """
+    Applies slider changes to a session and returns the updated prediction.
+    Body: {"feature": ..., "value": ...}, {"feature": ..., "delta": ...}
+    or {"changes": {feature: value, ...}}; "age_group" may be included.
+    """
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+
+    data = request.get_json() or {}
+    if not isinstance(data, dict) or not isinstance(data.get('changes') or {}, dict):
+        return jsonify({"error": "Body must be an object and 'changes' an object of feature: value"}), 400
+    try:
+        with session.lock:
+            changes = dict(data.get('changes') or {})
+            if 'feature' in data:
+                feature = data['feature']
+                if 'value' in data:
+                    changes[feature] = data['value']
+                elif 'delta' in data:
+                    changes[feature] = session.vitals()[feature] + float(data['delta'])
+                else:
+                    return jsonify({"error": "Provide 'value' or 'delta' with 'feature'"}), 400
+
+            session.apply(changes)
+            if 'age_group' in data:
+                session.age_group = data['age_group']
+
+            return respond(session_response(session_id, session), keep=("session_id",))
+    except KeyError as e:
+        return jsonify({"error": str(e.args[0])}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    """Ends a scoring session"""
+    if not sessions.delete(session_id):
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return jsonify({"deleted": session_id})
+
+# ============================
+# WEBSOCKET SCORING CHANNEL
+# ============================
+
+def score_channel_message(message, session):
+    """
+    Applies one coalesced channel message and returns (session, response).
+    A message with "vitals" (plus "age_group") starts from a full state;
+    later messages may send only "changes" relative to it.
+    """
+    if 'vitals' in message:
+        for col in FEATURE_COLUMNS:
+            if col not in message['vitals']:
+                raise ValueError(f"Missing vital: {col}")
+        session = DeltaSession(linear_model, message['vitals'], message.get('age_group', 'preschool'))
+    elif session is None:
+        raise ValueError("First message must include 'vitals'")
+
+    try:
+        session.apply(message.get('changes') or {})
+    except KeyError as e:
+        raise ValueError(str(e.args[0]))
+    if 'age_group' in message:
+        session.age_group = message['age_group']
+
+    return session, build_prediction(
+        session.vitals(),
+        session.age_group,
+        session.probability,
+        session.shap_values(),
+        session.top_contributors(),
+        linear_model.expected_value
+    )
+
+def send_locked(ws, send_lock, body):
+    """The connection is not thread-safe; the reader and scoring loop share one send lock"""
+    with send_lock:
+        ws.send(json.dumps(body))
+
+def receive_into(ws, inbox, send_lock):
+    """Reader thread: parses incoming frames into the inbox until the socket closes"""
+    try:
+        while True:
+            raw = ws.receive()
+            if raw is None:
+                break
+            try:
+                message = json.loads(raw)
+                if not isinstance(message, dict):
+                    raise ValueError("Message must be a JSON object")
+            except ValueError as e:
+                send_locked(ws, send_lock, {"error": f"Invalid message: {e}"})
+                continue
+            inbox.put(message)
+    except Exception as e:
+        # A client closing the socket is the normal way out; anything else is worth a log line
+        if type(e).__name__ != "ConnectionClosed":
+            print(f"WebSocket receive failed: {e!r}")
+            traceback.print_exc()
+    finally:
+        inbox.close()
+
+if sock:
+    @sock.route('/ws/predict')
+    def predict_channel(ws):
+        """
+        Interactive scoring over one WebSocket per client.
+        Send {"seq": n, "vitals": {...}, "age_group": ...} once, then
+        {"seq": n, "changes": {feature: value}} per slider move. Messages that
+        arrive while one is being scored are coalesced, so only the newest
+        state is scored; each response carries the seq it answers and how
+        many requests it superseded.
+        """
+        if not MODEL_LOADED:
+            ws.send(json.dumps({"error": "Model not loaded. Check server logs."}))
+            return
+
+        inbox = CoalescingInbox()
+        send_lock = threading.Lock()
+        threading.Thread(target=receive_into, args=(ws, inbox, send_lock), daemon=True).start()
+
+        session = None
+        while True:
+            message, superseded = inbox.take()
+            if message is None:
+                break
+            body = {"seq": message.get('seq'), "superseded": superseded}
+            try:
+                session, prediction = score_channel_message(message, session)
+                body.update(prediction)
+            except (TypeError, ValueError) as e:
+                body["error"] = str(e)
+            try:
+                send_locked(ws, send_lock, body)
+            except Exception:
+                break
+        inbox.close()
+
+@app.route('/what-if', methods=['POST'])
+def what_if():
+    """
+    Probability curve (one feature) or grid (two features) around a base vitals dict.
+    Body: {"vitals": {...}, "sweeps": [{"feature": "SpO2_percent", "min": 85, "max": 100, "steps": 16}]}
+    A sweep may give "step" instead of "steps", or an explicit "values" list.
+    """
+    if not MODEL_LOADED:
+        return jsonify({"error": "Model not loaded. Check server logs."}), 500
+
+    data = request.get_json()
+    if not data or 'vitals' not in data or 'sweeps' not in data:
+        return jsonify({"error": "Missing 'vitals' or 'sweeps' in request"}), 400
+    if not isinstance(data['sweeps'], list) or not isinstance(data['vitals'], dict):
+        return jsonify({"error": "'sweeps' must be a list and 'vitals' an object"}), 400
+
+    swept = {s.get('feature') for s in data['sweeps'] if isinstance(s, dict)}
+    for col in FEATURE_COLUMNS:
+        if col not in data['vitals'] and col not in swept:
+            return jsonify({"error": f"Missing vital: {col}"}), 400
+
+    try:
+        # Swept features need no base value; any placeholder is replaced along the axis
+        base = {col: data['vitals'].get(col, 0.0) for col in FEATURE_COLUMNS}
+        return respond(sensitivity_grid(linear_model, base, data['sweeps']))
+    except (KeyError, TypeError, ValueError) as e:
+        message = f"Missing sweep field: {e.args[0]}" if isinstance(e, KeyError) else str(e)
+        return jsonify({"error": message}), 400
+
 @app.route('/feature-explanations', methods=['GET'])
 def get_feature_explanations():
-    """Return feature explanations for frontend tooltips"""
-    return jsonify(FEATURE_EXPLANATIONS)
+    """
+    Return feature explanations for frontend tooltips; also the lookup
+    table for explanations=codes, so clients cache it (ETag + max-age)
+    """
+    response = respond(FEATURE_EXPLANATIONS)
+    if response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
 
 # ============================
 # RUN SERVER
@@ -216,6 +565,8 @@ if __name__ == '__main__':
     print("="*60)
     print("Starting Flask server on http://localhost:5000")
     print("Frontend should connect to: http://localhost:5000/predict")
+    if sock:
+        print("Slider scoring channel: ws://localhost:5000/ws/predict")
     print("="*60)
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""
+Prefork production server for the Flask API.
+
+`python api/app.py` runs the single-process development server with the
+reloader, which uses one core and loads the model twice. This loads the
+model and builds the explainer once, in the master. It warms up with one
+prediction and freezes the heap out of the garbage collector's reach.
+Then it forks N workers that share those pages copy-on-write and accept
+from one listening socket:
+
+    python api/prefork.py --workers 8 --max-requests 5000 --blas-threads 1
+
+After --max-requests (plus up to --max-requests-jitter, so workers don't
+all restart together) a worker stops accepting, finishes its in-flight
+requests and exits. The master then forks a fresh one from the warm
+image. SIGTERM/SIGINT drain all workers within --graceful-timeout.
+
+BLAS/OpenMP pools default to cores // workers threads per worker, so N
+workers never start N x cores threads. The limits are set in the
+environment before NumPy loads, and again with threadpoolctl after fork.
+
+State kept in memory is per worker: the /sessions delta API, caches and
+/metrics histograms. Route session traffic stickily, use the
+/ws/predict channel, or set VITALS_CACHE_PATH to share the cache.
+Unix only (fork).
+"""
+import os
+import sys
+import gc
+import time
+import random
+import signal
+import socket
+import argparse
+import threading
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
+DEFAULT_MAX_REQUESTS = 10_000
+DEFAULT_MAX_REQUESTS_JITTER = 1_000
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+DEFAULT_BACKLOG = 2048
+
+# A worker that dies faster than this is crash-looping; respawns are spaced out
+MIN_WORKER_LIFETIME_SECONDS = 1.0
+RESPAWN_BACKOFF_SECONDS = 1.0
+
+# One request through /predict before forking initialises lazily-built state once
+WARMUP_VITALS = {
+    "Temperature_C": 37.0, "Temperature_trend": 0.0,
+    "SpO2_percent": 98.0, "SpO2_trend": 0.0,
+    "HeartRate_bpm": 90.0, "HeartRate_trend": 0.0,
+    "RespRate_bpm": 22.0, "RespRate_trend": 0.0,
+    "Cough": 0, "Retractions": 0
+}
+
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"
+)
+
+def log(message):
+    print(f"[prefork {os.getpid()}] {message}", flush=True)
+
+def limit_blas_threads(threads):
+    """Must run before NumPy is imported for the environment variables to take effect."""
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(threads)
+
+# ----------------------------
+# WORKER
+# ----------------------------
+
+class RequestCounter:
+    """
+    WSGI middleware counting finished requests and tracking in-flight ones;
+    calls on_limit once when the recycle limit is reached.
+    """
+
+    def __init__(self, app, limit, on_limit):
+        self.app = app
+        self.limit = limit
+        self.on_limit = on_limit
+        self.completed = 0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _finished(self):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+            hit = self.limit and self.completed == self.limit
+        if hit:
+            self.on_limit()
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+        with self._lock:
+            self.active += 1
+        try:
+            response = self.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        return ClosingIterator(response, [self._finished])
+
+def run_worker(module, listener, args, max_requests):
+    """Serves from the inherited socket until recycled or told to stop; returns the exit code."""
+    from werkzeug.serving import make_server
+
+    if hasattr(module, "after_fork"):
+        module.after_fork()
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(args.blas_threads)
+    except ImportError:
+        pass
+    random.seed()
+
+    server = None
+    stopping = threading.Event()
+
+    def stop(*_):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() blocks until serve_forever returns, so never call it on the serving thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    counter = RequestCounter(module.app, max_requests, stop)
+    server = make_server(args.host, args.port, counter, threaded=True, fd=listener.fileno())
+    signal.signal(signal.SIGTERM, stop)
+
+    server.serve_forever()
+
+    # Drain requests still running in handler threads
+    deadline = time.monotonic() + args.graceful_timeout
+    while counter.active > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return 0
+
+# ----------------------------
+# MASTER
+# ----------------------------
+
+class Master:
+    def __init__(self, module, listener, args):
+        self.module = module
+        self.listener = listener
+        self.args = args
+        self.workers = {}      # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        max_requests = self.args.max_requests
+        if max_requests and self.args.max_requests_jitter:
+            max_requests += random.randint(0, self.args.max_requests_jitter)
+        pid = os.fork()
+        if pid == 0:
+            # The master's handlers would signal the siblings from inside a worker
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.workers.clear()
+            code = 1
+            try:
+                code = run_worker(self.module, self.listener, self.args, max_requests)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def shutdown(self, *_):
+        if self.stopping:
+            return
+        self.stopping = True
+        log(f"stopping {len(self.workers)} workers")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.shutdown)
+        signal.signal(signal.SIGINT, self.shutdown)
+        for _ in range(self.args.workers):
+            self.spawn()
+        log(f"serving on {self.args.host}:{self.args.port} with {self.args.workers} workers "
+            f"({self.args.blas_threads} BLAS threads each)")
+
+        kill_at = None
+        while self.workers:
+            if self.stopping and kill_at is None:
+                kill_at = time.monotonic() + self.args.graceful_timeout
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if kill_at is not None and time.monotonic() > kill_at:
+                    for pid in list(self.workers):
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass    # exited since the last waitpid
+                    kill_at = float("inf")
+                time.sleep(0.1)
+                continue
+
+            started = self.workers.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                log(f"worker {pid} exited with {code} right after starting; backing off")
+                time.sleep(RESPAWN_BACKOFF_SECONDS)
+            new_pid = self.spawn()
+            log(f"worker {pid} exited ({'recycled' if code == 0 else f'code {code}'}); started {new_pid}")
+        log("stopped")
+
+# ----------------------------
+# ENTRY POINT
+# ----------------------------
+
+def load_app(args):
+    """Imports api/app.py in the master (model load, explainer) and warms it up."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as module
+
+    if getattr(module, "MODEL_LOADED", False):
+        client = module.app.test_client()
+        client.post("/predict", json={"vitals": WARMUP_VITALS, "age_group": "child"})
+
+    # Objects that exist now are never collected; keeps GC from writing to (and so
+    # un-sharing) every copy-on-write page in each worker
+    gc.collect()
+    gc.freeze()
+    return module
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Prefork server for the Flask API")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", DEFAULT_PORT)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", cores)))
+    parser.add_argument("--max-requests", type=int, default=DEFAULT_MAX_REQUESTS,
+                        help="Recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=DEFAULT_MAX_REQUESTS_JITTER)
+    parser.add_argument("--blas-threads", type=int, default=None,
+                        help="BLAS/OpenMP threads per worker (default: cores // workers, at least 1)")
+    parser.add_argument("--graceful-timeout", type=float, default=DEFAULT_GRACEFUL_TIMEOUT)
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG)
+    args = parser.parse_args()
+
+    args.workers = max(args.workers, 1)
+    args.blas_threads = args.blas_threads or max(1, cores // args.workers)
+    limit_blas_threads(args.blas_threads)
+
+    module = load_app(args)
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog, reuse_port=False)
+    listener.set_inheritable(True)
+    Master(module, listener, args).run()
@@ -4,24 +4,18 @@ import joblib
 import tensorflow as tf
 from tensorflow.keras.preprocessing import image
 
+from fusion_logic import (
+    CONFIDENCE_THRESHOLD,
+    triage_level,
+    image_confidence,
+    gated_fusion,
+    system_trust_score
+)
+
 # =========================================================
 # CONFIG
 # =========================================================
 IMG_SIZE = 224
-CONFIDENCE_THRESHOLD = 0.4
-
-# =========================================================
-# TRIAGE LOGIC
-# =========================================================
-def triage_level(score):
-    if score < 0.35:
-        return "LOW RISK", "🟢 Monitor at home"
-    elif score < 0.60:
-        return "MODERATE RISK", "🟡 Further testing"
-    elif score < 0.80:
-        return "HIGH RISK", "🟠 Admit for observation"
-    else:
-        return "CRITICAL RISK", "🔴 Immediate intervention"
 
 # =========================================================
 # LOAD MODELS
@@ -42,9 +36,6 @@ def get_image_probability(img_path):
     arr = np.expand_dims(arr, axis=0)
     return float(img_model.predict(arr)[0][0])
 
-def image_confidence(p_img):
-    return abs(p_img - 0.5) * 2
-
 # =========================================================
 # VITALS PIPELINE
 # =========================================================
@@ -69,48 +60,6 @@ def age_adjusted_abnormalities(vitals_dict):
     )
     return "Present" if abnormal else "Absent"
 
-# =========================================================
-# GATED FUSION LOGIC (CORE)
-# =========================================================
-def gated_fusion(P_img, P_vitals):
-    img_conf = image_confidence(P_img)
-
-    # Default weighting
-    w_img, w_vitals = 0.6, 0.4
-    gate_message = "High confidence imaging evidence"
-
-    # Confidence-based fail-safe
-    if img_conf < CONFIDENCE_THRESHOLD:
-        w_img, w_vitals = 0.4, 0.6
-        gate_message = "Imaging confidence reduced → vitals weighted higher"
-
-    final_score = (w_img * P_img) + (w_vitals * P_vitals)
-
-    # Clinical safety cap
-    if P_vitals < 0.65 and final_score > 0.8:
-        final_score = 0.78
-
-    return final_score, w_img, w_vitals, img_conf, gate_message
-
-# =========================================================
-# SYSTEM TRUST SCORE
-# =========================================================
-def system_trust_score(P_img, P_vitals):
-    """
-    Measures agreement + confidence between models.
-    Returns value between 0 and 1.
-    """
-    agreement = 1 - abs(P_img - P_vitals)
-
-    img_conf = abs(P_img - 0.5) * 2
-    vitals_conf = abs(P_vitals - 0.5) * 2
-
-    combined_conf = (img_conf + vitals_conf) / 2
-
-    trust = agreement * combined_conf
-
-    return float(np.clip(trust, 0, 1))
-
 # =========================================================
 # INPUTS
 # =========================================================
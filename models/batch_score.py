@@ -0,0 +1,240 @@
+"""
+Chunked batch scorer for historical vitals files.
+
+Streams a CSV or Parquet file in fixed-size chunks (memory stays constant
+whatever the file size), scores each chunk with array operations over the
+linear model (probability, per-feature attributions, top-k contributors,
+age-adjusted flags) and appends the results to a CSV or Parquet output:
+
+    python models/batch_score.py audit.parquet scored.parquet --chunk-size 200000 --workers 4
+
+Input needs the FEATURE_COLUMNS and optionally an age_group column
+(otherwise --age-group applies to every row). Parquet needs pyarrow.
+Progress (rows/sec) goes to stderr, a JSON summary to stdout.
+"""
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from linear_vitals import FEATURE_COLUMNS, MODEL_PATH, LinearVitalsModel, sigmoid
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+PEDIATRIC_NORMALS = {
+    "infant": {"HeartRate_bpm": (100, 160), "RespRate_bpm": (30, 60)},
+    "toddler": {"HeartRate_bpm": (90, 150), "RespRate_bpm": (24, 40)},
+    "preschool": {"HeartRate_bpm": (80, 120), "RespRate_bpm": (22, 34)},
+    "child": {"HeartRate_bpm": (70, 110), "RespRate_bpm": (18, 30)}
+}
+AGE_GROUPS = list(PEDIATRIC_NORMALS)
+DEFAULT_AGE_GROUP = "preschool"
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_TOP_K = 5
+
+FLAG_LABELS = np.array(["Low for age", "Normal for age", "High for age"], dtype=object)
+
+# ----------------------------
+# READERS / WRITERS
+# ----------------------------
+
+def file_format(path, explicit=None):
+    if explicit:
+        return explicit
+    return "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet input/output needs pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+def read_chunks(path, chunk_size, fmt=None, columns=None):
+    """Yields DataFrames of at most chunk_size rows."""
+    if file_format(path, fmt) == "parquet":
+        _, pq = _require_pyarrow()
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+
+class ChunkWriter:
+    """Appends scored chunks to one CSV or Parquet file."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = file_format(path, fmt)
+        self._parquet = None
+        self._started = False
+
+    def write(self, frame):
+        if self.format == "parquet":
+            pa, pq = _require_pyarrow()
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+# ----------------------------
+# CHUNK SCORING
+# ----------------------------
+
+def age_flags(values, low, high):
+    """'Low/Normal/High for age' per row from per-row normal ranges."""
+    return FLAG_LABELS[1 + (values > high).astype(np.int8) - (values < low).astype(np.int8)]
+
+def score_chunk(model, frame, default_age_group=DEFAULT_AGE_GROUP, top_k=DEFAULT_TOP_K,
+                keep_columns=(), include_shap=False):
+    """Scored DataFrame for one input chunk."""
+    missing = [col for col in FEATURE_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing vital columns: {', '.join(missing)}")
+
+    X = frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    contributions = model.contributions(model.scale_features(X))
+    probability = sigmoid(contributions.sum(axis=1) + model.intercept)
+
+    out = {col: frame[col].to_numpy() for col in keep_columns}
+    out["vitals_probability"] = probability
+
+    # Top-k by absolute contribution, largest first
+    k = min(top_k, len(FEATURE_COLUMNS))
+    if k:
+        magnitude = np.abs(contributions)
+        top = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(magnitude, top, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        names = np.array(FEATURE_COLUMNS, dtype=object)
+        for j in range(k):
+            out[f"top{j + 1}_feature"] = names[top[:, j]]
+            out[f"top{j + 1}_contribution"] = contributions[np.arange(len(X)), top[:, j]]
+
+    # Age-adjusted flags with per-row normal ranges
+    if "age_group" in frame.columns:
+        groups = frame["age_group"].fillna(default_age_group).astype(str)
+        codes = pd.Categorical(groups, categories=AGE_GROUPS).codes
+        codes = np.where(codes < 0, AGE_GROUPS.index(default_age_group), codes)
+    else:
+        codes = np.full(len(X), AGE_GROUPS.index(default_age_group))
+    for signal, flag in (("HeartRate_bpm", "HeartRate_flag"), ("RespRate_bpm", "RespRate_flag")):
+        ranges = np.array([PEDIATRIC_NORMALS[g][signal] for g in AGE_GROUPS], dtype=np.float64)
+        low, high = ranges[codes, 0], ranges[codes, 1]
+        out[flag] = age_flags(X[:, FEATURE_COLUMNS.index(signal)], low, high)
+
+    if include_shap:
+        for i, col in enumerate(FEATURE_COLUMNS):
+            out[f"shap_{col}"] = contributions[:, i]
+
+    return pd.DataFrame(out)
+
+# Worker processes load the model once in the initializer
+_worker_model = None
+
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = LinearVitalsModel.load(model_path)
+
+def _score_in_worker(args):
+    frame, options = args
+    return score_chunk(_worker_model, frame, **options)
+
+# ----------------------------
+# DRIVER
+# ----------------------------
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, model_path=MODEL_PATH,
+               input_format=None, output_format=None, progress=sys.stderr, **options):
+    """Scores input_path into output_path; returns a summary dict."""
+    started = time.perf_counter()
+    writer = ChunkWriter(output_path, output_format)
+    chunks = read_chunks(input_path, chunk_size, input_format)
+    rows = 0
+
+    def report(frame):
+        nonlocal rows
+        writer.write(frame)
+        rows += len(frame)
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"{rows} rows, {rows / elapsed:,.0f} rows/sec", file=progress)
+
+    try:
+        if workers > 1:
+            # At most 2 chunks per worker are in flight, so memory stays bounded
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+                pending = []
+                for frame in chunks:
+                    pending.append(pool.submit(_score_in_worker, (frame, options)))
+                    if len(pending) >= 2 * workers:
+                        report(pending.pop(0).result())
+                for future in pending:
+                    report(future.result())
+        else:
+            model = LinearVitalsModel.load(model_path)
+            for frame in chunks:
+                report(score_chunk(model, frame, **options))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+        "output": output_path
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet vitals file in streaming chunks")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Processes scoring chunks in parallel")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--age-group", default=DEFAULT_AGE_GROUP, choices=AGE_GROUPS,
+                        help="Used for rows without an age_group column")
+    parser.add_argument("--keep", default="", help="Comma-separated input columns copied to the output")
+    parser.add_argument("--shap", action="store_true", help="Write every per-feature attribution")
+    parser.add_argument("--input-format", choices=["csv", "parquet"])
+    parser.add_argument("--output-format", choices=["csv", "parquet"])
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        summary = score_file(
+            args.input,
+            args.output,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            model_path=args.model,
+            input_format=args.input_format,
+            output_format=args.output_format,
+            progress=None if args.quiet else sys.stderr,
+            default_age_group=args.age_group,
+            top_k=args.top_k,
+            keep_columns=[c for c in args.keep.split(",") if c],
+            include_shap=args.shap
+        )
+        print(json.dumps(summary))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
@@ -0,0 +1,222 @@
+"""
+Offline latency benchmark for the report pipeline.
+
+Runs report_generator.build_report against the local LLM stand-in
+(mock_llm_server.py), so it needs no network access or API key:
+
+    python models/bench_reports.py --samples 50 --concurrency 1 2 4 8 16 \
+        --latency lognormal --latency-ms 300 --jitter-ms 100
+
+Pass --base-url to benchmark an already running server instead of the
+in-process mock. Prints one JSON document with three sections:
+end-to-end latency, concurrency scaling and prompt-cache effectiveness.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import report_generator
+from bulk_reports import BulkReportScheduler
+from llm_providers import OpenAICompatibleProvider, set_provider
+from mock_llm_server import config_arguments, config_from_args, serve_in_thread
+from latency_stats import latency_summary
+
+# ----------------------------
+# SYNTHETIC INPUTS
+# ----------------------------
+
+RISK_FACTORS = [
+    "Low oxygen saturation increases pneumonia risk",
+    "Elevated respiratory rate increases pneumonia risk",
+    "Fever contributes to pneumonia suspicion",
+    "Elevated heart rate contributes to pneumonia risk",
+    "Chest retractions indicate increased work of breathing"
+]
+
+CONTRIBUTOR_FEATURES = [
+    "SpO2_trend", "RespRate_trend", "Temperature_trend",
+    "HeartRate_bpm", "RespRate_bpm", "Retractions"
+]
+
+AGE_GROUPS = ["infant", "toddler", "preschool", "child"]
+
+def synthetic_report_inputs(count, seed=0, duplicate_fraction=0.0):
+    """
+    Report inputs shaped like the generate-report route payload.
+    duplicate_fraction of them repeat an earlier input verbatim.
+    """
+    rng = random.Random(seed)
+    inputs = []
+    for i in range(count):
+        if inputs and rng.random() < duplicate_fraction:
+            inputs.append(dict(rng.choice(inputs), id=str(i)))
+            continue
+        features = rng.sample(CONTRIBUTOR_FEATURES, 3)
+        inputs.append({
+            "id": str(i),
+            "vitals_probability": round(rng.random(), 3),
+            "image_probability": round(rng.random(), 3),
+            "age_group": rng.choice(AGE_GROUPS),
+            "shap_contributors": [
+                {"feature": f, "contribution": round(rng.uniform(-2, 2), 2)} for f in features
+            ],
+            "age_adjusted_flags": {
+                "HeartRate": rng.choice(["Normal for age", "High for age"]),
+                "RespRate": rng.choice(["Normal for age", "High for age"])
+            },
+            "risk_factors_text": rng.sample(RISK_FACTORS, 2)
+        })
+    return inputs
+
+# ----------------------------
+# BENCHMARKS
+# ----------------------------
+
+def bench_latency(provider, inputs, stream=False):
+    """Sequential end-to-end latency of build_report, split into LLM and local time."""
+    totals, llm_calls, first_token = [], [], []
+    errors = []
+
+    def complete(messages, max_tokens):
+        started = time.perf_counter()
+        try:
+            text = _timed_completion(provider, messages, max_tokens, stream, started, first_token)
+        except Exception as e:
+            # build_report falls back to the offline summary; count it and move on
+            errors.append(type(e).__name__)
+            raise
+        llm_calls.append(time.perf_counter() - started)
+        return text
+
+    for item in inputs:
+        started = time.perf_counter()
+        report_generator.build_report(item, complete)
+        totals.append(time.perf_counter() - started)
+
+    result = {
+        "end_to_end": latency_summary(totals),
+        "llm_call": latency_summary(llm_calls),
+        "llm_errors": len(errors),
+        "local_overhead_ms": round((sum(totals) - sum(llm_calls)) * 1000.0 / max(len(totals), 1), 3)
+    }
+    if stream:
+        result["time_to_first_token"] = latency_summary(first_token)
+    return result
+
+def _timed_completion(provider, messages, max_tokens, stream, started, first_token):
+    if stream:
+        chunks = []
+        for chunk in provider.stream(messages, max_tokens):
+            if not chunks:
+                first_token.append(time.perf_counter() - started)
+            chunks.append(chunk)
+        return "".join(chunks).strip()
+    return provider.complete(messages, max_tokens)
+
+def _run_bulk(provider, inputs, workers):
+    scheduler = BulkReportScheduler(
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_workers=workers,
+        base_backoff=0.05,
+        complete=provider.complete
+    )
+    fd, path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    os.unlink(path)
+    try:
+        return scheduler.run(inputs, path)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def bench_concurrency(provider, inputs, levels):
+    """Throughput of the bulk scheduler at each worker count."""
+    rows = []
+    for workers in levels:
+        summary = _run_bulk(provider, inputs, workers)
+        elapsed = summary["elapsed_seconds"]
+        rows.append({
+            "workers": workers,
+            "reports": summary["written"],
+            "elapsed_seconds": elapsed,
+            "reports_per_second": round(summary["written"] / elapsed, 2) if elapsed else None,
+            "retries": summary["retries"]
+        })
+    baseline = rows[0]["reports_per_second"] if rows else None
+    for row in rows:
+        row["speedup"] = round(row["reports_per_second"] / baseline, 2) \
+            if baseline and row["reports_per_second"] else None
+    return rows
+
+def bench_cache(provider, count, workers, duplicate_fraction, seed):
+    """Unique inputs versus a duplicate-heavy set of the same size."""
+    unique = _run_bulk(provider, synthetic_report_inputs(count, seed), workers)
+    repeated = _run_bulk(
+        provider, synthetic_report_inputs(count, seed, duplicate_fraction), workers
+    )
+    return {
+        "duplicate_fraction": duplicate_fraction,
+        "unique": {k: unique[k] for k in ("elapsed_seconds", "llm_calls", "deduplicated_prompts")},
+        "repeated": {k: repeated[k] for k in ("elapsed_seconds", "llm_calls", "deduplicated_prompts")},
+        "hit_rate": round(
+            repeated["deduplicated_prompts"]
+            / max(repeated["deduplicated_prompts"] + repeated["llm_calls"], 1), 3
+        ),
+        "speedup": round(unique["elapsed_seconds"] / repeated["elapsed_seconds"], 2)
+            if repeated["elapsed_seconds"] else None
+    }
+
+# ----------------------------
+# MAIN
+# ----------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline against a local LLM stand-in")
+    parser.add_argument("--base-url", help="Use a running OpenAI-compatible server instead of the in-process mock")
+    parser.add_argument("--samples", type=int, default=50, help="Reports per measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duplicate-fraction", type=float, default=0.5)
+    parser.add_argument("--stream", action="store_true", help="Also measure time to first token")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = serve_in_thread(config_from_args(args))
+
+    try:
+        provider = OpenAICompatibleProvider(base_url)
+        set_provider(provider)
+
+        inputs = synthetic_report_inputs(args.samples, seed=args.seed or 0)
+        results = {
+            "base_url": base_url,
+            "mock": None if args.base_url else {
+                "latency": args.latency,
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate,
+                "rate_limit_rate": args.rate_limit_rate
+            },
+            "latency": bench_latency(provider, inputs, stream=args.stream),
+            "concurrency": bench_concurrency(provider, inputs, args.concurrency),
+            "cache": bench_cache(
+                provider, args.samples, max(args.concurrency), args.duplicate_fraction, args.seed or 0
+            )
+        }
+
+        text = json.dumps(results, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
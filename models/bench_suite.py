@@ -0,0 +1,439 @@
+"""
+Micro-benchmarks for the Python hot paths.
+
+Runs on synthetic fixtures, so the real .h5 is not needed. The fixtures are
+a generated StandardScaler + LogisticRegression pipeline with the vitals
+FEATURE_COLUMNS, a stub CNN that has the same Grad-CAM layer name as the
+production network, and a generated chest-film-sized image. They are
+loaded through VITALS_MODEL_PATH / XRAY_MODEL_PATH.
+
+Every run is appended to a history file, so numbers can be compared
+across commits:
+
+    python models/bench_suite.py run --label "before cache"
+    python models/bench_suite.py run --filter gradcam
+    python models/bench_suite.py compare --threshold 0.10     # latest vs previous run
+    python models/bench_suite.py list
+
+compare exits with status 1 when any benchmark's median is slower than
+the baseline by more than the threshold.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import platform
+import argparse
+import tempfile
+import importlib
+import statistics
+import subprocess
+
+import numpy as np
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+FEATURE_COLUMNS = [
+    "Temperature_C", "Temperature_trend",
+    "SpO2_percent", "SpO2_trend",
+    "HeartRate_bpm", "HeartRate_trend",
+    "RespRate_bpm", "RespRate_trend",
+    "Cough", "Retractions"
+]
+
+LAST_CONV_LAYER = "block_13_expand_relu"
+IMAGE_SIZE = 224
+FIXTURE_IMAGE_SIZE = (1024, 1024)
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "history.jsonl")
+DEFAULT_REPEATS = 5
+DEFAULT_MIN_REPEAT_SECONDS = 0.2
+DEFAULT_THRESHOLD = 0.10
+
+SAMPLE_VITALS = {
+    "Temperature_C": 38.6, "Temperature_trend": 0.4,
+    "SpO2_percent": 92.0, "SpO2_trend": -1.2,
+    "HeartRate_bpm": 142.0, "HeartRate_trend": 3.0,
+    "RespRate_bpm": 44.0, "RespRate_trend": 2.0,
+    "Cough": 1.0, "Retractions": 1.0
+}
+SAMPLE_RISK_FACTORS = [
+    "Low oxygen saturation increases pneumonia risk",
+    "Elevated respiratory rate increases pneumonia risk",
+    "Fever contributes to pneumonia suspicion"
+]
+
+# ----------------------------
+# FIXTURES
+# ----------------------------
+
+def make_vitals_pipeline(path, n=5000, seed=0):
+    """Logistic pipeline fitted on synthetic vitals, saved like vitals_model.pkl."""
+    import joblib
+    import pandas as pd
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(seed)
+    label = rng.integers(0, 2, n)
+    X = pd.DataFrame({
+        "Temperature_C": rng.normal(37.4 + label, 0.6),
+        "Temperature_trend": rng.normal(0.3 * label, 0.3),
+        "SpO2_percent": rng.normal(97 - 4 * label, 2),
+        "SpO2_trend": rng.normal(-0.8 * label, 0.8),
+        "HeartRate_bpm": rng.normal(110 + 25 * label, 15),
+        "HeartRate_trend": rng.normal(2 * label, 2),
+        "RespRate_bpm": rng.normal(28 + 10 * label, 5),
+        "RespRate_trend": rng.normal(label, 1),
+        "Cough": rng.random(n) < 0.3 + 0.5 * label,
+        "Retractions": rng.random(n) < 0.1 + 0.5 * label
+    })[FEATURE_COLUMNS].astype(float)
+    pipeline = Pipeline([("scaler", StandardScaler()), ("clf", LogisticRegression(max_iter=1000))])
+    pipeline.fit(X, label)
+    joblib.dump(pipeline, path)
+    return path
+
+def make_stub_cnn(path, seed=0):
+    """Small untrained CNN exposing the production Grad-CAM layer name."""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input((IMAGE_SIZE, IMAGE_SIZE, 3))
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, padding="same")(inputs)
+    x = tf.keras.layers.Conv2D(32, 3, strides=2, padding="same")(x)
+    x = tf.keras.layers.Conv2D(64, 3, strides=2, padding="same")(x)
+    x = tf.keras.layers.Conv2D(96, 3, strides=2, padding="same")(x)
+    x = tf.keras.layers.ReLU(name=LAST_CONV_LAYER)(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(1, activation="sigmoid")(x)
+    tf.keras.Model(inputs, outputs).save(path)
+    return path
+
+def make_xray_image(path, size=FIXTURE_IMAGE_SIZE, seed=0):
+    """Greyscale JPEG with two bright lung-shaped ellipses over noise."""
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    w, h = size
+    pixels = rng.normal(60, 20, (h, w)).clip(0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels, mode="L")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((int(w * 0.15), int(h * 0.15), int(w * 0.48), int(h * 0.85)), fill=150)
+    draw.ellipse((int(w * 0.52), int(h * 0.15), int(w * 0.85), int(h * 0.85)), fill=150)
+    img.save(path, format="JPEG", quality=90)
+    return path
+
+class Fixtures:
+    """Builds fixtures on first use in a temporary directory and points the model env vars at them."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._built = {}
+
+    def _get(self, name, builder, filename):
+        if name not in self._built:
+            self._built[name] = builder(os.path.join(self.directory, filename))
+        return self._built[name]
+
+    def vitals_model(self):
+        path = self._get("vitals", make_vitals_pipeline, "vitals_model.pkl")
+        os.environ["VITALS_MODEL_PATH"] = path
+        return path
+
+    def xray_model(self):
+        path = self._get("xray", make_stub_cnn, "stub_cnn.h5")
+        os.environ["XRAY_MODEL_PATH"] = path
+        return path
+
+    def image(self):
+        return self._get("image", make_xray_image, "fixture_xray.jpeg")
+
+# ----------------------------
+# BENCHMARK CASES
+# ----------------------------
+# Each setup function takes the Fixtures and returns a zero-argument callable to time.
+
+def _vitals_api(fixtures):
+    fixtures.vitals_model()
+    return importlib.import_module("vitals_api")
+
+def _xray_api(fixtures):
+    fixtures.xray_model()
+    return importlib.import_module("xray_api")
+
+def bench_explain_vitals(fixtures):
+    vitals_api = _vitals_api(fixtures)
+    return lambda: vitals_api.explain_vitals(SAMPLE_VITALS, "preschool")
+
+def bench_generate_waterfall_data(fixtures):
+    vitals_api = _vitals_api(fixtures)
+    result = vitals_api.explain_vitals(SAMPLE_VITALS, "preschool")
+    shap_values = result["shap_values"]
+    base_value = vitals_api.explainer.expected_value
+    return lambda: vitals_api.generate_waterfall_data(shap_values, base_value, result["vitals_probability"])
+
+def bench_predict_endpoint(fixtures):
+    fixtures.vitals_model()
+    api_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+    if api_dir not in sys.path:
+        sys.path.insert(0, api_dir)
+    app_module = importlib.import_module("app")
+    if not app_module.MODEL_LOADED:
+        raise RuntimeError("api/app.py failed to load the fixture model")
+    # Distinct vitals per call so the memoization cache and single-flight don't short-circuit
+    app_module.predict_cache.capacity = 0
+    client = app_module.app.test_client()
+    counter = iter(range(10 ** 12))
+
+    def call():
+        vitals = dict(SAMPLE_VITALS, HeartRate_bpm=100.0 + next(counter) % 800 * 0.1)
+        response = client.post("/predict", json={"vitals": vitals, "age_group": "preschool"})
+        if response.status_code != 200:
+            raise RuntimeError(response.get_json())
+    return call
+
+def bench_preprocess_image(fixtures):
+    xray_api = _xray_api(fixtures)
+    path = fixtures.image()
+    return lambda: xray_api.preprocess_image(path)
+
+def bench_make_gradcam_heatmap(fixtures):
+    xray_api = _xray_api(fixtures)
+    img_array, _ = xray_api.preprocess_image(fixtures.image())
+    return lambda: xray_api.make_gradcam_heatmap(img_array, xray_api.model, xray_api.LAST_CONV_LAYER)
+
+def bench_apply_lung_mask(fixtures):
+    xray_api = _xray_api(fixtures)
+    heatmap = np.random.default_rng(0).random((14, 14)).astype(np.float32)
+    return lambda: xray_api.apply_lung_mask(heatmap)
+
+def bench_overlay_heatmap_dynamic(fixtures):
+    xray_api = _xray_api(fixtures)
+    _, raw_img = xray_api.preprocess_image(fixtures.image())
+    heatmap = np.random.default_rng(0).random((14, 14)).astype(np.float32)
+    return lambda: xray_api.overlay_heatmap_dynamic(heatmap, raw_img, "PNEUMONIA")
+
+def bench_png_encode(fixtures):
+    from PIL import Image
+
+    overlay = np.random.default_rng(0).integers(0, 256, (IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+
+    def encode():
+        buffered = io.BytesIO()
+        Image.fromarray(overlay).save(buffered, format="PNG")
+        return base64.b64encode(buffered.getvalue()).decode()
+    return encode
+
+def bench_refine_protocol(fixtures):
+    from report_generator import refine_protocol
+
+    return lambda: refine_protocol("CRITICAL", SAMPLE_RISK_FACTORS)
+
+def bench_gated_fusion(fixtures):
+    from fusion_logic import gated_fusion
+
+    return lambda: gated_fusion(0.72, 0.58)
+
+def bench_evidence_triangulation(fixtures):
+    from Evidence_triangulation import evidence_triangulation
+
+    return lambda: evidence_triangulation(0.81, 0.79, SAMPLE_RISK_FACTORS)
+
+BENCHMARKS = {
+    "explain_vitals": bench_explain_vitals,
+    "generate_waterfall_data": bench_generate_waterfall_data,
+    "predict_endpoint": bench_predict_endpoint,
+    "preprocess_image": bench_preprocess_image,
+    "make_gradcam_heatmap": bench_make_gradcam_heatmap,
+    "apply_lung_mask": bench_apply_lung_mask,
+    "overlay_heatmap_dynamic": bench_overlay_heatmap_dynamic,
+    "png_encode": bench_png_encode,
+    "refine_protocol": bench_refine_protocol,
+    "gated_fusion": bench_gated_fusion,
+    "evidence_triangulation": bench_evidence_triangulation
+}
+
+# ----------------------------
+# TIMING
+# ----------------------------
+
+def time_callable(fn, repeats=DEFAULT_REPEATS, min_repeat_seconds=DEFAULT_MIN_REPEAT_SECONDS):
+    """
+    timeit-style measurement: calibrate the loop count so one repeat takes
+    at least min_repeat_seconds, then report per-call times over the repeats.
+    """
+    fn()  # warm up (lazy imports, graph tracing, caches)
+
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_repeat_seconds or number >= 10 ** 7:
+            break
+        number *= 10 if elapsed < min_repeat_seconds / 10 else 2
+
+    per_call = [elapsed / number]
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number)
+
+    us = [s * 1e6 for s in per_call]
+    return {
+        "median_us": round(statistics.median(us), 3),
+        "min_us": round(min(us), 3),
+        "mean_us": round(statistics.fmean(us), 3),
+        "stdev_us": round(statistics.stdev(us), 3) if len(us) > 1 else 0.0,
+        "loops": number,
+        "repeats": len(us)
+    }
+
+def run_benchmarks(names, repeats=DEFAULT_REPEATS, min_repeat_seconds=DEFAULT_MIN_REPEAT_SECONDS, progress=sys.stderr):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_fixtures_") as directory:
+        fixtures = Fixtures(directory)
+        for name in names:
+            try:
+                fn = BENCHMARKS[name](fixtures)
+            except (ImportError, OSError, RuntimeError, SystemExit) as e:
+                results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            else:
+                results[name] = time_callable(fn, repeats, min_repeat_seconds)
+            if progress:
+                print(f"{name}: {results[name]}", file=progress)
+    return results
+
+# ----------------------------
+# HISTORY
+# ----------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def append_run(history_path, results, label=None):
+    run = {
+        "run_id": uuid.uuid4().hex[:12],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "label": label,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+        "results": results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+def load_history(history_path):
+    runs = []
+    try:
+        with open(history_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    runs.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return runs
+
+def find_run(runs, ref):
+    """A run by id, id prefix, commit or label; 'latest' and 'previous' are relative."""
+    if ref == "latest":
+        return runs[-1] if runs else None
+    if ref == "previous":
+        return runs[-2] if len(runs) > 1 else None
+    for run in reversed(runs):
+        if run["run_id"].startswith(ref) or run.get("commit") == ref or run.get("label") == ref:
+            return run
+    return None
+
+def compare_runs(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    """Median ratio per benchmark present in both runs; regressed when slower by more than threshold."""
+    rows = []
+    for name, result in candidate["results"].items():
+        before = baseline["results"].get(name)
+        if not before or "median_us" not in before or "median_us" not in result:
+            continue
+        ratio = result["median_us"] / before["median_us"] if before["median_us"] else float("inf")
+        rows.append({
+            "benchmark": name,
+            "baseline_us": before["median_us"],
+            "candidate_us": result["median_us"],
+            "change": round(ratio - 1.0, 4),
+            "status": "REGRESSION" if ratio > 1.0 + threshold else
+                      "improved" if ratio < 1.0 - threshold else "ok"
+        })
+    return rows
+
+def format_comparison(rows):
+    lines = [f"{'benchmark':<26}{'baseline':>14}{'candidate':>14}{'change':>10}  status"]
+    for row in rows:
+        lines.append(
+            f"{row['benchmark']:<26}{row['baseline_us']:>12.1f}us{row['candidate_us']:>12.1f}us"
+            f"{row['change'] * 100:>+9.1f}%  {row['status']}"
+        )
+    return "\n".join(lines)
+
+# ----------------------------
+# MAIN
+# ----------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the vitals, X-ray and report hot paths")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSONL file of past runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and append the results to the history")
+    run_parser.add_argument("--filter", default="", help="Only benchmarks whose name contains this")
+    run_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument("--min-repeat-seconds", type=float, default=DEFAULT_MIN_REPEAT_SECONDS)
+    run_parser.add_argument("--label", help="Free-text label stored with the run")
+    run_parser.add_argument("--no-save", action="store_true")
+
+    compare_parser = commands.add_parser("compare", help="Compare two stored runs")
+    compare_parser.add_argument("--baseline", default="previous", help="Run id, commit, label or 'previous'")
+    compare_parser.add_argument("--candidate", default="latest", help="Run id, commit, label or 'latest'")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="Fractional slowdown flagged as a regression")
+    compare_parser.add_argument("--json", action="store_true")
+
+    commands.add_parser("list", help="List stored runs")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        names = [name for name in BENCHMARKS if args.filter in name]
+        results = run_benchmarks(names, args.repeats, args.min_repeat_seconds)
+        run = {"results": results} if args.no_save else append_run(args.history, results, args.label)
+        print(json.dumps(run))
+
+    elif args.command == "compare":
+        runs = load_history(args.history)
+        baseline, candidate = find_run(runs, args.baseline), find_run(runs, args.candidate)
+        if baseline is None or candidate is None:
+            print(json.dumps({"error": "Need two stored runs to compare"}))
+            sys.exit(2)
+        rows = compare_runs(baseline, candidate, args.threshold)
+        print(json.dumps(rows) if args.json else format_comparison(rows))
+        sys.exit(1 if any(row["status"] == "REGRESSION" for row in rows) else 0)
+
+    else:
+        for run in load_history(args.history):
+            ran = sum("median_us" in r for r in run["results"].values())
+            print(f"{run['run_id']}  {run['timestamp']}  {run.get('commit') or '-':<8}  "
+                  f"{ran} benchmarks  {run.get('label') or ''}")
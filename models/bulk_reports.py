@@ -0,0 +1,370 @@
+"""
+Bulk clinical report generation.
+
+Generates reports for a whole list of report inputs (the same dicts the
+generate-report route sends to report_generator.py) while keeping the LLM
+traffic inside a requests-per-minute and tokens-per-minute budget.
+
+    python models/bulk_reports.py inputs.json reports.jsonl --rpm 30 --tpm 6000
+
+Results are appended to the output JSONL file as they finish, so an
+interrupted run picks up where it stopped when started again with the same
+output file.
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import report_generator
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 6000
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_WINDOW_SECONDS = 60.0
+
+# ----------------------------
+# RATE LIMITING
+# ----------------------------
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token cost of a call: ~4 characters per prompt token plus the completion budget."""
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return prompt_chars // 4 + max_tokens
+
+class RateLimiter:
+    """
+    Sliding-window limiter over requests and tokens per minute.
+    acquire() blocks until the call fits in both budgets.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=RATE_LIMIT_WINDOW_SECONDS):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._events and self._events[0][0] <= now - self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    def _fits(self, tokens):
+        if self.requests_per_minute and len(self._events) >= self.requests_per_minute:
+            return False
+        # A single call larger than the whole token budget is let through on an empty window
+        if self.tokens_per_minute and self._events and \
+                self._tokens_in_window + tokens > self.tokens_per_minute:
+            return False
+        return True
+
+    def acquire(self, tokens):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                if now >= self._paused_until and self._fits(tokens):
+                    self._events.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    wait = self._events[0][0] + self.window - now
+            time.sleep(max(wait, 0.01))
+
+    def pause(self, seconds):
+        """Holds back every caller, e.g. after the provider answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+# ----------------------------
+# PROMPT DEDUPLICATION
+# ----------------------------
+
+def prompt_key(messages, max_tokens):
+    """
+    Canonical hash of one completion request. Model and temperature are
+    fixed for the lifetime of the provider, so only the prompt matters.
+    """
+    payload = json.dumps(
+        {
+            "max_tokens": max_tokens,
+            "messages": messages
+        },
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class PromptCache:
+    """
+    Shares one completion between identical prompts, including prompts
+    that arrive while the first one is still in flight. Failed calls are
+    not cached so a later identical prompt tries again.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_run(self, key, fn):
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                with self._lock:
+                    self._futures.pop(key, None)
+                future.set_exception(e)
+
+        return future.result()
+
+# ----------------------------
+# RETRIES
+# ----------------------------
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def _retry_after(exc):
+    """Seconds from a Retry-After header, if the error carries one."""
+    if getattr(exc, "retry_after", None) is not None:
+        return float(exc.retry_after)
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc):
+    """Rate limits, transient server errors and dropped connections are retried."""
+    if _status_code(exc) in RETRYABLE_STATUS_CODES or getattr(exc, "retryable", False):
+        return True
+    name = type(exc).__name__
+    return "Connection" in name or "Timeout" in name
+
+# ----------------------------
+# SCHEDULER
+# ----------------------------
+
+class BulkReportScheduler:
+    """
+    Runs report_generator.build_report for many inputs concurrently.
+    Every LLM call goes through the shared rate limiter and prompt cache.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+        max_workers=DEFAULT_MAX_WORKERS,
+        max_retries=DEFAULT_MAX_RETRIES,
+        base_backoff=1.0,
+        max_backoff=60.0,
+        complete=report_generator.complete_chat
+    ):
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = PromptCache()
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._complete = complete
+        self._stats_lock = threading.Lock()
+        self.stats = {"llm_calls": 0, "retries": 0, "rate_limited": 0, "failed_calls": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _complete_with_retry(self, messages, max_tokens):
+        tokens = estimate_tokens(messages, max_tokens)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            self._count("llm_calls")
+            try:
+                return self._complete(messages, max_tokens)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count("failed_calls")
+                    raise
+
+                # Exponential backoff with jitter, unless the provider told us how long to wait
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+                    delay *= 0.5 + random.random() / 2
+
+                if _status_code(e) == 429:
+                    self._count("rate_limited")
+                    self.limiter.pause(delay)
+
+                self._count("retries")
+                time.sleep(delay)
+
+    def complete(self, messages, max_tokens):
+        """Drop-in replacement for report_generator.complete_chat."""
+        key = prompt_key(messages, max_tokens)
+        return self.cache.get_or_run(
+            key, lambda: self._complete_with_retry(messages, max_tokens)
+        )
+
+    def _build(self, input_data):
+        fallback = []
+
+        def complete(messages, max_tokens):
+            try:
+                return self.complete(messages, max_tokens)
+            except Exception:
+                fallback.append(True)
+                raise
+
+        result = report_generator.build_report(input_data, complete)
+        result["fallback"] = bool(fallback)
+        return result
+
+    def run(self, inputs, output_path, retry_fallbacks=False):
+        """
+        Generates a report for every input not already in output_path and
+        appends each result as one JSON line as soon as it is ready. An id
+        repeated in inputs is generated once, from its first occurrence.
+        """
+        completed = load_completed(output_path, retry_fallbacks)
+        pending = []
+        seen = set()
+        duplicates = 0
+        for index, item in enumerate(inputs):
+            rid = report_id(item, index)
+            if rid in seen:
+                duplicates += 1
+            elif rid not in completed:
+                pending.append((rid, item))
+            seen.add(rid)
+
+        written = 0
+        errors = 0
+        started = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._build, item): rid for rid, item in pending}
+
+            for future in as_completed(futures):
+                rid = futures[future]
+                try:
+                    record = {"id": rid, **future.result()}
+                except Exception as e:
+                    record = {"id": rid, "error": str(e)}
+                    errors += 1
+
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                written += 1
+
+        return {
+            "total": len(inputs),
+            "skipped": len(inputs) - len(pending),
+            "duplicates": duplicates,
+            "written": written,
+            "errors": errors,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "deduplicated_prompts": self.cache.hits,
+            **self.stats
+        }
+
+# ----------------------------
+# INPUT / OUTPUT
+# ----------------------------
+
+def report_id(item, index):
+    """Stable identifier of a report input: its "id" field, else its position."""
+    return str(item.get("id", index))
+
+def load_inputs(path):
+    """Reads report inputs from a JSON list or a JSONL file."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def load_completed(output_path, retry_fallbacks=False):
+    """Ids already written to output_path; the last record per id wins."""
+    latest = {}
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written line from an interrupted run
+                latest[record.get("id")] = record
+    except FileNotFoundError:
+        return set()
+
+    return {
+        rid for rid, record in latest.items()
+        if "error" not in record and not (retry_fallbacks and record.get("fallback"))
+    }
+
+# ----------------------------
+# MAIN
+# ----------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate clinical reports in bulk")
+    parser.add_argument("inputs", help="JSON list or JSONL file of report inputs")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="LLM requests per minute")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="LLM tokens per minute")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="Reports generated concurrently")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--retry-fallbacks", action="store_true",
+                        help="Regenerate reports that previously fell back to the offline summary")
+    args = parser.parse_args()
+
+    try:
+        scheduler = BulkReportScheduler(
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            max_workers=args.workers,
+            max_retries=args.max_retries
+        )
+        summary = scheduler.run(load_inputs(args.inputs), args.output, args.retry_fallbacks)
+        print(json.dumps(summary))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
@@ -0,0 +1,316 @@
+"""
+Bulk X-ray scoring.
+
+Scores a whole archive of chest films (a directory tree such as
+chest_xray/test, or a manifest) without alternating between decoding and
+inference: a pool of decoders reads and resizes images ahead of the CNN,
+a producer thread packs them into fixed-size batches and keeps up to
+`prefetch` batches queued, and the main thread only runs the model.
+
+Results are appended to a JSONL file one batch at a time, and images
+already in it are skipped, so an interrupted run resumes where it
+stopped. Grad-CAM overlays can be written as PNGs for positives only.
+
+    python models/bulk_xray.py chest_xray/test results.jsonl --gradcam positives --gradcam-dir overlays
+"""
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+IMAGE_SIZE = (224, 224)
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png", ".bmp")
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_PREFETCH = 4    # batches decoded ahead of the CNN
+DEFAULT_DECODE_WORKERS = os.cpu_count() or 4
+DECODE_TIMING_HISTORY = 100_000
+
+GRADCAM_MODES = ("none", "positives", "all")
+
+# ----------------------------
+# INPUTS
+# ----------------------------
+
+def find_images(source):
+    """
+    Image paths from a directory (walked recursively, sorted), a CSV
+    manifest with an image_path column, or a text file of paths.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(
+                os.path.join(root, name) for name in sorted(files)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        return paths
+
+    if source.lower().endswith(".csv"):
+        import pandas as pd
+
+        return pd.read_csv(source)["image_path"].astype(str).tolist()
+
+    with open(source, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def decode_image(path, size=IMAGE_SIZE):
+    """
+    Same pixels as xray_api.preprocess_image (Keras load_img resizes
+    with nearest neighbour), without needing TensorFlow in the decoder.
+    """
+    with Image.open(path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img = img.resize(size, Image.NEAREST)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+def _decode_safe(path):
+    started = time.perf_counter()
+    try:
+        return path, decode_image(path), None, time.perf_counter() - started
+    except Exception as e:
+        return path, None, str(e), time.perf_counter() - started
+
+# ----------------------------
+# PREFETCHING BATCHES
+# ----------------------------
+
+class BatchPrefetcher:
+    """
+    Decodes images in a pool and yields (paths, batch, failures) with
+    `prefetch` batches kept ready. At most one batch per prefetch slot of
+    decodes is outstanding, so memory stays bounded for any archive size.
+    """
+
+    _DONE = object()
+
+    def __init__(self, paths, batch_size=DEFAULT_BATCH_SIZE, prefetch=DEFAULT_PREFETCH,
+                 decode_workers=DEFAULT_DECODE_WORKERS, processes=False):
+        self.paths = paths
+        self.batch_size = batch_size
+        self.window = batch_size * (prefetch + 1)
+        self.batches = queue.Queue(maxsize=prefetch)
+        pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.pool = pool_class(max_workers=decode_workers)
+        self.error = None
+        self.decode_seconds = deque(maxlen=DECODE_TIMING_HISTORY)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _flush(self, decoded):
+        paths = [p for p, array, _, _ in decoded if array is not None]
+        batch = np.stack([array for _, array, _, _ in decoded if array is not None]) if paths else None
+        failures = [(p, error) for p, _, error, _ in decoded if error is not None]
+        self.decode_seconds.extend(seconds for _, _, _, seconds in decoded)
+        return self._put((paths, batch, failures))
+
+    def _produce(self):
+        try:
+            pending = deque()
+            decoded = []
+            for path in self.paths:
+                pending.append(self.pool.submit(_decode_safe, path))
+                if len(pending) >= self.window:
+                    decoded.append(pending.popleft().result())
+                if len(decoded) == self.batch_size:
+                    if not self._flush(decoded):
+                        return
+                    decoded = []
+            while pending:
+                decoded.append(pending.popleft().result())
+                if len(decoded) == self.batch_size:
+                    if not self._flush(decoded):
+                        return
+                    decoded = []
+            if decoded:
+                self._flush(decoded)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(self._DONE)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                item = self.batches.get()
+                if item is self._DONE:
+                    break
+                yield item
+            if self.error:
+                raise self.error
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+# ----------------------------
+# OUTPUT / RESUME
+# ----------------------------
+
+def load_completed(output_path):
+    """Paths already scored without error in output_path."""
+    done = set()
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written line from an interrupted run
+                if "error" in record:
+                    done.discard(record.get("path"))
+                else:
+                    done.add(record.get("path"))
+    except FileNotFoundError:
+        pass
+    return done
+
+def gradcam_filename(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+    return f"{stem}_{digest}.png"
+
+# ----------------------------
+# SCORING
+# ----------------------------
+
+def score_archive(
+    paths,
+    output_path,
+    batch_size=DEFAULT_BATCH_SIZE,
+    prefetch=DEFAULT_PREFETCH,
+    decode_workers=DEFAULT_DECODE_WORKERS,
+    processes=False,
+    gradcam="none",
+    gradcam_dir=None,
+    threshold=None,
+    progress=sys.stderr
+):
+    """Scores every path not already in output_path; returns a summary dict."""
+    import xray_api
+
+    if gradcam not in GRADCAM_MODES:
+        raise ValueError(f"gradcam must be one of {GRADCAM_MODES}")
+    if gradcam != "none":
+        if not gradcam_dir:
+            raise ValueError("gradcam_dir is required when writing Grad-CAM overlays")
+        os.makedirs(gradcam_dir, exist_ok=True)
+        grad_model = xray_api.make_grad_model(xray_api.model, xray_api.LAST_CONV_LAYER)
+    threshold = xray_api.PNEUMONIA_THRESHOLD if threshold is None else threshold
+
+    completed = load_completed(output_path)
+    todo = [p for p in paths if p not in completed]
+    timings = {"input_wait": 0.0, "inference": 0.0, "gradcam": 0.0}
+    counts = {"scored": 0, "failed": 0, "positives": 0, "gradcams": 0}
+    started = time.perf_counter()
+
+    prefetcher = BatchPrefetcher(todo, batch_size, prefetch, decode_workers, processes)
+    with open(output_path, "a", encoding="utf-8") as out:
+        waited = time.perf_counter()
+        for batch_paths, batch, failures in prefetcher:
+            timings["input_wait"] += time.perf_counter() - waited
+            records = [{"path": p, "error": error} for p, error in failures]
+            counts["failed"] += len(failures)
+
+            if batch is not None:
+                t = time.perf_counter()
+                probs = np.asarray(xray_api.model(batch, training=False))[:, 0]
+                timings["inference"] += time.perf_counter() - t
+
+                for i, (path, prob) in enumerate(zip(batch_paths, probs)):
+                    label = "PNEUMONIA" if prob >= threshold else "NORMAL"
+                    record = {"path": path, "probability": float(prob), "label": label}
+
+                    if gradcam == "all" or (gradcam == "positives" and label == "PNEUMONIA"):
+                        t = time.perf_counter()
+                        raw_img = Image.fromarray(np.uint8(np.round(batch[i] * 255.0)))
+                        overlay = xray_api.render_gradcam(batch[i:i + 1], raw_img, label, grad_model)
+                        record["gradcam_path"] = os.path.join(gradcam_dir, gradcam_filename(path))
+                        Image.fromarray(overlay.astype("uint8")).save(record["gradcam_path"])
+                        timings["gradcam"] += time.perf_counter() - t
+                        counts["gradcams"] += 1
+
+                    counts["positives"] += label == "PNEUMONIA"
+                    records.append(record)
+                counts["scored"] += len(batch_paths)
+
+            # One write + flush per batch: a crash loses at most the batch in progress
+            out.write("".join(json.dumps(r) + "\n" for r in records))
+            out.flush()
+
+            if progress:
+                elapsed = time.perf_counter() - started
+                done = counts["scored"] + counts["failed"]
+                print(f"{done}/{len(todo)} images, {done / elapsed:.1f} images/sec", file=progress)
+            waited = time.perf_counter()
+
+    elapsed = time.perf_counter() - started
+    return {
+        **counts,
+        "skipped": len(paths) - len(todo),
+        "seconds": round(elapsed, 3),
+        "images_per_second": round((counts["scored"] + counts["failed"]) / elapsed, 2) if elapsed else None,
+        # Share of wall time the CNN spent waiting on decoding
+        "input_wait_fraction": round(timings["input_wait"] / elapsed, 3) if elapsed else None,
+        **{f"{stage}_seconds": round(value, 3) for stage, value in timings.items()}
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a directory or manifest of chest X-rays")
+    parser.add_argument("source", help="Image directory, CSV manifest (image_path column) or text file of paths")
+    parser.add_argument("output", help="JSONL results file; existing results are skipped")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH, help="Decoded batches kept ahead of the CNN")
+    parser.add_argument("--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    parser.add_argument("--processes", action="store_true", help="Decode in processes instead of threads")
+    parser.add_argument("--gradcam", choices=GRADCAM_MODES, default="none")
+    parser.add_argument("--gradcam-dir", help="Directory for Grad-CAM overlay PNGs")
+    parser.add_argument("--threshold", type=float, help="PNEUMONIA cutoff (default: xray_api's)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        summary = score_archive(
+            find_images(args.source),
+            args.output,
+            batch_size=args.batch_size,
+            prefetch=args.prefetch,
+            decode_workers=args.decode_workers,
+            processes=args.processes,
+            gradcam=args.gradcam,
+            gradcam_dir=args.gradcam_dir,
+            threshold=args.threshold,
+            progress=None if args.quiet else sys.stderr
+        )
+        print(json.dumps(summary))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
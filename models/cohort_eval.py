@@ -0,0 +1,291 @@
+"""
+Paired cohort evaluation of the fused pipeline.
+
+Runs the image and vitals branches over a labelled cohort in parallel
+workers, applies gated fusion, trust and triage to every case, and reports
+accuracy and speed together:
+
+    python models/cohort_eval.py cohort.csv --output report.json --cases cases.csv
+
+The manifest is the same one fusion_sweep.py caches: a "label" column
+(1 = pneumonia), the vitals FEATURE_COLUMNS and either "image_path" or a
+precomputed "P_img" (which skips the CNN). The report contains AUC, Brier
+score and a calibration table per branch and for the fused score, the
+label x triage-band confusion, sensitivity/specificity at each band, and
+per-stage throughput and latency percentiles.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from latency_stats import latency_summary
+from fusion_logic import (
+    TRIAGE_BANDS, TRIAGE_CUTOFFS, fused_score_batch, system_trust_score_batch, triage_band_batch
+)
+from linear_vitals import FEATURE_COLUMNS, LinearVitalsModel
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+CALIBRATION_BINS = 10
+VITALS_BATCH_SIZE = 1024
+
+# ----------------------------
+# BRANCHES
+# ----------------------------
+
+def image_branch(paths, batch_size=None, prefetch=None, decode_workers=None):
+    """
+    P_img per path (NaN where decoding failed) plus per-stage timings.
+    None takes bulk_xray's default; its imports (PIL, TensorFlow) load only here.
+    """
+    import bulk_xray
+    import xray_api
+
+    batch_size = batch_size or bulk_xray.DEFAULT_BATCH_SIZE
+    prefetch = prefetch or bulk_xray.DEFAULT_PREFETCH
+    decode_workers = decode_workers or bulk_xray.DEFAULT_DECODE_WORKERS
+
+    index = {path: i for i, path in enumerate(paths)}
+    P_img = np.full(len(paths), np.nan)
+    inference = []
+    failures = []
+
+    prefetcher = bulk_xray.BatchPrefetcher(paths, batch_size, prefetch, decode_workers)
+    for batch_paths, batch, failed in prefetcher:
+        failures.extend(failed)
+        if batch is None:
+            continue
+        t = time.perf_counter()
+        probs = np.asarray(xray_api.model(batch, training=False))[:, 0]
+        inference.append((time.perf_counter() - t, len(batch_paths)))
+        P_img[[index[p] for p in batch_paths]] = probs
+
+    return P_img, {
+        "image_decode": list(prefetcher.decode_seconds),
+        "image_inference": inference,
+        "image_failures": failures
+    }
+
+def vitals_branch(cohort, model, batch_size=VITALS_BATCH_SIZE):
+    """P_vitals for every row, scored in batches so batch latency can be reported."""
+    X = cohort[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    P_vitals = np.empty(len(X))
+    timings = []
+    for start in range(0, len(X), batch_size):
+        t = time.perf_counter()
+        P_vitals[start:start + batch_size] = model.probability(X[start:start + batch_size])
+        timings.append((time.perf_counter() - t, min(batch_size, len(X) - start)))
+    return P_vitals, {"vitals": timings}
+
+# ----------------------------
+# METRICS
+# ----------------------------
+
+def auc(label, score):
+    from sklearn.metrics import roc_auc_score
+
+    if label.all() or not label.any():
+        return None
+    return float(roc_auc_score(label, score))
+
+def calibration(label, prob, bins=CALIBRATION_BINS):
+    """Reliability table, expected calibration error and Brier score."""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    which = np.clip(np.digitize(prob, edges[1:-1]), 0, bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    predicted = np.bincount(which, weights=prob, minlength=bins)
+    observed = np.bincount(which, weights=label.astype(np.float64), minlength=bins)
+
+    table = []
+    ece = 0.0
+    for b in range(bins):
+        if not counts[b]:
+            continue
+        mean_predicted = predicted[b] / counts[b]
+        observed_rate = observed[b] / counts[b]
+        ece += counts[b] / len(prob) * abs(mean_predicted - observed_rate)
+        table.append({
+            "bin": f"{edges[b]:.1f}-{edges[b + 1]:.1f}",
+            "count": int(counts[b]),
+            "mean_predicted": round(float(mean_predicted), 4),
+            "observed_rate": round(float(observed_rate), 4)
+        })
+
+    return {
+        "brier": round(float(np.mean((prob - label) ** 2)), 4),
+        "ece": round(float(ece), 4),
+        "bins": table
+    }
+
+def band_confusion(label, band):
+    """Label x triage-band counts, and sensitivity/specificity for "band >= X" as positive."""
+    confusion = {}
+    for b, (name, _) in enumerate(TRIAGE_BANDS):
+        in_band = band == b
+        confusion[name] = {"negative": int((in_band & ~label).sum()), "positive": int((in_band & label).sum())}
+
+    at_band = {}
+    for b, (name, _) in enumerate(TRIAGE_BANDS[1:], start=1):
+        flagged = band >= b
+        tp, fn = int((flagged & label).sum()), int((~flagged & label).sum())
+        tn, fp = int((~flagged & ~label).sum()), int((flagged & ~label).sum())
+        at_band[name] = {
+            "sensitivity": round(tp / (tp + fn), 4) if tp + fn else None,
+            "specificity": round(tn / (tn + fp), 4) if tn + fp else None
+        }
+    return {"counts": confusion, "at_or_above": at_band}
+
+def stage_summary(timings, wall_seconds=None):
+    """
+    Latency percentiles per timed unit (one image decode, one batch) and
+    items per second of stage time.
+    """
+    if timings and isinstance(timings[0], tuple):
+        seconds = [s for s, _ in timings]
+        items = sum(n for _, n in timings)
+    else:
+        seconds = list(timings)
+        items = len(seconds)
+    total = sum(seconds)
+    summary = latency_summary(seconds)
+    summary["items"] = items
+    summary["items_per_second"] = round(items / total, 1) if total else None
+    if wall_seconds is not None:
+        summary["wall_seconds"] = round(wall_seconds, 3)
+    return summary
+
+# ----------------------------
+# EVALUATION
+# ----------------------------
+
+def load_cohort(manifest_path):
+    cohort = pd.read_csv(manifest_path)
+    if "label" not in cohort.columns:
+        raise ValueError("Cohort manifest needs a 'label' column")
+    if "P_img" not in cohort.columns and "image_path" not in cohort.columns:
+        raise ValueError("Cohort manifest needs an 'image_path' or 'P_img' column")
+    missing = [col for col in FEATURE_COLUMNS if col not in cohort.columns]
+    if missing:
+        raise ValueError(f"Missing vital columns: {', '.join(missing)}")
+    return cohort
+
+def evaluate_cohort(cohort, base_dir=".", batch_size=None, prefetch=None,
+                    decode_workers=None, vitals_model=None):
+    """Returns (report, per-case DataFrame)."""
+    vitals_model = vitals_model or LinearVitalsModel.load()
+    label = cohort["label"].to_numpy().astype(bool)
+    timings = {}
+    wall = {}
+
+    def timed(name, fn, *args):
+        t = time.perf_counter()
+        result = fn(*args)
+        wall[name] = time.perf_counter() - t
+        return result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        if "P_img" in cohort.columns:
+            image_future = None
+            P_img = cohort["P_img"].to_numpy(dtype=np.float64)
+        else:
+            paths = [
+                p if os.path.isabs(p) else os.path.join(base_dir, p)
+                for p in cohort["image_path"].astype(str)
+            ]
+            image_future = pool.submit(timed, "image", image_branch, paths, batch_size, prefetch, decode_workers)
+        vitals_future = pool.submit(timed, "vitals", vitals_branch, cohort, vitals_model)
+
+        P_vitals, vitals_timings = vitals_future.result()
+        timings.update(vitals_timings)
+        if image_future is not None:
+            P_img, image_timings = image_future.result()
+            timings.update(image_timings)
+
+    t = time.perf_counter()
+    scored = ~np.isnan(P_img)
+    final, w_img, w_vitals, img_conf, low_conf = fused_score_batch(P_img[scored], P_vitals[scored])
+    trust = system_trust_score_batch(P_img[scored], P_vitals[scored])
+    band = triage_band_batch(final, TRIAGE_CUTOFFS)
+    fusion_seconds = time.perf_counter() - t
+    total_seconds = time.perf_counter() - started
+
+    y = label[scored]
+    report = {
+        "cases": len(cohort),
+        "scored": int(scored.sum()),
+        "positives": int(y.sum()),
+        "auc": {
+            "image": auc(y, P_img[scored]),
+            "vitals": auc(y, P_vitals[scored]),
+            "fused": auc(y, final)
+        },
+        "calibration": {
+            "image": calibration(y, P_img[scored]),
+            "vitals": calibration(y, P_vitals[scored]),
+            "fused": calibration(y, final)
+        },
+        "triage": band_confusion(y, band),
+        "low_confidence_fraction": round(float(low_conf.mean()), 4) if len(low_conf) else None,
+        "mean_trust": round(float(trust.mean()), 4) if len(trust) else None,
+        "stages": {
+            "vitals": stage_summary(timings["vitals"], wall.get("vitals")),
+            "fusion": {"items": int(scored.sum()), "seconds": round(fusion_seconds, 6)}
+        },
+        "total_seconds": round(total_seconds, 3),
+        "cases_per_second": round(len(cohort) / total_seconds, 1) if total_seconds else None
+    }
+    if "image_decode" in timings:
+        report["stages"]["image_decode"] = stage_summary(timings["image_decode"])
+        report["stages"]["image_inference"] = stage_summary(timings["image_inference"], wall.get("image"))
+        report["image_failures"] = [{"path": p, "error": e} for p, e in timings["image_failures"]]
+
+    cases = pd.DataFrame({
+        "case_id": cohort["case_id"].astype(str) if "case_id" in cohort.columns else np.arange(len(cohort)).astype(str),
+        "label": label.astype(np.int8),
+        "P_img": P_img,
+        "P_vitals": P_vitals
+    })
+    cases.loc[scored, "final_score"] = final
+    cases.loc[scored, "trust"] = trust
+    cases.loc[scored, "triage"] = np.array([name for name, _ in TRIAGE_BANDS], dtype=object)[band]
+    return report, cases
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the fused pipeline on a labelled cohort")
+    parser.add_argument("manifest", help="CSV with label, vitals columns and image_path or P_img")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--cases", help="Write per-case scores and triage bands to this CSV")
+    # Defaults come from bulk_xray, which is imported only when images are scored
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--prefetch", type=int, default=None)
+    parser.add_argument("--decode-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        cohort = load_cohort(args.manifest)
+        report, cases = evaluate_cohort(
+            cohort,
+            base_dir=os.path.dirname(os.path.abspath(args.manifest)),
+            batch_size=args.batch_size,
+            prefetch=args.prefetch,
+            decode_workers=args.decode_workers
+        )
+        if args.cases:
+            cases.to_csv(args.cases, index=False)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
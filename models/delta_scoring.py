@@ -0,0 +1,149 @@
+"""
+Incremental vitals scoring for interactive sessions.
+
+The vitals model is linear in scaled space, so moving one slider only
+shifts the logit by coef_i * (new_i - old_i) / scale_i. A DeltaSession
+keeps the scaled vector, per-feature contributions and logit of one
+simulator session and applies single-feature changes without rebuilding
+a DataFrame or calling the scaler, classifier or SHAP explainer.
+"""
+import math
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from linear_vitals import sigmoid
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_SESSION_CAPACITY = 1000
+DEFAULT_SESSION_TTL_SECONDS = 30 * 60
+
+# The logit is re-summed from the contributions after this many deltas so rounding never accumulates
+RESYNC_EVERY = 256
+
+TOP_CONTRIBUTORS = 5
+
+# ----------------------------
+# SESSION
+# ----------------------------
+
+class DeltaSession:
+    """Scored state of one patient in the simulator."""
+
+    def __init__(self, model, vitals, age_group):
+        self.model = model
+        self.age_group = age_group
+        self.x = model.matrix([vitals])[0]
+        if not np.isfinite(self.x).all():
+            raise ValueError("Vitals must be finite numbers")
+        self.x_scaled = model.scale_features(self.x)
+        self.contributions = model.contributions(self.x_scaled)
+        self.logit = model.intercept + self.contributions.sum()
+        self.updates = 0
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_value(self, feature, value):
+        """Moves one feature to an absolute value in O(1)."""
+        model = self.model
+        i = model.index[feature]
+        value = float(value)
+        scaled = (value - model.mean[i]) / model.scale[i]
+        contribution = model.coef[i] * scaled
+
+        self.logit += contribution - self.contributions[i]
+        self.x[i] = value
+        self.x_scaled[i] = scaled
+        self.contributions[i] = contribution
+
+        self.updates += 1
+        if self.updates % RESYNC_EVERY == 0:
+            self.logit = model.intercept + self.contributions.sum()
+        self.touched = time.monotonic()
+
+    def apply(self, changes):
+        """
+        Applies {feature: new_value} all-or-nothing: unknown features raise
+        KeyError and non-numeric or non-finite values ValueError/TypeError
+        before any feature moves, so a bad key never leaves the session
+        half-updated (and a NaN never reaches the logit).
+        """
+        validated = []
+        for feature, value in changes.items():
+            if feature not in self.model.index:
+                raise KeyError(f"Unknown vital: {feature}")
+            value = float(value)
+            if not math.isfinite(value):
+                raise ValueError(f"{feature} must be a finite number")
+            validated.append((feature, value))
+        for feature, value in validated:
+            self.set_value(feature, value)
+
+    @property
+    def probability(self):
+        return float(sigmoid(self.logit))
+
+    def vitals(self):
+        return dict(zip(self.model.feature_columns, self.x.tolist()))
+
+    def shap_values(self):
+        return dict(zip(self.model.feature_columns, self.contributions.tolist()))
+
+    def top_contributors(self, k=TOP_CONTRIBUTORS):
+        """Largest absolute contributions, ordered like the /predict response."""
+        order = np.argsort(-np.abs(self.contributions), kind="stable")[:k]
+        return [
+            {"feature": self.model.feature_columns[i], "contribution": float(self.contributions[i])}
+            for i in order
+        ]
+
+# ----------------------------
+# SESSION STORE
+# ----------------------------
+
+class SessionStore:
+    """Thread-safe LRU of DeltaSessions with idle expiry."""
+
+    def __init__(self, capacity=DEFAULT_SESSION_CAPACITY, ttl_seconds=DEFAULT_SESSION_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched < self.ttl_seconds and len(self._sessions) <= self.capacity:
+                break
+            del self._sessions[session_id]
+
+    def create(self, model, vitals, age_group):
+        session = DeltaSession(model, vitals, age_group)
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = session
+            self._expire(time.monotonic())
+        return session_id, session
+
+    def get(self, session_id):
+        """Session by id (marked as recently used), or None if unknown or expired."""
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touched = time.monotonic()
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
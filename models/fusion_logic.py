@@ -0,0 +1,207 @@
+"""
+Gated fusion of imaging and vitals evidence.
+
+Scalar functions are the reference implementation used by Gated_logic.py.
+The *_batch versions take arrays of probabilities (a whole ward or cohort)
+and reproduce the scalar results exactly with NumPy masks instead of if
+chains. Every threshold is a keyword argument so parameter sweeps can pass
+arrays that broadcast against the probabilities.
+
+    python models/fusion_logic.py --check   # batch vs scalar equivalence check
+"""
+import sys
+import numpy as np
+
+# =========================================================
+# CONFIG
+# =========================================================
+CONFIDENCE_THRESHOLD = 0.4
+
+# (imaging, vitals) weights
+DEFAULT_WEIGHTS = (0.6, 0.4)
+LOW_CONFIDENCE_WEIGHTS = (0.4, 0.6)
+
+# Clinical safety cap: weak vitals cannot push the fused score past the cap
+SAFETY_CAP_VITALS = 0.65
+SAFETY_CAP_SCORE = 0.8
+SAFETY_CAP_VALUE = 0.78
+
+TRIAGE_CUTOFFS = (0.35, 0.60, 0.80)
+TRIAGE_BANDS = [
+    ("LOW RISK", "🟢 Monitor at home"),
+    ("MODERATE RISK", "🟡 Further testing"),
+    ("HIGH RISK", "🟠 Admit for observation"),
+    ("CRITICAL RISK", "🔴 Immediate intervention")
+]
+
+GATE_HIGH_CONFIDENCE = "High confidence imaging evidence"
+GATE_LOW_CONFIDENCE = "Imaging confidence reduced → vitals weighted higher"
+
+# =========================================================
+# SCALAR (REFERENCE) LOGIC
+# =========================================================
+def triage_level(score):
+    if score < TRIAGE_CUTOFFS[0]:
+        return TRIAGE_BANDS[0]
+    elif score < TRIAGE_CUTOFFS[1]:
+        return TRIAGE_BANDS[1]
+    elif score < TRIAGE_CUTOFFS[2]:
+        return TRIAGE_BANDS[2]
+    else:
+        return TRIAGE_BANDS[3]
+
+def image_confidence(p_img):
+    return abs(p_img - 0.5) * 2
+
+def gated_fusion(P_img, P_vitals):
+    img_conf = image_confidence(P_img)
+
+    # Default weighting
+    w_img, w_vitals = DEFAULT_WEIGHTS
+    gate_message = GATE_HIGH_CONFIDENCE
+
+    # Confidence-based fail-safe
+    if img_conf < CONFIDENCE_THRESHOLD:
+        w_img, w_vitals = LOW_CONFIDENCE_WEIGHTS
+        gate_message = GATE_LOW_CONFIDENCE
+
+    final_score = (w_img * P_img) + (w_vitals * P_vitals)
+
+    # Clinical safety cap
+    if P_vitals < SAFETY_CAP_VITALS and final_score > SAFETY_CAP_SCORE:
+        final_score = SAFETY_CAP_VALUE
+
+    return final_score, w_img, w_vitals, img_conf, gate_message
+
+def system_trust_score(P_img, P_vitals):
+    """
+    Measures agreement + confidence between models.
+    Returns value between 0 and 1.
+    """
+    agreement = 1 - abs(P_img - P_vitals)
+
+    img_conf = abs(P_img - 0.5) * 2
+    vitals_conf = abs(P_vitals - 0.5) * 2
+
+    combined_conf = (img_conf + vitals_conf) / 2
+
+    trust = agreement * combined_conf
+
+    return float(np.clip(trust, 0, 1))
+
+# =========================================================
+# VECTORIZED LOGIC
+# =========================================================
+def image_confidence_batch(p_img):
+    return np.abs(np.asarray(p_img, dtype=np.float64) - 0.5) * 2
+
+def fused_score_batch(
+    P_img,
+    P_vitals,
+    confidence_threshold=CONFIDENCE_THRESHOLD,
+    weights=DEFAULT_WEIGHTS,
+    low_confidence_weights=LOW_CONFIDENCE_WEIGHTS,
+    cap_vitals=SAFETY_CAP_VITALS,
+    cap_score=SAFETY_CAP_SCORE,
+    cap_value=SAFETY_CAP_VALUE
+):
+    """
+    Numeric core of gated_fusion_batch.
+    Returns (final_score, w_img, w_vitals, img_conf, low_confidence_mask).
+    """
+    P_img = np.asarray(P_img, dtype=np.float64)
+    P_vitals = np.asarray(P_vitals, dtype=np.float64)
+    img_conf = image_confidence_batch(P_img)
+
+    # Confidence-based fail-safe
+    low_conf = img_conf < confidence_threshold
+    w_img = np.where(low_conf, low_confidence_weights[0], weights[0])
+    w_vitals = np.where(low_conf, low_confidence_weights[1], weights[1])
+
+    final_score = (w_img * P_img) + (w_vitals * P_vitals)
+
+    # Clinical safety cap
+    capped = (P_vitals < cap_vitals) & (final_score > cap_score)
+    final_score = np.where(capped, cap_value, final_score)
+
+    return final_score, w_img, w_vitals, np.broadcast_to(img_conf, final_score.shape), low_conf
+
+def gated_fusion_batch(P_img, P_vitals, **params):
+    """
+    Array version of gated_fusion; params are the keyword arguments of
+    fused_score_batch. Returns (final_score, w_img, w_vitals, img_conf,
+    gate_message) as arrays of the broadcast shape of the inputs.
+    """
+    final_score, w_img, w_vitals, img_conf, low_conf = fused_score_batch(P_img, P_vitals, **params)
+    gate_message = np.where(low_conf, GATE_LOW_CONFIDENCE, GATE_HIGH_CONFIDENCE)
+    return final_score, w_img, w_vitals, img_conf, gate_message
+
+def system_trust_score_batch(P_img, P_vitals):
+    P_img = np.asarray(P_img, dtype=np.float64)
+    P_vitals = np.asarray(P_vitals, dtype=np.float64)
+
+    agreement = 1 - np.abs(P_img - P_vitals)
+    img_conf = np.abs(P_img - 0.5) * 2
+    vitals_conf = np.abs(P_vitals - 0.5) * 2
+    combined_conf = (img_conf + vitals_conf) / 2
+
+    return np.clip(agreement * combined_conf, 0, 1)
+
+def triage_band_batch(score, cutoffs=TRIAGE_CUTOFFS):
+    """
+    Index into TRIAGE_BANDS for every score (0 = LOW ... 3 = CRITICAL).
+    Cutoffs may be arrays that broadcast against score.
+    """
+    score = np.asarray(score, dtype=np.float64)
+    band = np.zeros(np.broadcast_shapes(score.shape, *(np.shape(c) for c in cutoffs)), dtype=np.int8)
+    for cutoff in cutoffs:
+        band += score >= cutoff
+    return band
+
+def triage_level_batch(score, cutoffs=TRIAGE_CUTOFFS):
+    """Array version of triage_level: (band_index, labels, recommendations)."""
+    band = triage_band_batch(score, cutoffs)
+    labels = np.array([label for label, _ in TRIAGE_BANDS])
+    recommendations = np.array([rec for _, rec in TRIAGE_BANDS])
+    return band, labels[band], recommendations[band]
+
+# =========================================================
+# EQUIVALENCE CHECK
+# =========================================================
+def _check_probabilities(n, seed):
+    """Random probabilities plus every threshold boundary and its neighbours."""
+    rng = np.random.default_rng(seed)
+    edges = [0.0, 1.0, 0.5, 0.3, 0.7, 0.65, 0.35, 0.6, 0.8, 0.78]
+    edges = np.array(edges)
+    edges = np.concatenate([edges, np.nextafter(edges, 0), np.nextafter(edges, 1)])
+    edges = np.clip(edges, 0, 1)
+    grid_img, grid_vitals = np.meshgrid(edges, edges)
+    P_img = np.concatenate([rng.random(n), grid_img.ravel()])
+    P_vitals = np.concatenate([rng.random(n), grid_vitals.ravel()])
+    return P_img, P_vitals
+
+def check_against_scalar(n=100000, seed=0):
+    """
+    Asserts that every batch function matches its scalar counterpart
+    element for element. Returns the number of cases checked.
+    """
+    P_img, P_vitals = _check_probabilities(n, seed)
+
+    final, w_img, w_vitals, img_conf, gate = gated_fusion_batch(P_img, P_vitals)
+    trust = system_trust_score_batch(P_img, P_vitals)
+    _, labels, recommendations = triage_level_batch(final)
+
+    for i in range(len(P_img)):
+        p_img, p_vitals = float(P_img[i]), float(P_vitals[i])
+        expected = gated_fusion(p_img, p_vitals)
+        actual = (final[i], w_img[i], w_vitals[i], img_conf[i], gate[i])
+        assert tuple(expected) == tuple(actual), (p_img, p_vitals, expected, actual)
+        assert system_trust_score(p_img, p_vitals) == trust[i], (p_img, p_vitals)
+        assert triage_level(expected[0]) == (labels[i], recommendations[i]), (p_img, p_vitals)
+
+    return len(P_img)
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        checked = check_against_scalar()
+        print(f"✅ Batch fusion matches scalar fusion on {checked} cases")
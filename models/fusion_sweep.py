@@ -0,0 +1,287 @@
+"""
+Fusion-threshold sweep over a cached, labelled cohort.
+
+Step 1 runs the CNN and the vitals model once per case and caches the
+probabilities:
+
+    python models/fusion_sweep.py cache cohort.csv cohort_probs.npz
+
+cohort.csv needs a "label" column (1 = pneumonia), the vitals
+FEATURE_COLUMNS and either an "image_path" column or precomputed "P_img".
+
+Step 2 evaluates every combination of fusion parameters against the cache
+by broadcasting a (settings x cases) array, with no model inference:
+
+    python models/fusion_sweep.py sweep cohort_probs.npz sweep.csv \
+        --confidence-threshold 0.3 0.4 0.5 --w-img 0.5 0.6 0.7 \
+        --cap-vitals 0.6 0.65 0.7 --cutoffs 0.30,0.55,0.80 0.35,0.60,0.80
+
+Each output row holds one setting with its sensitivity, specificity and the
+label x triage-band confusion counts.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from fusion_logic import (
+    CONFIDENCE_THRESHOLD,
+    DEFAULT_WEIGHTS,
+    LOW_CONFIDENCE_WEIGHTS,
+    SAFETY_CAP_VITALS,
+    SAFETY_CAP_SCORE,
+    SAFETY_CAP_VALUE,
+    TRIAGE_CUTOFFS,
+    TRIAGE_BANDS,
+    fused_score_batch,
+    triage_band_batch
+)
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+FEATURE_COLUMNS = [
+    "Temperature_C", "Temperature_trend",
+    "SpO2_percent", "SpO2_trend",
+    "HeartRate_bpm", "HeartRate_trend",
+    "RespRate_bpm", "RespRate_trend",
+    "Cough", "Retractions"
+]
+
+VITALS_MODEL_PATH = os.path.join(os.path.dirname(__file__), "vitals_model.pkl")
+
+IMAGE_BATCH_SIZE = 32
+
+# Upper bound on settings x cases elements evaluated at once
+MAX_CHUNK_ELEMENTS = 4_000_000
+
+BAND_NAMES = [label for label, _ in TRIAGE_BANDS]
+
+# ----------------------------
+# CACHING
+# ----------------------------
+
+def vitals_probabilities(cohort):
+    """P_vitals for every row in one predict_proba call."""
+    import joblib
+
+    vitals_model = joblib.load(VITALS_MODEL_PATH)
+    return vitals_model.predict_proba(cohort[FEATURE_COLUMNS])[:, 1]
+
+def image_probabilities(image_paths, batch_size=IMAGE_BATCH_SIZE):
+    """P_img for every image, run through the CNN in batches."""
+    import xray_api
+
+    probs = []
+    for start in range(0, len(image_paths), batch_size):
+        batch = np.concatenate([
+            xray_api.preprocess_image(path)[0]
+            for path in image_paths[start:start + batch_size]
+        ])
+        probs.append(xray_api.model.predict(batch, verbose=0)[:, 0])
+    return np.concatenate(probs) if probs else np.zeros(0)
+
+def build_cache(manifest_path, cache_path):
+    """Runs both models once over the cohort and saves the probabilities."""
+    cohort = pd.read_csv(manifest_path)
+    if "label" not in cohort.columns:
+        raise ValueError("Cohort manifest needs a 'label' column")
+
+    if "P_img" in cohort.columns:
+        P_img = cohort["P_img"].to_numpy(dtype=np.float64)
+    elif "image_path" in cohort.columns:
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        paths = [
+            p if os.path.isabs(p) else os.path.join(base_dir, p)
+            for p in cohort["image_path"].astype(str)
+        ]
+        P_img = image_probabilities(paths)
+    else:
+        raise ValueError("Cohort manifest needs an 'image_path' or 'P_img' column")
+
+    P_vitals = vitals_probabilities(cohort)
+    case_ids = cohort["case_id"].astype(str).to_numpy() if "case_id" in cohort.columns \
+        else np.arange(len(cohort)).astype(str)
+
+    np.savez_compressed(
+        cache_path,
+        case_id=case_ids,
+        P_img=P_img,
+        P_vitals=P_vitals,
+        label=cohort["label"].to_numpy(dtype=np.int8)
+    )
+    return len(cohort)
+
+def load_cache(cache_path):
+    data = np.load(cache_path, allow_pickle=False)
+    return data["P_img"], data["P_vitals"], data["label"].astype(bool)
+
+# ----------------------------
+# PARAMETER GRID
+# ----------------------------
+
+def parameter_grid(
+    confidence_thresholds=(CONFIDENCE_THRESHOLD,),
+    w_imgs=(DEFAULT_WEIGHTS[0],),
+    low_conf_w_imgs=(LOW_CONFIDENCE_WEIGHTS[0],),
+    cap_vitals=(SAFETY_CAP_VITALS,),
+    cap_scores=(SAFETY_CAP_SCORE,),
+    cap_values=(SAFETY_CAP_VALUE,),
+    cutoffs=(TRIAGE_CUTOFFS,)
+):
+    """
+    Cartesian product of the parameter lists as a DataFrame, one row per
+    setting. Vitals weights are the complements of the imaging weights.
+    Combinations that cannot be valid are skipped: cutoffs out of order,
+    and a safety cap value above its cap score (the cap would raise scores).
+    """
+    rows = [
+        (ct, w, lw, cv, cs, cval, c[0], c[1], c[2])
+        for ct, w, lw, cv, cs, cval, c in itertools.product(
+            confidence_thresholds, w_imgs, low_conf_w_imgs,
+            cap_vitals, cap_scores, cap_values, cutoffs
+        )
+        if c[0] <= c[1] <= c[2] and cval <= cs
+    ]
+    return pd.DataFrame(rows, columns=[
+        "confidence_threshold", "w_img", "low_conf_w_img",
+        "cap_vitals", "cap_score", "cap_value",
+        "cutoff_moderate", "cutoff_high", "cutoff_critical"
+    ])
+
+# ----------------------------
+# SWEEP
+# ----------------------------
+
+def _column(grid, name):
+    return grid[name].to_numpy(dtype=np.float64)[:, np.newaxis]
+
+def evaluate_grid(P_img, P_vitals, label, grid, positive_band=1):
+    """
+    Scores every setting in grid against the cohort. A case counts as
+    positive when its triage band index is >= positive_band.
+    """
+    P_img = P_img[np.newaxis, :]
+    P_vitals = P_vitals[np.newaxis, :]
+    label = label[np.newaxis, :]
+    positives = max(int(label.sum()), 1)
+    negatives = max(int((~label).sum()), 1)
+
+    chunk = max(1, MAX_CHUNK_ELEMENTS // max(P_img.shape[1], 1))
+    results = []
+
+    for start in range(0, len(grid), chunk):
+        part = grid.iloc[start:start + chunk]
+        w_img = _column(part, "w_img")
+        low_w_img = _column(part, "low_conf_w_img")
+
+        final_score = fused_score_batch(
+            P_img,
+            P_vitals,
+            confidence_threshold=_column(part, "confidence_threshold"),
+            weights=(w_img, 1 - w_img),
+            low_confidence_weights=(low_w_img, 1 - low_w_img),
+            cap_vitals=_column(part, "cap_vitals"),
+            cap_score=_column(part, "cap_score"),
+            cap_value=_column(part, "cap_value")
+        )[0]
+        band = triage_band_batch(final_score, (
+            _column(part, "cutoff_moderate"),
+            _column(part, "cutoff_high"),
+            _column(part, "cutoff_critical")
+        ))
+
+        predicted = band >= positive_band
+        tp = (predicted & label).sum(axis=1)
+        tn = (~predicted & ~label).sum(axis=1)
+
+        metrics = {
+            "sensitivity": tp / positives,
+            "specificity": tn / negatives,
+        }
+        metrics["youden_j"] = metrics["sensitivity"] + metrics["specificity"] - 1
+        for index, name in enumerate(BAND_NAMES):
+            in_band = band == index
+            key = name.lower().replace(" ", "_")
+            metrics[f"pos_{key}"] = (in_band & label).sum(axis=1)
+            metrics[f"neg_{key}"] = (in_band & ~label).sum(axis=1)
+
+        results.append(pd.DataFrame(metrics, index=part.index))
+
+    return pd.concat([grid, pd.concat(results)], axis=1)
+
+# ----------------------------
+# MAIN
+# ----------------------------
+
+def _cutoff_triple(text):
+    values = tuple(float(v) for v in text.split(","))
+    if len(values) != 3:
+        raise argparse.ArgumentTypeError("cutoffs are three comma-separated numbers")
+    return values
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep gated-fusion parameters over a cached cohort")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cache_cmd = sub.add_parser("cache", help="Run the models once and cache P_img / P_vitals")
+    cache_cmd.add_argument("manifest")
+    cache_cmd.add_argument("cache")
+
+    sweep_cmd = sub.add_parser("sweep", help="Evaluate a parameter grid against a cache")
+    sweep_cmd.add_argument("cache")
+    sweep_cmd.add_argument("output", help="CSV with one row per setting")
+    sweep_cmd.add_argument("--confidence-threshold", type=float, nargs="+", default=[CONFIDENCE_THRESHOLD])
+    sweep_cmd.add_argument("--w-img", type=float, nargs="+", default=[DEFAULT_WEIGHTS[0]],
+                           help="Imaging weight when imaging confidence is high")
+    sweep_cmd.add_argument("--low-conf-w-img", type=float, nargs="+", default=[LOW_CONFIDENCE_WEIGHTS[0]],
+                           help="Imaging weight when imaging confidence is low")
+    sweep_cmd.add_argument("--cap-vitals", type=float, nargs="+", default=[SAFETY_CAP_VITALS])
+    sweep_cmd.add_argument("--cap-score", type=float, nargs="+", default=[SAFETY_CAP_SCORE])
+    sweep_cmd.add_argument("--cap-value", type=float, nargs="+", default=[SAFETY_CAP_VALUE])
+    sweep_cmd.add_argument("--cutoffs", type=_cutoff_triple, nargs="+", default=[TRIAGE_CUTOFFS],
+                           help="Triage cutoffs as moderate,high,critical")
+    sweep_cmd.add_argument("--positive-band", choices=BAND_NAMES, default="MODERATE RISK",
+                           help="Lowest triage band counted as a positive call")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "cache":
+            started = time.perf_counter()
+            cases = build_cache(args.manifest, args.cache)
+            print(json.dumps({
+                "cases": cases,
+                "cache": args.cache,
+                "elapsed_seconds": round(time.perf_counter() - started, 3)
+            }))
+        else:
+            P_img, P_vitals, label = load_cache(args.cache)
+            grid = parameter_grid(
+                args.confidence_threshold, args.w_img, args.low_conf_w_img,
+                args.cap_vitals, args.cap_score, args.cap_value, args.cutoffs
+            )
+
+            started = time.perf_counter()
+            results = evaluate_grid(P_img, P_vitals, label, grid, BAND_NAMES.index(args.positive_band))
+            elapsed = time.perf_counter() - started
+
+            results.to_csv(args.output, index=False)
+            best = results.sort_values("youden_j", ascending=False).head(1)
+            print(json.dumps({
+                "cases": int(len(label)),
+                "settings": int(len(grid)),
+                "elapsed_seconds": round(elapsed, 3),
+                "output": args.output,
+                "best_setting": best.to_dict(orient="records")[0] if len(best) else None
+            }, default=float))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
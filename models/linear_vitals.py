@@ -0,0 +1,84 @@
+"""
+Closed-form view of the vitals pipeline (StandardScaler + LogisticRegression).
+
+The SHAP LinearExplainer used by vitals_api.py has an all-zeros background
+in scaled space, so its SHAP value for feature i is simply
+coef_i * x_scaled_i and its expected value is the intercept. Working with
+the fitted arrays directly lets batch and incremental paths score many
+rows with plain NumPy instead of going through DataFrames and SHAP.
+"""
+import os
+import numpy as np
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+FEATURE_COLUMNS = [
+    "Temperature_C", "Temperature_trend",
+    "SpO2_percent", "SpO2_trend",
+    "HeartRate_bpm", "HeartRate_trend",
+    "RespRate_bpm", "RespRate_trend",
+    "Cough", "Retractions"
+]
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "vitals_model.pkl")
+
+# ----------------------------
+# MODEL
+# ----------------------------
+
+def sigmoid(logit):
+    # Clipped so np.exp never overflows; the probability saturates at 0/1 well before +-500
+    return 1.0 / (1.0 + np.exp(-np.clip(logit, -500.0, 500.0)))
+
+class LinearVitalsModel:
+    """Scaler means/scales and classifier weights of the vitals pipeline as arrays."""
+
+    def __init__(self, mean, scale, coef, intercept, feature_columns=FEATURE_COLUMNS):
+        self.feature_columns = list(feature_columns)
+        self.index = {name: i for i, name in enumerate(self.feature_columns)}
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0])
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        return cls.from_components(pipeline.named_steps["scaler"], pipeline.named_steps["clf"])
+
+    @classmethod
+    def from_components(cls, scaler, clf):
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones_like(scaler.mean_)
+        return cls(scaler.mean_, scale, clf.coef_, clf.intercept_)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        import joblib
+
+        return cls.from_pipeline(joblib.load(path))
+
+    @property
+    def expected_value(self):
+        """LinearExplainer expected value for the zero background."""
+        return self.intercept
+
+    def matrix(self, vitals_dicts):
+        """(n, features) array from a list of vitals dicts."""
+        return np.array(
+            [[v[col] for col in self.feature_columns] for v in vitals_dicts],
+            dtype=np.float64
+        ).reshape(-1, len(self.feature_columns))
+
+    def scale_features(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+
+    def contributions(self, X_scaled):
+        """Per-feature SHAP values (log-odds), identical to the LinearExplainer output."""
+        return X_scaled * self.coef
+
+    def logit(self, X):
+        return self.scale_features(X) @ self.coef + self.intercept
+
+    def probability(self, X):
+        return sigmoid(self.logit(X))
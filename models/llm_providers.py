@@ -0,0 +1,219 @@
+"""
+Completion providers for the report pipeline.
+
+report_generator.py talks to the LLM only through get_provider(), so the
+backend can be switched with environment variables:
+
+    LLM_PROVIDER=groq            (default) Groq API, needs GROQ_API_KEY
+    LLM_PROVIDER=openai          any OpenAI-compatible server, e.g. the
+                                 local stand-in in mock_llm_server.py
+    LLM_BASE_URL=http://127.0.0.1:8008
+    LLM_MODEL=llama-3.1-8b-instant
+"""
+import os
+import abc
+import json
+import time
+import urllib.request
+import urllib.error
+from email.utils import parsedate_to_datetime
+
+from tracing import current_traceparent
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+DEFAULT_TEMPERATURE = 0.25
+DEFAULT_TIMEOUT_SECONDS = 60
+
+# ----------------------------
+# ERRORS
+# ----------------------------
+
+class ProviderError(Exception):
+    """HTTP-level failure from a provider, with enough detail to decide on a retry."""
+
+    def __init__(self, message, status_code=None, retry_after=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        # Set for failures without a status, e.g. refused connections and DNS errors
+        self.retryable = retryable
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header: delta-seconds or an HTTP date; None if absent or malformed."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+# ----------------------------
+# PROVIDERS
+# ----------------------------
+
+class CompletionProvider(abc.ABC):
+    """
+    Interface every provider implements.
+    complete() returns the full text, stream() yields it in chunks.
+    """
+
+    name = "base"
+
+    def __init__(self, model=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE):
+        self.model = model
+        self.temperature = temperature
+
+    def complete(self, messages, max_tokens):
+        return "".join(self.stream(messages, max_tokens)).strip()
+
+    @abc.abstractmethod
+    def stream(self, messages, max_tokens):
+        """Yields the completion text in chunks."""
+
+class GroqProvider(CompletionProvider):
+    """Groq chat completions. The client is created once and reused."""
+
+    name = "groq"
+
+    def __init__(self, api_key=None, base_url=None, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.base_url = base_url
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if not self.api_key:
+                raise RuntimeError("GROQ_API_KEY is not set")
+
+            from groq import Groq
+
+            kwargs = {"api_key": self.api_key}
+            if self.base_url:
+                kwargs["base_url"] = self.base_url
+            self._client = Groq(**kwargs)
+        return self._client
+
+    def complete(self, messages, max_tokens):
+        response = self._get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+
+    def stream(self, messages, max_tokens):
+        chunks = self._get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        for chunk in chunks:
+            text = chunk.choices[0].delta.content
+            if text:
+                yield text
+
+class OpenAICompatibleProvider(CompletionProvider):
+    """
+    Plain-HTTP client for OpenAI-compatible /v1/chat/completions servers.
+    Uses only the standard library so it works on air-gapped hosts.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url, api_key=None, timeout=DEFAULT_TIMEOUT_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.url = base_url.rstrip("/") + "/v1/chat/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _post(self, messages, max_tokens, stream):
+        body = json.dumps({
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": max_tokens,
+            "stream": stream
+        }).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        # Lets an instrumented LLM server join the caller's trace
+        traceparent = current_traceparent()
+        if traceparent:
+            headers["traceparent"] = traceparent
+
+        req = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        try:
+            return urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise ProviderError(
+                f"{self.url} returned {e.code}",
+                status_code=e.code,
+                retry_after=parse_retry_after(e.headers.get("Retry-After"))
+            )
+        except (urllib.error.URLError, OSError) as e:
+            # Refused connections, DNS failures and connect timeouts are transient
+            reason = getattr(e, "reason", e)
+            raise ProviderError(f"{self.url} unreachable: {reason}", retryable=True)
+
+    def complete(self, messages, max_tokens):
+        with self._post(messages, max_tokens, stream=False) as response:
+            payload = json.loads(response.read())
+        return payload["choices"][0]["message"]["content"].strip()
+
+    def stream(self, messages, max_tokens):
+        with self._post(messages, max_tokens, stream=True) as response:
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["delta"].get("content")
+                if text:
+                    yield text
+
+# ----------------------------
+# PROVIDER SELECTION
+# ----------------------------
+
+_provider = None
+
+def provider_from_env():
+    """Builds the provider described by the LLM_* environment variables."""
+    kind = os.getenv("LLM_PROVIDER", "groq").lower()
+    model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    base_url = os.getenv("LLM_BASE_URL")
+
+    if kind == "groq":
+        return GroqProvider(base_url=base_url, model=model)
+    if kind in ("openai", "local", "mock"):
+        if not base_url:
+            raise RuntimeError(f"LLM_BASE_URL is required for LLM_PROVIDER={kind}")
+        return OpenAICompatibleProvider(base_url, api_key=os.getenv("LLM_API_KEY"), model=model)
+    raise RuntimeError(f"Unknown LLM_PROVIDER: {kind}")
+
+def get_provider():
+    """Process-wide provider, created from the environment on first use."""
+    global _provider
+    if _provider is None:
+        _provider = provider_from_env()
+    return _provider
+
+def set_provider(provider):
+    """Overrides the process-wide provider (benchmarks, tests, embedding apps)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,305 @@
+"""
+Load testing and capacity curves.
+
+Replays a weighted mix of vitals, X-ray and report requests against a
+running api/app.py and/or the Next.js routes, sweeping the number of
+concurrent clients. Each level is a closed loop: every client sends its
+next request as soon as the previous one returns. The report holds
+throughput and p50/p95/p99 latency per level and scenario, plus the
+saturation point, as JSON:
+
+    python models/load_test.py --flask http://localhost:5000 --next http://localhost:3000 \
+        --xray-image sample.jpeg --concurrency 1 2 4 8 16 --duration 20 --output capacity.json
+
+Report requests go through the Next route, which spawns report_generator.py
+with the Next server's environment. To keep the real LLM out of the test,
+start Next pointed at the stand-in this script serves:
+
+    LLM_PROVIDER=openai LLM_BASE_URL=http://127.0.0.1:8008 npm run dev
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+from bench_reports import synthetic_report_inputs
+from latency_stats import latency_summary
+from mock_llm_server import DEFAULT_PORT, config_arguments, config_from_args, serve_in_thread
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_CONCURRENCY = (1, 2, 4, 8, 16, 32)
+DEFAULT_DURATION_SECONDS = 15.0
+DEFAULT_WARMUP_SECONDS = 2.0
+DEFAULT_TIMEOUT_SECONDS = 120.0
+DEFAULT_MIX = "predict=0.5,analyze_vitals=0.3,analyze_xray=0.1,generate_report=0.1"
+
+# A level is saturated once adding clients buys less than this much throughput...
+SATURATION_MIN_GAIN = 0.10
+# ...while p95 latency grows by more than this, or errors exceed this fraction
+SATURATION_LATENCY_GROWTH = 0.50
+SATURATION_ERROR_RATE = 0.01
+
+AGE_GROUPS = ["infant", "toddler", "preschool", "child"]
+
+# ----------------------------
+# REQUEST BUILDERS
+# ----------------------------
+
+def random_vitals(rng):
+    """Simulator-like vitals rounded to the slider steps."""
+    sick = rng.random() < 0.4
+    return {
+        "Temperature_C": round(rng.gauss(38.4 if sick else 37.0, 0.5), 1),
+        "Temperature_trend": round(rng.gauss(0.3 if sick else 0.0, 0.2), 1),
+        "SpO2_percent": round(rng.gauss(92 if sick else 98, 2)),
+        "SpO2_trend": round(rng.gauss(-1 if sick else 0, 0.5), 1),
+        "HeartRate_bpm": round(rng.gauss(140 if sick else 110, 12)),
+        "HeartRate_trend": round(rng.gauss(2 if sick else 0, 1)),
+        "RespRate_bpm": round(rng.gauss(42 if sick else 28, 5)),
+        "RespRate_trend": round(rng.gauss(1 if sick else 0, 0.5)),
+        "Cough": int(rng.random() < (0.8 if sick else 0.2)),
+        "Retractions": int(rng.random() < (0.6 if sick else 0.05))
+    }
+
+def json_request(url, payload):
+    return urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+
+def multipart_request(url, field, filename, content, content_type="image/jpeg"):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return urllib.request.Request(
+        url,
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        method="POST"
+    )
+
+class Scenarios:
+    """Builds one request of each kind; vitals repeat with duplicate_fraction, like frontend re-renders."""
+
+    def __init__(self, flask_url=None, next_url=None, xray_image=None, duplicate_fraction=0.2, seed=0):
+        self.flask_url = flask_url.rstrip("/") if flask_url else None
+        self.next_url = next_url.rstrip("/") if next_url else None
+        self.duplicate_fraction = duplicate_fraction
+        self.seed = seed
+        self.image = None
+        if xray_image:
+            with open(xray_image, "rb") as f:
+                self.image = (xray_image.replace("\\", "/").rsplit("/", 1)[-1], f.read())
+        self.reports = synthetic_report_inputs(200, seed=seed, duplicate_fraction=duplicate_fraction)
+        for report in self.reports:
+            report.pop("id", None)
+            report["vitals_probability"] = max(report["vitals_probability"], 0.001)
+
+    def available(self):
+        names = []
+        if self.flask_url:
+            names.append("predict")
+        if self.next_url:
+            names += ["analyze_vitals", "generate_report"]
+            if self.image:
+                names.append("analyze_xray")
+        return names
+
+    def _vitals(self, rng, recent):
+        if recent and rng.random() < self.duplicate_fraction:
+            return rng.choice(recent)
+        vitals = random_vitals(rng)
+        recent.append(vitals)
+        del recent[:-50]
+        return vitals
+
+    def build(self, name, rng, recent):
+        if name == "predict":
+            vitals = self._vitals(rng, recent)
+            return json_request(f"{self.flask_url}/predict", {"vitals": vitals, "age_group": rng.choice(AGE_GROUPS)})
+        if name == "analyze_vitals":
+            v = self._vitals(rng, recent)
+            payload = {
+                "vitals": {
+                    "temp": v["Temperature_C"], "tempTrend": v["Temperature_trend"],
+                    "spo2": v["SpO2_percent"], "spo2Trend": v["SpO2_trend"],
+                    "hr": v["HeartRate_bpm"], "hrTrend": v["HeartRate_trend"],
+                    "rr": v["RespRate_bpm"], "rrTrend": v["RespRate_trend"],
+                    "cough": v["Cough"], "retractions": v["Retractions"]
+                },
+                "ageGroup": rng.choice(AGE_GROUPS)
+            }
+            return json_request(f"{self.next_url}/api/analyze-vitals", payload)
+        if name == "generate_report":
+            return json_request(f"{self.next_url}/api/generate-report", rng.choice(self.reports))
+        if name == "analyze_xray":
+            filename, content = self.image
+            return multipart_request(f"{self.next_url}/api/analyze-xray", "file", filename, content)
+        raise ValueError(f"Unknown scenario: {name}")
+
+def parse_mix(text, available):
+    """'predict=0.5,analyze_vitals=0.3' -> weights, restricted to the reachable scenarios."""
+    weights = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    weights = {name: w for name, w in weights.items() if name in available and w > 0}
+    if not weights:
+        raise ValueError(f"No reachable scenario in the mix; available: {', '.join(available) or 'none'}")
+    return weights
+
+# ----------------------------
+# LOAD LEVELS
+# ----------------------------
+
+def send(request, timeout):
+    """(ok, status, seconds) for one request."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return True, response.status, time.perf_counter() - started
+    except urllib.error.HTTPError as e:
+        e.read()
+        return False, e.code, time.perf_counter() - started
+    except (urllib.error.URLError, OSError):
+        return False, None, time.perf_counter() - started
+
+def run_level(scenarios, weights, concurrency, duration, warmup, timeout, seed=0):
+    """Runs `concurrency` closed-loop clients; samples taken during warmup are discarded."""
+    names, probs = list(weights), list(weights.values())
+    samples = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client(index):
+        rng = random.Random(seed * 100003 + concurrency * 1009 + index)
+        recent = []
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, probs)[0]
+            sent_at = time.perf_counter()
+            ok, status, seconds = send(scenarios.build(name, rng, recent), timeout)
+            if sent_at >= measure_from:
+                with lock:
+                    samples.append((name, ok, status, seconds))
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    measured = max(time.perf_counter() - measure_from, 1e-9)
+
+    def summarize(rows):
+        ok = [s for _, good, _, s in rows if good]
+        statuses = {}
+        for _, good, status, _ in rows:
+            if not good:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4) if rows else None,
+            "error_statuses": statuses,
+            "throughput_rps": round(len(ok) / measured, 2),
+            "latency": latency_summary(ok)
+        }
+
+    level = {"concurrency": concurrency, "seconds": round(measured, 2), **summarize(samples)}
+    level["scenarios"] = {name: summarize([r for r in samples if r[0] == name]) for name in names}
+    return level
+
+def find_saturation(levels):
+    """First level where more clients stop buying throughput, latency climbs or errors appear."""
+    previous = None
+    for level in levels:
+        if level["error_rate"] and level["error_rate"] > SATURATION_ERROR_RATE:
+            return {"concurrency": level["concurrency"], "reason": "error rate"}
+        if previous and previous["throughput_rps"] and previous["latency"]["p95_ms"]:
+            gain = level["throughput_rps"] / previous["throughput_rps"] - 1.0
+            p95 = level["latency"]["p95_ms"] or 0.0
+            growth = p95 / previous["latency"]["p95_ms"] - 1.0
+            if gain < SATURATION_MIN_GAIN and growth > SATURATION_LATENCY_GROWTH:
+                return {"concurrency": previous["concurrency"], "reason": "throughput plateau with rising latency"}
+        previous = level
+    return None
+
+def run_sweep(scenarios, weights, concurrency_levels, duration, warmup, timeout, seed=0, progress=sys.stderr):
+    levels = []
+    for concurrency in concurrency_levels:
+        level = run_level(scenarios, weights, concurrency, duration, warmup, timeout, seed)
+        levels.append(level)
+        if progress:
+            print(
+                f"c={concurrency:<4} {level['throughput_rps']:>9.2f} req/s  "
+                f"p50={level['latency']['p50_ms']}ms p95={level['latency']['p95_ms']}ms "
+                f"p99={level['latency']['p99_ms']}ms errors={level['errors']}",
+                file=progress
+            )
+
+    peak = max(levels, key=lambda l: l["throughput_rps"]) if levels else None
+    return {
+        "mix": weights,
+        "duration_seconds": duration,
+        "warmup_seconds": warmup,
+        "levels": levels,
+        "peak": {"concurrency": peak["concurrency"], "throughput_rps": peak["throughput_rps"]} if peak else None,
+        "saturation": find_saturation(levels)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capacity curves for the Flask API and Next routes")
+    parser.add_argument("--flask", help="Base URL of api/app.py, e.g. http://localhost:5000")
+    parser.add_argument("--next", help="Base URL of the Next.js app, e.g. http://localhost:3000")
+    parser.add_argument("--xray-image", help="Image uploaded by the analyze_xray scenario")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. predict=0.7,generate_report=0.3")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY))
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP_SECONDS)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS)
+    parser.add_argument("--duplicate-fraction", type=float, default=0.2,
+                        help="Share of vitals payloads repeating a recent one")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--mock-llm-port", type=int, default=DEFAULT_PORT,
+                        help="Port for the LLM stand-in (0 = don't start it)")
+    config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    try:
+        if args.mock_llm_port:
+            server, base_url = serve_in_thread(config_from_args(args), port=args.mock_llm_port)
+            print(f"LLM stand-in at {base_url} (start Next with LLM_PROVIDER=openai LLM_BASE_URL={base_url})",
+                  file=sys.stderr)
+
+        scenarios = Scenarios(args.flask, args.next, args.xray_image, args.duplicate_fraction, args.seed or 0)
+        weights = parse_mix(args.mix, scenarios.available())
+        report = run_sweep(scenarios, weights, args.concurrency, args.duration, args.warmup, args.timeout, args.seed or 0)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
+    finally:
+        if server is not None:
+            server.shutdown()
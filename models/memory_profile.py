@@ -0,0 +1,329 @@
+"""
+Opt-in memory profiling for the X-ray path.
+
+With MEMORY_PROFILE=1, every stage_timing stage also records memory:
+the peak and retained Python allocations (tracemalloc) between entering
+and leaving the stage, and the change in process RSS. RSS is what shows
+TensorFlow and OpenCV buffers, which tracemalloc cannot see. The
+per-stage figures are added to /metrics next to the stage timers, and
+to the xray_api JSON output as stage_memory when STAGE_TIMING_REPORT=1.
+
+The soak command scores N images in one process and reports RSS growth
+per image, the allocation sites that grew, and how many workers fit in a
+memory budget:
+
+    python models/memory_profile.py soak chest_xray/test --images 500 --memory-budget-gb 14
+
+tracemalloc slows allocation-heavy code noticeably, so leave it off in
+normal serving. MEMORY_PROFILE_FRAMES sets the traceback depth (default 1).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import tracemalloc
+
+import stage_timing
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+ENABLED = os.environ.get("MEMORY_PROFILE") == "1"
+TRACEBACK_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", "1"))
+
+DEFAULT_SOAK_IMAGES = 200
+DEFAULT_WARMUP_IMAGES = 10
+DEFAULT_SAMPLE_EVERY = 10
+DEFAULT_TOP_SITES = 15
+# Fraction of a worker's peak RSS kept free when sizing workers per host
+SIZING_HEADROOM = 0.2
+
+MB = 1024 * 1024
+
+# ----------------------------
+# RSS
+# ----------------------------
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_bytes():
+    """Current resident set size; falls back to peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# ----------------------------
+# PER-STAGE MEMORY
+# ----------------------------
+
+class StageMemory:
+    __slots__ = ("count", "peak_max", "peak_sum", "retained_sum", "rss_delta_sum", "rss_delta_max")
+
+    def __init__(self):
+        self.count = 0
+        self.peak_max = 0
+        self.peak_sum = 0
+        self.retained_sum = 0
+        self.rss_delta_sum = 0
+        self.rss_delta_max = 0
+
+    def observe(self, peak, retained, rss_delta):
+        self.count += 1
+        self.peak_max = max(self.peak_max, peak)
+        self.peak_sum += peak
+        self.retained_sum += retained
+        self.rss_delta_sum += rss_delta
+        self.rss_delta_max = max(self.rss_delta_max, rss_delta)
+
+    def summary(self):
+        n = max(self.count, 1)
+        return {
+            "count": self.count,
+            "peak_mb_max": round(self.peak_max / MB, 3),
+            "peak_mb_mean": round(self.peak_sum / n / MB, 3),
+            "retained_mb_total": round(self.retained_sum / MB, 3),
+            "rss_delta_mb_total": round(self.rss_delta_sum / MB, 3),
+            "rss_delta_mb_max": round(self.rss_delta_max / MB, 3)
+        }
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+class _MemoryStage(stage_timing._Stage):
+    """stage_timing stage that also records tracemalloc peak/retained bytes and RSS change."""
+    __slots__ = ("traced_start", "rss_start", "child_peak")
+
+    def __enter__(self):
+        self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.rss_start = rss_bytes()
+        self.child_peak = 0
+        # The peak counter is global: keep the enclosing stage's peak so far before
+        # resetting it, and nested stages pass their peak up the stack on exit
+        stack = _stack()
+        if stack:
+            stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stack.append(self)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        current, peak = tracemalloc.get_traced_memory()
+        rss_delta = rss_bytes() - self.rss_start
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        peak_bytes = max(peak, self.child_peak) - self.traced_start
+        if stack:
+            stack[-1].child_peak = max(stack[-1].child_peak, max(peak, self.child_peak))
+        with _lock:
+            stats = _stats.get((self.component, self.name))
+            if stats is None:
+                stats = _stats[(self.component, self.name)] = StageMemory()
+            stats.observe(max(peak_bytes, 0), current - self.traced_start, rss_delta)
+        return False
+
+def enable(frames=TRACEBACK_FRAMES):
+    """Starts tracemalloc and makes every stage_timing stage record memory."""
+    global ENABLED
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    stage_timing.set_stage_class(_MemoryStage)
+    ENABLED = True
+
+def stage_memory():
+    """{component.stage: summary} for every stage seen so far."""
+    with _lock:
+        return {f"{c}.{n}": s.summary() for (c, n), s in sorted(_stats.items())}
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+if ENABLED:
+    enable()
+
+# ----------------------------
+# EXPOSITION
+# ----------------------------
+
+def render_prometheus():
+    """Per-stage memory gauges and process memory in Prometheus text format ("" when disabled)."""
+    if not ENABLED:
+        return ""
+    with _lock:
+        snapshot = sorted((key, s.peak_max, s.retained_sum, s.rss_delta_sum) for key, s in _stats.items())
+    traced, traced_peak = tracemalloc.get_traced_memory()
+
+    lines = [
+        "# HELP pipeline_stage_peak_bytes Largest tracemalloc peak above the stage's starting allocation.",
+        "# TYPE pipeline_stage_peak_bytes gauge"
+    ]
+    lines += [f'pipeline_stage_peak_bytes{{component="{c}",stage="{n}"}} {peak}' for (c, n), peak, _, _ in snapshot]
+    lines += [
+        "# HELP pipeline_stage_retained_bytes_total Python allocations still live when the stage ended.",
+        "# TYPE pipeline_stage_retained_bytes_total counter"
+    ]
+    lines += [f'pipeline_stage_retained_bytes_total{{component="{c}",stage="{n}"}} {kept}' for (c, n), _, kept, _ in snapshot]
+    lines += [
+        "# HELP pipeline_stage_rss_delta_bytes_total Change in resident set size across the stage.",
+        "# TYPE pipeline_stage_rss_delta_bytes_total counter"
+    ]
+    lines += [f'pipeline_stage_rss_delta_bytes_total{{component="{c}",stage="{n}"}} {rss}' for (c, n), _, _, rss in snapshot]
+    lines += [
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {rss_bytes()}",
+        "# TYPE python_traced_memory_bytes gauge",
+        f"python_traced_memory_bytes {traced}",
+        "# TYPE python_traced_memory_peak_bytes gauge",
+        f"python_traced_memory_peak_bytes {traced_peak}"
+    ]
+    return "\n".join(lines) + "\n"
+
+# ----------------------------
+# SOAK TEST
+# ----------------------------
+
+def growth_per_image(samples):
+    """Least-squares slope of RSS against images processed, in bytes per image."""
+    if len(samples) < 2:
+        return 0.0
+    xs = [s["images"] for s in samples]
+    ys = [s["rss_bytes"] for s in samples]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+def top_growth_sites(before, after, limit=DEFAULT_TOP_SITES):
+    """Allocation sites (file:line) whose live size grew the most between two snapshots."""
+    # The profiler's own bookkeeping is not interesting
+    own = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    before, after = before.filter_traces(own), after.filter_traces(own)
+    sites = []
+    for stat in after.compare_to(before, "lineno")[:limit]:
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        sites.append({
+            "site": f"{frame.filename}:{frame.lineno}",
+            "growth_mb": round(stat.size_diff / MB, 3),
+            "blocks": stat.count_diff
+        })
+    return sites
+
+def workers_for_budget(budget_bytes, worker_peak_bytes, headroom=SIZING_HEADROOM):
+    if not budget_bytes or worker_peak_bytes <= 0:
+        return None
+    return max(int(budget_bytes // (worker_peak_bytes * (1.0 + headroom))), 0)
+
+def soak(paths, images=DEFAULT_SOAK_IMAGES, warmup=DEFAULT_WARMUP_IMAGES,
+         sample_every=DEFAULT_SAMPLE_EVERY, memory_budget_bytes=None, top_sites=DEFAULT_TOP_SITES):
+    """
+    Runs xray_api.process_xray over `images` images (cycling through paths)
+    in this process and reports memory growth after `warmup` images.
+    """
+    if not paths:
+        raise ValueError("No images to soak with")
+    enable()
+    rss_before_load = rss_bytes()
+    import xray_api    # loads the model inside the profiled process
+
+    rss_after_load = rss_bytes()
+    samples, failures = [], 0
+    baseline = None
+    started = time.perf_counter()
+    for i in range(warmup + images):
+        if i == warmup:
+            reset()
+            baseline = tracemalloc.take_snapshot()
+            samples.append({"images": 0, "rss_bytes": rss_bytes(), "traced_bytes": tracemalloc.get_traced_memory()[0]})
+            started = time.perf_counter()
+        try:
+            xray_api.process_xray(paths[i % len(paths)])
+        except Exception:
+            failures += 1
+        done = i + 1 - warmup
+        if done > 0 and (done % sample_every == 0 or done == images):
+            samples.append({"images": done, "rss_bytes": rss_bytes(), "traced_bytes": tracemalloc.get_traced_memory()[0]})
+    elapsed = time.perf_counter() - started
+    final = tracemalloc.take_snapshot()
+
+    slope = growth_per_image(samples)
+    worker_peak = peak_rss_bytes()
+    first, last = samples[0], samples[-1]
+    return {
+        "images": images,
+        "warmup_images": warmup,
+        "distinct_images": len(paths),
+        "failures": failures,
+        "images_per_second": round(images / elapsed, 2) if elapsed else None,
+        "rss_mb": {
+            "before_model_load": round(rss_before_load / MB, 1),
+            "after_model_load": round(rss_after_load / MB, 1),
+            "after_warmup": round(first["rss_bytes"] / MB, 1),
+            "final": round(last["rss_bytes"] / MB, 1),
+            "peak": round(worker_peak / MB, 1)
+        },
+        "rss_growth_mb": round((last["rss_bytes"] - first["rss_bytes"]) / MB, 2),
+        "rss_growth_kb_per_image": round(slope / 1024, 2),
+        "traced_growth_mb": round((last["traced_bytes"] - first["traced_bytes"]) / MB, 2),
+        "projected_rss_mb_per_1000_images": round(slope * 1000 / MB, 1),
+        "workers_for_budget": workers_for_budget(memory_budget_bytes, worker_peak),
+        "stage_memory": stage_memory(),
+        "top_growth_sites": top_growth_sites(baseline, final, top_sites),
+        "samples": [
+            {"images": s["images"], "rss_mb": round(s["rss_bytes"] / MB, 2), "traced_mb": round(s["traced_bytes"] / MB, 2)}
+            for s in samples
+        ]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory soak test for the X-ray worker")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("soak", help="Score N images in one process and report memory growth")
+    run.add_argument("source", help="Image directory, CSV manifest or text file of paths")
+    run.add_argument("--images", type=int, default=DEFAULT_SOAK_IMAGES)
+    run.add_argument("--warmup", type=int, default=DEFAULT_WARMUP_IMAGES)
+    run.add_argument("--sample-every", type=int, default=DEFAULT_SAMPLE_EVERY)
+    run.add_argument("--memory-budget-gb", type=float, default=None,
+                     help="Host memory for X-ray workers; reports how many fit")
+    run.add_argument("--top-sites", type=int, default=DEFAULT_TOP_SITES)
+    run.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        from bulk_xray import find_images
+        report = soak(
+            find_images(args.source),
+            images=args.images,
+            warmup=args.warmup,
+            sample_every=max(args.sample_every, 1),
+            memory_budget_bytes=int(args.memory_budget_gb * 1024 ** 3) if args.memory_budget_gb else None,
+            top_sites=args.top_sites
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
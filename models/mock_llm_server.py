@@ -0,0 +1,259 @@
+"""
+Local stand-in for the LLM API.
+
+Serves an OpenAI-compatible /v1/chat/completions endpoint (also reachable
+under /openai/v1/ so the Groq SDK can point at it with base_url) with
+configurable latency, error rates and streaming speed:
+
+    python models/mock_llm_server.py --port 8008 --latency lognormal \
+        --latency-ms 400 --jitter-ms 150 --error-rate 0.02 --rate-limit-rate 0.05
+
+    LLM_PROVIDER=openai LLM_BASE_URL=http://127.0.0.1:8008 python models/report_generator.py input.json
+
+Responses are deterministic for a given prompt so cached and uncached runs
+produce identical reports.
+"""
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_PORT = 8008
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+class MockConfig:
+    """Behaviour of the mock server; every field can be set from the command line."""
+
+    def __init__(
+        self,
+        latency="fixed",
+        latency_ms=300.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        retry_after_seconds=1.0,
+        tokens_per_second=200.0,
+        seed=None
+    ):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency must be one of {LATENCY_DISTRIBUTIONS}")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.tokens_per_second = tokens_per_second
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        """Seconds until the first token, drawn from the configured distribution."""
+        mean = self.latency_ms / 1000.0
+        jitter = self.jitter_ms / 1000.0
+        with self._lock:
+            if self.latency == "fixed":
+                value = mean
+            elif self.latency == "uniform":
+                value = self._rng.uniform(mean - jitter, mean + jitter)
+            elif self.latency == "normal":
+                value = self._rng.gauss(mean, jitter)
+            elif self.latency == "lognormal":
+                # Parameterised so the distribution has the requested mean and standard deviation
+                variance = jitter ** 2
+                sigma2 = math.log(1 + variance / (mean ** 2)) if mean > 0 else 0.0
+                mu = math.log(mean) - sigma2 / 2 if mean > 0 else 0.0
+                value = self._rng.lognormvariate(mu, math.sqrt(sigma2))
+            else:
+                value = self._rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        return max(value, 0.0)
+
+    def sample_failure(self):
+        """Returns 429, 500 or None for this request."""
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+# ----------------------------
+# RESPONSE CONTENT
+# ----------------------------
+
+def mock_completion_text(messages, max_tokens):
+    """Deterministic pseudo-summary whose length tracks max_tokens."""
+    prompt = "".join(m.get("content", "") for m in messages)
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    words = ["Clinical", "Impression:", "patient", "assessed", "per", "protocol."]
+    count = max(8, min(max_tokens, 200) // 2)
+    body = " ".join(words[i % len(words)] for i in range(count))
+    return f"[mock {digest[:8]}] {body}"
+
+def _chunk_words(text):
+    parts = text.split(" ")
+    return [p + (" " if i < len(parts) - 1 else "") for i, p in enumerate(parts)]
+
+# ----------------------------
+# HTTP HANDLER
+# ----------------------------
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, extra_headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/models", "/openai/v1/models"):
+            self._send_json(200, {"status": "ok", "object": "list", "data": []})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/v1/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        config = self.server.config
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        max_tokens = int(request.get("max_tokens", 200))
+
+        time.sleep(config.sample_latency())
+
+        failure = config.sample_failure()
+        if failure == 429:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                {"Retry-After": str(config.retry_after_seconds)}
+            )
+            return
+        if failure == 500:
+            self._send_json(500, {"error": {"message": "Mock internal error"}})
+            return
+
+        text = mock_completion_text(messages, max_tokens)
+        completion_id = "mock-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        model = request.get("model", "mock")
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "")) for m in messages) // 4,
+            "completion_tokens": len(text.split(" ")),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        for chunk in _chunk_words(text):
+            event = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+# ----------------------------
+# SERVER
+# ----------------------------
+
+def make_server(config, host="127.0.0.1", port=DEFAULT_PORT):
+    """Creates the threaded server; port=0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = config
+    return server
+
+def serve_in_thread(config, host="127.0.0.1", port=0):
+    """Starts the server on a background thread and returns (server, base_url)."""
+    server = make_server(config, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def config_arguments(parser):
+    """Adds the MockConfig options to an argparse parser."""
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mean time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Spread of the latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Streaming speed")
+    parser.add_argument("--seed", type=int, default=None)
+
+def config_from_args(args):
+    return MockConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_seconds=args.retry_after,
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the LLM chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    config_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM listening on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
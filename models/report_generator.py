@@ -2,6 +2,16 @@ import sys
 import json
 import os
 
+from stage_timing import stage, collect_timings, timings_ms
+from tracing import Span
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+NEXT_STEPS_MAX_TOKENS = 120
+CLINICAL_REPORT_MAX_TOKENS = 200
+
 # ----------------------------
 # BASE TRIAGE PROTOCOLS
 # ----------------------------
@@ -56,21 +66,24 @@ def refine_protocol(triage_level, risk_factors):
     # Remove duplicates, preserve order
     return list(dict.fromkeys(steps))
 
-def narrate_next_steps(triage_level, next_steps, age_group):
-    """
-    Converts structured protocol steps into a human-readable clinical action summary.
-    """
-    try:
-        from groq import Groq
-        
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            # Fallback to simple formatting if no API key
-            return f"For {age_group} patient at {triage_level} level: " + " ".join(next_steps)
-        
-        client = Groq(api_key=api_key)
-        
-        prompt = f"""
+def triage_from_probability(vitals_probability):
+    """Maps the vitals probability onto the protocol triage level."""
+    if vitals_probability >= 0.75:
+        return "CRITICAL"
+    elif vitals_probability >= 0.50:
+        return "HIGH RISK"
+    elif vitals_probability >= 0.30:
+        return "MODERATE RISK"
+    else:
+        return "LOW RISK"
+
+# ----------------------------
+# LLM PROMPTS
+# ----------------------------
+
+def next_steps_messages(triage_level, next_steps, age_group):
+    """Chat messages asking the LLM to narrate the protocol steps."""
+    prompt = f"""
 You are assisting with clinical documentation for a pediatric patient.
 
 Patient age group: {age_group}
@@ -89,23 +102,12 @@ Rules:
 - Do NOT provide new medical advice
 - Do NOT mention AI, models, or decision systems
 """
+    return [
+        {"role": "system", "content": "You write clear pediatric clinical summaries."},
+        {"role": "user", "content": prompt}
+    ]
 
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {"role": "system", "content": "You write clear pediatric clinical summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.25,
-            max_tokens=120
-        )
-
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        # Fallback formatting
-        return f"For {age_group} patient at {triage_level} level: " + " ".join(next_steps)
-
-def generate_clinical_report(
+def clinical_report_messages(
     risk_level,
     final_score,
     age_group,
@@ -114,41 +116,27 @@ def generate_clinical_report(
     age_adjusted_flags,
     next_steps_summary
 ):
-    """
-    Generates a conservative, judge-safe clinical decision support summary.
-    """
-    try:
-        from groq import Groq
-        
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            # Fallback to structured summary if no API key
-            return f"""Clinical Impression: {age_group} patient presenting with {risk_level} risk profile (score {final_score:.2f}).
-
-Key Rationale: Assessment based on vital signs trending and physiological indicators. Age-adjusted findings show {', '.join(f"{k}: {v}" for k, v in age_adjusted_flags.items())}."""
-        
-        client = Groq(api_key=api_key)
-        
-        # Imaging interpretation
-        if image_probability >= 0.75:
-            imaging_text = "Chest X-ray findings are supportive of pneumonia risk."
-        elif image_probability <= 0.30:
-            imaging_text = "Chest X-ray findings do not strongly support pneumonia."
-        else:
-            imaging_text = "Chest X-ray findings are inconclusive."
+    """Chat messages asking the LLM for the clinical summary."""
+    # Imaging interpretation
+    if image_probability >= 0.75:
+        imaging_text = "Chest X-ray findings are supportive of pneumonia risk."
+    elif image_probability <= 0.30:
+        imaging_text = "Chest X-ray findings do not strongly support pneumonia."
+    else:
+        imaging_text = "Chest X-ray findings are inconclusive."
 
-        # Physiological drivers
-        vitals_summary = ", ".join([
-            f"{item['feature'].replace('_', ' ')} (impact {item['contribution']:.2f})"
-            for item in shap_contributors[:3]
-        ])
+    # Physiological drivers
+    vitals_summary = ", ".join([
+        f"{item['feature'].replace('_', ' ')} (impact {item['contribution']:.2f})"
+        for item in shap_contributors[:3]
+    ])
 
-        # Age context
-        age_context = "; ".join(
-            f"{k}: {v}" for k, v in age_adjusted_flags.items()
-        )
+    # Age context
+    age_context = "; ".join(
+        f"{k}: {v}" for k, v in age_adjusted_flags.items()
+    )
 
-        prompt = f"""
+    prompt = f"""
 You are a clinical decision support assistant.
 
 Patient age group: {age_group}
@@ -175,29 +163,126 @@ CONSTRAINTS:
 - Do NOT introduce new medical actions
 - Do NOT include recommended actions or next steps in the summary
 """
+    return [
+        {
+            "role": "system",
+            "content": "You generate conservative, clinician-facing summaries only."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+def fallback_next_steps(triage_level, next_steps, age_group):
+    """Plain formatting used when the LLM is unavailable."""
+    return f"For {age_group} patient at {triage_level} level: " + " ".join(next_steps)
+
+def fallback_clinical_report(risk_level, final_score, age_group, age_adjusted_flags):
+    """Structured summary used when the LLM is unavailable."""
+    return f"""Clinical Impression: {age_group} patient presenting with {risk_level} risk profile (score {final_score:.2f}).
+
+Key Rationale: Assessment based on vital signs trending and physiological indicators. Age-adjusted findings show {', '.join(f"{k}: {v}" for k, v in age_adjusted_flags.items())}."""
 
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You generate conservative, clinician-facing summaries only."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.25,
-            max_tokens=200
-        )
-
-        return response.choices[0].message.content.strip()
+# ----------------------------
+# LLM COMPLETION
+# ----------------------------
+
+def complete_chat(messages, max_tokens):
+    """
+    Sends one chat completion to the configured provider (Groq by default,
+    see llm_providers.py) and returns the text.
+    Raises on any failure so callers can decide how to fall back.
+    """
+    from llm_providers import get_provider
+
+    return get_provider().complete(messages, max_tokens)
+
+def narrate_next_steps(triage_level, next_steps, age_group, complete=complete_chat):
+    """
+    Converts structured protocol steps into a human-readable clinical action summary.
+    """
+    try:
+        with stage("report", "llm_next_steps"):
+            return complete(
+                next_steps_messages(triage_level, next_steps, age_group),
+                NEXT_STEPS_MAX_TOKENS
+            )
+    except Exception as e:
+        # Fallback formatting
+        return fallback_next_steps(triage_level, next_steps, age_group)
+
+def generate_clinical_report(
+    risk_level,
+    final_score,
+    age_group,
+    image_probability,
+    shap_contributors,
+    age_adjusted_flags,
+    next_steps_summary,
+    complete=complete_chat
+):
+    """
+    Generates a conservative, judge-safe clinical decision support summary.
+    """
+    try:
+        with stage("report", "llm_clinical_report"):
+            return complete(
+                clinical_report_messages(
+                    risk_level,
+                    final_score,
+                    age_group,
+                    image_probability,
+                    shap_contributors,
+                    age_adjusted_flags,
+                    next_steps_summary
+                ),
+                CLINICAL_REPORT_MAX_TOKENS
+            )
     except Exception as e:
         # Fallback to structured summary
-        return f"""Clinical Impression: {age_group} patient presenting with {risk_level} risk profile (score {final_score:.2f}).
+        return fallback_clinical_report(risk_level, final_score, age_group, age_adjusted_flags)
 
-Key Rationale: Assessment based on vital signs trending and physiological indicators. Age-adjusted findings show {', '.join(f"{k}: {v}" for k, v in age_adjusted_flags.items())}."""
+def build_report(input_data, complete=complete_chat):
+    """
+    Runs the full report pipeline for one input dict (the JSON the
+    generate-report route sends) and returns the result dict.
+    """
+    vitals_probability = input_data["vitals_probability"]
+    age_group = input_data["age_group"]
+    image_probability = input_data.get("image_probability", 0)
+    shap_contributors = input_data["shap_contributors"]
+    age_adjusted_flags = input_data["age_adjusted_flags"]
+    risk_factors_text = input_data["risk_factors_text"]
+
+    # Determine triage level based on probability
+    triage_level = triage_from_probability(vitals_probability)
+
+    # Refine protocol
+    with stage("report", "protocol"):
+        next_steps = refine_protocol(triage_level, risk_factors_text)
+
+    # Generate narrative
+    next_steps_summary = narrate_next_steps(triage_level, next_steps, age_group, complete)
+
+    # Generate clinical report
+    clinical_report = generate_clinical_report(
+        risk_level=triage_level,
+        final_score=vitals_probability,
+        age_group=age_group,
+        image_probability=image_probability,
+        shap_contributors=shap_contributors,
+        age_adjusted_flags=age_adjusted_flags,
+        next_steps_summary=next_steps_summary,
+        complete=complete
+    )
+
+    return {
+        "triage_level": triage_level,
+        "next_steps": next_steps,
+        "next_steps_summary": next_steps_summary,
+        "clinical_report": clinical_report
+    }
 
 if __name__ == "__main__":
     try:
@@ -213,46 +298,12 @@ if __name__ == "__main__":
         else:
             raise ValueError("No input provided")
         
-        vitals_probability = input_data["vitals_probability"]
-        age_group = input_data["age_group"]
-        image_probability = input_data.get("image_probability", 0)
-        shap_contributors = input_data["shap_contributors"]
-        age_adjusted_flags = input_data["age_adjusted_flags"]
-        risk_factors_text = input_data["risk_factors_text"]
-        
-        # Determine triage level based on probability
-        if vitals_probability >= 0.75:
-            triage_level = "CRITICAL"
-        elif vitals_probability >= 0.50:
-            triage_level = "HIGH RISK"
-        elif vitals_probability >= 0.30:
-            triage_level = "MODERATE RISK"
-        else:
-            triage_level = "LOW RISK"
-        
-        # Refine protocol
-        next_steps = refine_protocol(triage_level, risk_factors_text)
-        
-        # Generate narrative
-        next_steps_summary = narrate_next_steps(triage_level, next_steps, age_group)
-        
-        # Generate clinical report
-        clinical_report = generate_clinical_report(
-            risk_level=triage_level,
-            final_score=vitals_probability,
-            age_group=age_group,
-            image_probability=image_probability,
-            shap_contributors=shap_contributors,
-            age_adjusted_flags=age_adjusted_flags,
-            next_steps_summary=next_steps_summary
-        )
-        
-        result = {
-            "triage_level": triage_level,
-            "next_steps": next_steps,
-            "next_steps_summary": next_steps_summary,
-            "clinical_report": clinical_report
-        }
+        with Span("report_generator"), collect_timings() as timings:
+            result = build_report(input_data)
+
+        # STAGE_TIMING_REPORT=1 adds per-stage durations for the caller's Server-Timing header
+        if os.environ.get("STAGE_TIMING_REPORT") == "1":
+            result["stage_timings_ms"] = timings_ms(timings)
         
         print(json.dumps(result))
         
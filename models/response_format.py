@@ -0,0 +1,184 @@
+"""
+Response shaping and encoding for the scoring APIs.
+
+A full vitals prediction carries every SHAP value, the top contributors,
+English sentences and (from vitals_api) the waterfall, all as float64
+text. Callers that render only part of it can ask for less:
+
+    fields=vitals_probability,top_contributors   only these top-level keys
+    explanations=codes                          "SpO2_percent:risk_up" codes
+                                                instead of risk_factors_text;
+                                                the sentences come once from
+                                                GET /feature-explanations
+    precision=4                                 floats rounded to 4 decimals
+
+and choose the encoding with the Accept header: application/msgpack
+(when the msgpack package is installed) or JSON. JSON goes through orjson
+when available, which serializes NumPy scalars and arrays directly.
+The stdlib json fallback converts them with numpy_default.
+"""
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # binary encoding is optional
+    msgpack = None
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+EXPLANATION_STYLES = ("text", "codes")
+MAX_PRECISION = 15
+# float32 keeps ~7 significant digits, enough for anything rounded to 6 decimals or fewer
+SINGLE_FLOAT_MAX_PRECISION = 6
+
+# ----------------------------
+# SHAPING
+# ----------------------------
+
+def explanation_codes(top_contributors, table, limit=None):
+    """"<feature>:risk_up|risk_down" for each contributor with an entry in table (FEATURE_EXPLANATIONS)."""
+    codes = []
+    for item in top_contributors:
+        if item["feature"] not in table:
+            continue
+        codes.append(f"{item['feature']}:{'risk_up' if item['contribution'] > 0 else 'risk_down'}")
+    return codes[:limit] if limit else codes
+
+def parse_fields(fields):
+    """"a,b" or ["a", "b"] -> ["a", "b"]; None or empty means every field."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [f.strip() for f in fields if f and f.strip()] or None
+
+def select_fields(body, fields, keep=()):
+    """Copy of body with only the requested top-level keys (plus keep); ValueError on unknown keys."""
+    fields = parse_fields(fields)
+    if fields is None:
+        return body
+    unknown = [f for f in fields if f not in body]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {', '.join(unknown)}; available: {', '.join(body)}")
+    return {key: value for key, value in body.items() if key in fields or key in keep}
+
+def shape(body, fields=None, explanations="text", table=None, limit=None, keep=()):
+    """
+    Applies the explanations style, then the field selection. With
+    explanations="codes", risk_factors_text is replaced by
+    risk_factor_codes, built from top_contributors.
+    """
+    if explanations not in EXPLANATION_STYLES:
+        raise ValueError(f"Unknown explanations style {explanations!r}; expected one of {', '.join(EXPLANATION_STYLES)}")
+    if explanations == "codes" and "top_contributors" in body:
+        body = {key: value for key, value in body.items() if key != "risk_factors_text"}
+        body["risk_factor_codes"] = explanation_codes(body["top_contributors"], table or {}, limit)
+    return select_fields(body, fields, keep)
+
+def parse_precision(value):
+    if value in (None, ""):
+        return None
+    precision = int(value)
+    if not 0 <= precision <= MAX_PRECISION:
+        raise ValueError(f"precision must be between 0 and {MAX_PRECISION}")
+    return precision
+
+def round_floats(obj, digits):
+    """Recursively rounds floats (including NumPy floats and arrays) in dicts and lists."""
+    if isinstance(obj, (float, np.floating)):
+        return round(float(obj), digits)
+    if isinstance(obj, np.ndarray):
+        return np.round(obj, digits) if obj.dtype.kind == "f" else obj
+    if isinstance(obj, dict):
+        return {key: round_floats(value, digits) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [round_floats(value, digits) for value in obj]
+    return obj
+
+# ----------------------------
+# ENCODING
+# ----------------------------
+
+def numpy_default(obj):
+    """default= hook for encoders without NumPy support."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def dumps_json(obj, precision=None):
+    """Compact JSON bytes; NumPy scalars and arrays are serialized as numbers and lists."""
+    if precision is not None:
+        obj = round_floats(obj, precision)
+    if orjson is not None:
+        return orjson.dumps(obj, default=numpy_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=numpy_default, separators=(",", ":")).encode("utf-8")
+
+def dumps_msgpack(obj, precision=None):
+    if msgpack is None:
+        raise RuntimeError("MessagePack requested but the msgpack package is not installed")
+    if precision is not None:
+        obj = round_floats(obj, precision)
+    single_float = precision is not None and precision <= SINGLE_FLOAT_MAX_PRECISION
+    return msgpack.packb(obj, default=numpy_default, use_single_float=single_float)
+
+def available_media_types():
+    return (JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE) if msgpack is not None else (JSON_MEDIA_TYPE,)
+
+def negotiate(accept):
+    """
+    The media type to respond with for an Accept header value: JSON or
+    MessagePack by q-value, explicit types before wildcards, then in the
+    order listed. Anything else falls back to JSON, as before negotiation
+    existed, except a request for MessagePack alone when msgpack is not
+    installed: that returns None (answer 406).
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    best, best_rank = None, (0.0, False)
+    msgpack_only = False
+    for part in accept.split(","):
+        media, _, params = part.strip().partition(";")
+        media = media.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media in MSGPACK_ALIASES:
+            if msgpack is None:
+                msgpack_only = msgpack_only or q > 0
+                continue
+            candidate = MSGPACK_MEDIA_TYPE
+        elif media in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            candidate = JSON_MEDIA_TYPE
+        else:
+            continue
+        rank = (q, "*" not in media)
+        if q > 0 and rank > best_rank:
+            best, best_rank = candidate, rank
+    if best is None and msgpack_only:
+        return None
+    return best or JSON_MEDIA_TYPE
+
+def encode(obj, media_type=JSON_MEDIA_TYPE, precision=None):
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return dumps_msgpack(obj, precision)
+    return dumps_json(obj, precision)
@@ -0,0 +1,74 @@
+"""
+Latest-wins request inbox for interactive scoring channels.
+
+A slider drag can produce messages faster than they are scored. Instead of
+queueing them, the receiving side folds every new message into a single
+pending slot and the scoring side always takes the newest state:
+
+    inbox = CoalescingInbox()
+    inbox.put({"seq": 7, "changes": {"SpO2_percent": 91}})   # receiver thread
+    message, superseded = inbox.take()                       # scorer loop
+
+Messages carrying a full "vitals" dict replace whatever is pending;
+messages carrying only "changes" are merged into it, so superseded
+partial updates are never lost, only not scored separately.
+"""
+import threading
+
+# ----------------------------
+# INBOX
+# ----------------------------
+
+def merge_messages(pending, message):
+    """Folds `message` into the older `pending` one; the newer seq and age_group win."""
+    if pending is None or "vitals" in message:
+        merged = dict(message)
+        merged["changes"] = dict(message.get("changes") or {})
+        return merged
+
+    merged = dict(pending)
+    merged["changes"] = {**pending.get("changes", {}), **(message.get("changes") or {})}
+    for key, value in message.items():
+        if key != "changes":
+            merged[key] = value
+    return merged
+
+class CoalescingInbox:
+    """One pending message per connection, replaced or merged as new ones arrive."""
+
+    def __init__(self):
+        self._pending = None
+        self._superseded = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, message):
+        with self._cond:
+            if self._pending is not None:
+                self._superseded += 1
+                self.dropped += 1
+            self._pending = merge_messages(self._pending, message)
+            self.received += 1
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """
+        Newest pending message and how many it superseded. Blocks until one
+        arrives; returns (None, 0) once closed or on timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending is not None or self._closed, timeout)
+            message, superseded = self._pending, self._superseded
+            self._pending, self._superseded = None, 0
+            return message, superseded
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
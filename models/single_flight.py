@@ -0,0 +1,86 @@
+"""
+Single-flight deduplication of identical concurrent requests.
+
+When several threads ask for the same key at once, only the first (the
+leader) runs the computation; the rest wait for it and receive the same
+result or exception. Nothing is kept once the call finishes, so unlike a
+cache this never serves stale results, yet it still collapses the first
+burst of identical requests:
+
+    flight = SingleFlight()
+    result = flight.do(canonical_key(payload), lambda: score(payload))
+"""
+import json
+import hashlib
+import threading
+from concurrent.futures import Future
+
+# ----------------------------
+# KEYS
+# ----------------------------
+
+def _normalise(value):
+    if isinstance(value, dict):
+        return {str(k): _normalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(v) for v in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)  # 93 and 93.0 are the same request
+    return str(value)
+
+def canonical_key(payload):
+    """sha256 of the payload as key-sorted JSON with all numbers as floats."""
+    text = json.dumps(_normalise(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# ----------------------------
+# SINGLE FLIGHT
+# ----------------------------
+
+class SingleFlight:
+    """Thread-safe call coalescing keyed on a request hash."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        total = self.leaders + self.shared
+        return {
+            "computed": self.leaders,
+            "shared": self.shared,
+            "in_flight": in_flight,
+            "shared_ratio": self.shared / total if total else 0.0
+        }
@@ -0,0 +1,138 @@
+"""
+Tiered evaluation: the probability first, explanations only when needed.
+
+SHAP/waterfall for vitals and Grad-CAM/overlay/PNG for X-rays cost far
+more than the forward pass, and most results sit well clear of every
+decision threshold. The explain mode picks how much to compute:
+
+    always  full explanation on every request (the default)
+    band    explain only when the score is within `margin` of a cutoff,
+            e.g. the 0.25 pneumonia label cutoff or the triage boundaries
+    lazy    never explain up front; return an explanation_handle that a
+            follow-up request turns into the full explanation
+
+A skipped explanation always comes with a handle, so the UI can fetch it
+when someone opens the explanation. Vitals handles carry the inputs
+themselves (unsigned, but checked against the model version), so they
+work across processes with no storage. X-ray handles name a copy of the
+image kept by HandleStore for HANDLE_TTL_SECONDS.
+"""
+import os
+import json
+import time
+import base64
+import shutil
+import hashlib
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+EXPLAIN_MODES = ("always", "band", "lazy")
+DEFAULT_MODE = "always"
+
+HANDLE_DIR = os.environ.get("XRAY_HANDLE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "uploads", "xray_handles"
+)
+HANDLE_TTL_SECONDS = float(os.environ.get("XRAY_HANDLE_TTL", "3600"))
+
+# ----------------------------
+# POLICY
+# ----------------------------
+
+def explain_mode(requested=None, env_var=None):
+    """The requested mode, else the env var's, else DEFAULT_MODE; unknown modes raise ValueError."""
+    mode = requested or (os.environ.get(env_var) if env_var else None) or DEFAULT_MODE
+    if mode not in EXPLAIN_MODES:
+        raise ValueError(f"Unknown explain mode {mode!r}; expected one of {', '.join(EXPLAIN_MODES)}")
+    return mode
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+def env_cutoffs(name, default):
+    """Comma-separated cutoffs from the environment, e.g. "0.35,0.6,0.8"."""
+    value = os.environ.get(name)
+    return tuple(float(c) for c in value.split(",")) if value else tuple(default)
+
+def in_band(score, cutoffs, margin):
+    """True when score is within margin of any cutoff, i.e. the decision is close."""
+    return any(abs(score - cutoff) <= margin for cutoff in cutoffs)
+
+def should_explain(mode, score, cutoffs, margin):
+    if mode == "always":
+        return True
+    if mode == "band":
+        return in_band(score, cutoffs, margin)
+    return False
+
+# ----------------------------
+# HANDLES
+# ----------------------------
+
+def encode_handle(payload):
+    """URL-safe handle carrying a small JSON payload."""
+    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_handle(handle, kind, version=None):
+    """Payload of a handle made by encode_handle; ValueError if malformed, the wrong kind or a stale model."""
+    try:
+        padded = handle + "=" * (-len(handle) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Malformed explanation handle")
+    if not isinstance(payload, dict) or payload.get("kind") != kind:
+        raise ValueError(f"Not a {kind} explanation handle")
+    if version is not None and payload.get("version") != version:
+        raise ValueError("Explanation handle was issued for a different model version")
+    return payload
+
+class HandleStore:
+    """
+    Keeps copies of inputs (X-ray images) for lazy explanation, named by
+    content hash, so the same image uploaded twice shares one handle.
+    Files older than ttl_seconds are removed on each put.
+    """
+
+    def __init__(self, directory=HANDLE_DIR, ttl_seconds=HANDLE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+
+    def put(self, path):
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        handle = digest.hexdigest()[:32]
+        target = os.path.join(self.directory, handle + os.path.splitext(path)[1].lower())
+        if not os.path.exists(target):
+            shutil.copyfile(path, target)
+        else:
+            os.utime(target)    # reuse refreshes the TTL
+        return handle
+
+    def path(self, handle):
+        """Stored file for a handle; ValueError if unknown or expired."""
+        if not handle or not all(c in "0123456789abcdef" for c in handle):
+            raise ValueError("Malformed explanation handle")
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if os.path.splitext(name)[0] == handle:
+                    return os.path.join(self.directory, name)
+        raise ValueError("Explanation handle expired or unknown")
+
+    def prune(self):
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            full = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(full) < cutoff:
+                    os.remove(full)
+            except OSError:
+                pass
@@ -0,0 +1,325 @@
+"""
+Request tracing across the Next routes, the spawned Python scripts and the
+LLM calls.
+
+Trace context travels as a W3C traceparent ("00-<trace id>-<span id>-01"):
+the routes pass it to the scripts in the TRACEPARENT environment variable,
+and Flask reads it from the request header. Every stage timed with
+stage_timing.stage() becomes a span under the current one, so the existing
+timers are all the instrumentation needed. Spans are appended as JSON
+lines to TRACE_LOG_PATH (the Next routes write to the same file), and are
+optionally POSTed to TRACE_COLLECTOR_URL in batches of newline-delimited
+JSON by a background thread, so a slow collector never delays a request.
+
+Show the waterfall of one request, or the slowest recent traces:
+
+    python models/tracing.py show <trace_id> [--file uploads/traces.jsonl]
+    python models/tracing.py slowest --limit 10
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import secrets
+import argparse
+import threading
+import contextvars
+import urllib.request
+
+import stage_timing
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL")
+DEFAULT_TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads", "traces.jsonl")
+
+COLLECTOR_TIMEOUT_SECONDS = 0.5
+# Spans waiting for the collector thread; beyond this they are dropped (the JSONL file still has them)
+COLLECTOR_QUEUE_SIZE = 10000
+COLLECTOR_BATCH_SIZE = 100
+# How long a finishing process waits for queued spans to be posted
+COLLECTOR_FLUSH_SECONDS = 2.0
+
+# ----------------------------
+# CONTEXT
+# ----------------------------
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+def new_trace_id():
+    return secrets.token_hex(16)
+
+def new_span_id():
+    return secrets.token_hex(8)
+
+def parse_traceparent(value):
+    """SpanContext from a traceparent header value, or None if absent or malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+# Parent for spans recorded outside any explicit span, e.g. model loading at import time
+_process_parent = parse_traceparent(os.environ.get("TRACEPARENT"))
+
+def current_context():
+    return _current.get() or _process_parent
+
+def current_traceparent():
+    context = current_context()
+    return context.traceparent if context else None
+
+def enabled():
+    return bool(TRACE_LOG_PATH or TRACE_COLLECTOR_URL)
+
+# ----------------------------
+# EXPORT
+# ----------------------------
+
+_write_lock = threading.Lock()
+
+_collector_lock = threading.Lock()
+_collector = None  # (pid, queue); recreated after a fork, where the thread does not survive
+dropped_spans = 0
+
+def _post_batch(lines):
+    try:
+        req = urllib.request.Request(
+            TRACE_COLLECTOR_URL, data="\n".join(lines).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}, method="POST"
+        )
+        urllib.request.urlopen(req, timeout=COLLECTOR_TIMEOUT_SECONDS).close()
+    except OSError:
+        pass
+
+def _collector_loop(spans):
+    while True:
+        batch = [spans.get()]
+        while len(batch) < COLLECTOR_BATCH_SIZE:
+            try:
+                batch.append(spans.get_nowait())
+            except queue.Empty:
+                break
+        _post_batch(batch)
+        for _ in batch:
+            spans.task_done()
+
+def _collector_queue():
+    global _collector
+    with _collector_lock:
+        if _collector is None or _collector[0] != os.getpid():
+            spans = queue.Queue(maxsize=COLLECTOR_QUEUE_SIZE)
+            threading.Thread(target=_collector_loop, args=(spans,), name="trace-collector", daemon=True).start()
+            _collector = (os.getpid(), spans)
+        return _collector[1]
+
+def flush(timeout=COLLECTOR_FLUSH_SECONDS):
+    """Waits up to timeout for queued spans to reach the collector."""
+    if _collector is None or _collector[0] != os.getpid():
+        return
+    spans = _collector[1]
+    deadline = time.monotonic() + timeout
+    while spans.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+# Short-lived scripts (xray_api, vitals_api) exit right after their last span
+atexit.register(flush)
+
+def export(span):
+    """
+    Appends one finished span to the trace file and queues it for the
+    collector; never raises or waits on the network.
+    """
+    global dropped_spans
+    line = json.dumps(span)
+    if TRACE_LOG_PATH:
+        try:
+            with _write_lock, open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            pass
+    if TRACE_COLLECTOR_URL:
+        try:
+            _collector_queue().put_nowait(line)
+        except queue.Full:
+            dropped_spans += 1
+
+def _span_record(context, parent, name, service, started, seconds, attributes=None, error=None):
+    record = {
+        "trace_id": context.trace_id,
+        "span_id": context.span_id,
+        "parent_span_id": parent.span_id if parent else None,
+        "name": name,
+        "service": service,
+        "start_time": round(started, 6),
+        "duration_ms": round(seconds * 1000.0, 3),
+        "status": "error" if error else "ok"
+    }
+    if attributes:
+        record["attributes"] = attributes
+    if error:
+        record["error"] = error
+    return record
+
+# ----------------------------
+# SPANS
+# ----------------------------
+
+class Span:
+    """
+    Context manager for one span; becomes the parent of spans started inside it.
+    With parent=None the span continues the current context, or starts a new trace.
+    """
+
+    def __init__(self, name, service="python", parent=None, attributes=None):
+        self.name = name
+        self.service = service
+        self.parent = parent or current_context()
+        self.context = SpanContext(self.parent.trace_id if self.parent else new_trace_id(), new_span_id())
+        self.attributes = dict(attributes or {})
+
+    def __enter__(self):
+        self._token = _current.set(self.context)
+        self._wall = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        _current.reset(self._token)
+        if enabled():
+            error = f"{exc_type.__name__}: {exc}" if exc_type else None
+            export(_span_record(self.context, self.parent, self.name, self.service,
+                                self._wall, seconds, self.attributes, error))
+        return False
+
+    @property
+    def trace_id(self):
+        return self.context.trace_id
+
+    @property
+    def traceparent(self):
+        return self.context.traceparent
+
+def start_span(name, service="python", parent=None, attributes=None):
+    """Non-context-manager form for request hooks: returns the entered span; call end_span(span)."""
+    return Span(name, service, parent, attributes).__enter__()
+
+def end_span(span, error=None):
+    span.__exit__(type(error) if error else None, error, None)
+
+def _stage_listener(component, name, seconds):
+    """Turns every stage_timing stage into a child span of the current context."""
+    parent = current_context()
+    if parent is None or not enabled():
+        return
+    context = SpanContext(parent.trace_id, new_span_id())
+    export(_span_record(context, parent, f"{component}.{name}", component, time.time() - seconds, seconds))
+
+stage_timing.add_listener(_stage_listener)
+
+# ----------------------------
+# READING TRACES
+# ----------------------------
+
+def load_spans(path, trace_id=None):
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            if trace_id is None or span.get("trace_id") == trace_id:
+                spans.append(span)
+    return spans
+
+def format_waterfall(spans, width=40):
+    """Indented span tree with offsets from the trace start and a proportional bar."""
+    if not spans:
+        return "(no spans)"
+    children = {}
+    ids = {span["span_id"] for span in spans}
+    for span in spans:
+        parent = span.get("parent_span_id")
+        children.setdefault(parent if parent in ids else None, []).append(span)
+    for group in children.values():
+        group.sort(key=lambda s: s["start_time"])
+
+    start = min(s["start_time"] for s in spans)
+    end = max(s["start_time"] + s["duration_ms"] / 1000.0 for s in spans)
+    total = max(end - start, 1e-9)
+
+    lines = [f"trace {spans[0]['trace_id']}  {total * 1000.0:.1f} ms"]
+
+    def walk(parent_id, depth):
+        for span in children.get(parent_id, []):
+            offset = span["start_time"] - start
+            left = int(offset / total * width)
+            bar = max(1, int(span["duration_ms"] / 1000.0 / total * width))
+            label = f"{'  ' * depth}{span['service']}:{span['name']}"
+            flag = " !" if span.get("status") == "error" else ""
+            lines.append(
+                f"{label:<48}{offset * 1000.0:>9.1f} +{span['duration_ms']:>9.1f} ms  "
+                f"|{' ' * left}{'#' * bar}{' ' * max(0, width - left - bar)}|{flag}"
+            )
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+def slowest_traces(spans, limit=10):
+    """(trace_id, root name, total ms) of the slowest traces."""
+    traces = {}
+    ids = {span["span_id"] for span in spans}
+    for span in spans:
+        t = traces.setdefault(span["trace_id"], {"start": span["start_time"], "end": 0.0, "root": None, "root_ms": -1.0})
+        t["start"] = min(t["start"], span["start_time"])
+        t["end"] = max(t["end"], span["start_time"] + span["duration_ms"] / 1000.0)
+        # The longest top-level span names the trace (its parent may live in another file)
+        if span.get("parent_span_id") not in ids and span["duration_ms"] > t["root_ms"]:
+            t["root"], t["root_ms"] = span["name"], span["duration_ms"]
+    ranked = sorted(traces.items(), key=lambda item: item[1]["end"] - item[1]["start"], reverse=True)
+    return [(tid, t["root"], round((t["end"] - t["start"]) * 1000.0, 1)) for tid, t in ranked[:limit]]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect spans written to the trace JSONL file")
+    parser.add_argument("--file", default=TRACE_LOG_PATH or DEFAULT_TRACE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="Waterfall of one trace")
+    show.add_argument("trace_id")
+    slowest = commands.add_parser("slowest", help="Slowest traces in the file")
+    slowest.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            print(format_waterfall(load_spans(args.file, args.trace_id)))
+        else:
+            for trace_id, root, ms in slowest_traces(load_spans(args.file), args.limit):
+                print(f"{trace_id}  {ms:>10.1f} ms  {root or '?'}")
+    except FileNotFoundError:
+        print(json.dumps({"error": f"No trace file at {args.file}"}))
+        sys.exit(1)
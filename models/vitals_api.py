@@ -7,6 +7,9 @@ import shap
 import pandas as pd
 import numpy as np
 
+from stage_timing import stage, collect_timings, timings_ms
+from tracing import Span
+
 # ----------------------------
 # CONFIG
 # ----------------------------
@@ -86,20 +89,38 @@ PEDIATRIC_NORMALS = {
 # ----------------------------
 
 import os
-model_path = os.path.join(os.path.dirname(__file__), "vitals_model.pkl")
-vitals_model = joblib.load(model_path)
+# VITALS_MODEL_PATH lets benchmarks and tests load a different pipeline
+model_path = os.environ.get("VITALS_MODEL_PATH") or os.path.join(os.path.dirname(__file__), "vitals_model.pkl")
+# Load time is kept so a one-shot CLI run can report it alongside the request stages
+with collect_timings() as load_timings, stage("vitals", "model_load"):
+    vitals_model = joblib.load(model_path)
+
+    scaler = vitals_model.named_steps["scaler"]
+    clf = vitals_model.named_steps["clf"]
 
-scaler = vitals_model.named_steps["scaler"]
-clf = vitals_model.named_steps["clf"]
+    # SHAP explainer
+    background = np.zeros((1, len(FEATURE_COLUMNS)))
+    masker = shap.maskers.Independent(background)
+    explainer = shap.LinearExplainer(
+        clf,
+        masker=masker,
+        feature_names=FEATURE_COLUMNS
+    )
 
-# SHAP explainer
-background = np.zeros((1, len(FEATURE_COLUMNS)))
-masker = shap.maskers.Independent(background)
-explainer = shap.LinearExplainer(
-    clf,
-    masker=masker,
-    feature_names=FEATURE_COLUMNS
-)
+# Memoized responses keyed on quantized vitals (see vitals_cache.py)
+from vitals_cache import VitalsCache, model_version
+MODEL_VERSION = model_version(model_path)
+cache = VitalsCache.from_env(version=MODEL_VERSION)
+
+# Tiered mode: explain only near a triage boundary, or on request (see tiered_explain.py)
+from tiered_explain import explain_mode, should_explain, encode_handle, decode_handle, env_float, env_cutoffs
+from fusion_logic import TRIAGE_CUTOFFS
+from linear_vitals import LinearVitalsModel
+from response_format import shape, dumps_json, parse_precision
+# The cheap tier skips pandas and sklearn's validation: plain NumPy on the same weights
+linear_model = LinearVitalsModel.from_components(scaler, clf)
+EXPLAIN_CUTOFFS = env_cutoffs("VITALS_EXPLAIN_CUTOFFS", TRIAGE_CUTOFFS)
+EXPLAIN_MARGIN = env_float("VITALS_EXPLAIN_MARGIN", 0.05)
 
 # ----------------------------
 # HELPER FUNCTIONS
@@ -181,16 +202,20 @@ def explain_vitals(vitals_dict, age_group):
     Main function to analyze vitals and return risk assessment
     """
     # Convert input to DataFrame
-    X = pd.DataFrame([vitals_dict])[FEATURE_COLUMNS]
+    with stage("vitals", "features"):
+        X = pd.DataFrame([vitals_dict])[FEATURE_COLUMNS]
 
     # Scale features
-    X_scaled = scaler.transform(X)
+    with stage("vitals", "scale"):
+        X_scaled = scaler.transform(X)
 
     # Predict probability
-    prob = clf.predict_proba(X_scaled)[0][1]
+    with stage("vitals", "predict_proba"):
+        prob = clf.predict_proba(X_scaled)[0][1]
 
     # Compute SHAP values
-    shap_values = explainer.shap_values(X_scaled)
+    with stage("vitals", "shap"):
+        shap_values = explainer.shap_values(X_scaled)
     shap_vals = shap_values[0]
     shap_dict = dict(zip(FEATURE_COLUMNS, shap_vals))
 
@@ -217,7 +242,8 @@ def explain_vitals(vitals_dict, age_group):
     age_flags = age_adjusted_interpretation(vitals_dict, age_group)
     
     # Generate waterfall data
-    waterfall = generate_waterfall_data(shap_dict, base_value, prob)
+    with stage("vitals", "waterfall"):
+        waterfall = generate_waterfall_data(shap_dict, base_value, prob)
 
     return {
         "vitals_probability": float(prob),
@@ -228,6 +254,47 @@ def explain_vitals(vitals_dict, age_group):
         "waterfall": waterfall
     }
 
+def explain_vitals_cached(vitals_dict, age_group):
+    """explain_vitals through the memoization cache; a hit never touches the model"""
+    return cache.get_or_compute(vitals_dict, age_group, explain_vitals)
+
+def vitals_probability(vitals_dict):
+    """Pneumonia probability alone: the cheap tier, no SHAP or waterfall"""
+    with stage("vitals", "probability"):
+        return float(linear_model.probability(linear_model.matrix([vitals_dict]))[0])
+
+def assess_vitals(vitals_dict, age_group, mode=None):
+    """
+    Tiered entry point. In "always" mode this is explain_vitals_cached;
+    otherwise the probability comes first and the explanation is added
+    only when should_explain() says the decision is close. Skipped
+    explanations return an explanation_handle for explain_from_handle.
+    """
+    mode = explain_mode(mode, "VITALS_EXPLAIN_MODE")
+    if mode == "always":
+        return explain_vitals_cached(vitals_dict, age_group)
+
+    prob = vitals_probability(vitals_dict)
+    if should_explain(mode, prob, EXPLAIN_CUTOFFS, EXPLAIN_MARGIN):
+        return dict(explain_vitals_cached(vitals_dict, age_group), explained=True)
+
+    return {
+        "vitals_probability": prob,
+        "age_adjusted_flags": age_adjusted_interpretation(vitals_dict, age_group),
+        "explained": False,
+        "explanation_handle": encode_handle({
+            "kind": "vitals",
+            "version": MODEL_VERSION,
+            "vitals": {col: vitals_dict[col] for col in FEATURE_COLUMNS},
+            "age_group": age_group
+        })
+    }
+
+def explain_from_handle(handle):
+    """Full explanation for a handle returned by assess_vitals"""
+    payload = decode_handle(handle, "vitals", MODEL_VERSION)
+    return dict(explain_vitals_cached(payload["vitals"], payload["age_group"]), explained=True)
+
 # ----------------------------
 # MAIN (API ENTRY POINT)
 # ----------------------------
@@ -248,14 +315,30 @@ if __name__ == "__main__":
         else:
             raise ValueError("No input provided")
         
-        vitals_dict = input_data["vitals"]
-        age_group = input_data["age_group"]
-        
-        # Analyze vitals
-        result = explain_vitals(vitals_dict, age_group)
+        # Follow-up for an explanation skipped by a tiered request
+        if input_data.get("explain_handle"):
+            with Span("vitals_api.explain_handle"), collect_timings() as timings:
+                result = explain_from_handle(input_data["explain_handle"])
+        else:
+            vitals_dict = input_data["vitals"]
+            age_group = input_data["age_group"]
+
+            # Analyze vitals
+            with Span("vitals_api", attributes={"age_group": age_group}), collect_timings() as timings:
+                result = assess_vitals(vitals_dict, age_group, input_data.get("explain"))
+
+        # Optional "fields", "explanations": "codes" and "precision" trim the output (see response_format.py)
+        result = shape(
+            result, input_data.get("fields"), input_data.get("explanations") or "text", FEATURE_EXPLANATIONS
+        )
+        precision = parse_precision(input_data.get("precision"))
+
+        # STAGE_TIMING_REPORT=1 adds per-stage durations for the caller's Server-Timing header
+        if os.environ.get("STAGE_TIMING_REPORT") == "1":
+            result = dict(result, stage_timings_ms=timings_ms(load_timings + timings))
         
         # Output JSON result
-        print(json.dumps(result))
+        print(dumps_json(result, precision).decode("utf-8"))
         
     except Exception as e:
         import traceback
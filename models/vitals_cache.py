@@ -0,0 +1,269 @@
+"""
+Memoized vitals scoring.
+
+Simulator sliders move in fixed steps, so the same vitals come back again
+and again. VitalsCache keys a scoring response on the quantized feature
+tuple, the age group and the model version, and keeps it in an in-process
+LRU. It can also share responses between worker processes through a local
+SQLite file, which is what makes it useful for the per-request
+`python models/vitals_api.py` processes spawned by the Next routes:
+
+    cache = VitalsCache.from_env()
+    result = cache.get_or_compute(vitals, age_group, explain_vitals)
+
+The scoring function is called with the quantized vitals, so a hit returns
+exactly what a miss on the same key would have computed.
+
+Environment:
+    VITALS_CACHE_SIZE      in-process entries (default 4096, 0 disables)
+    VITALS_CACHE_TTL       seconds before an entry expires (default: never)
+    VITALS_CACHE_PATH      SQLite file shared across workers (default: none)
+    VITALS_CACHE_SHARED_SIZE  rows kept in the shared file (default 100000)
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+FEATURE_COLUMNS = [
+    "Temperature_C", "Temperature_trend",
+    "SpO2_percent", "SpO2_trend",
+    "HeartRate_bpm", "HeartRate_trend",
+    "RespRate_bpm", "RespRate_trend",
+    "Cough", "Retractions"
+]
+
+# Ten times finer than the simulator's slider steps, so distinct slider
+# positions never share a key while float noise (38.500000001) does
+QUANTA = {
+    "Temperature_C": 0.01,
+    "Temperature_trend": 0.001,
+    "SpO2_percent": 0.1,
+    "SpO2_trend": 0.001,
+    "HeartRate_bpm": 0.1,
+    "HeartRate_trend": 0.001,
+    "RespRate_bpm": 0.1,
+    "RespRate_trend": 0.001,
+    "Cough": 1.0,
+    "Retractions": 1.0
+}
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_SHARED_CAPACITY = 100_000
+
+# Shared rows are trimmed back to capacity once per this many inserts
+SHARED_TRIM_EVERY = 256
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "vitals_model.pkl")
+
+# ----------------------------
+# KEYS
+# ----------------------------
+
+def model_version(path=MODEL_PATH):
+    """Short content hash of the model file; a retrained model never hits old entries."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def quantize(vitals_dict, quanta=QUANTA):
+    """Vitals dict snapped to the quantization grid, in FEATURE_COLUMNS order."""
+    quantized = {}
+    for col in FEATURE_COLUMNS:
+        step = quanta[col]
+        quantized[col] = round(round(float(vitals_dict[col]) / step) * step, 6)
+    return quantized
+
+# ----------------------------
+# SHARED STORE
+# ----------------------------
+
+class SharedStore:
+    """SQLite-backed key/value rows shared by every process using the same file."""
+
+    def __init__(self, path, capacity=DEFAULT_SHARED_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._local = threading.local()
+        self._inserts = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vitals_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS vitals_cache_used ON vitals_cache (used)")
+
+    def after_fork(self):
+        """Forgets connections inherited across fork(); SQLite handles must not be shared."""
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, ttl_seconds=None):
+        conn = self._connection()
+        row = conn.execute("SELECT value, created FROM vitals_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if ttl_seconds is not None and now - row[1] > ttl_seconds:
+            return None
+        with conn:
+            conn.execute("UPDATE vitals_cache SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO vitals_cache (key, value, created, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=float), now, now)
+            )
+            self._inserts += 1
+            if self._inserts % SHARED_TRIM_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM vitals_cache WHERE key NOT IN "
+                    "(SELECT key FROM vitals_cache ORDER BY used DESC LIMIT ?)",
+                    (self.capacity,)
+                )
+
+# ----------------------------
+# CACHE
+# ----------------------------
+
+class VitalsCache:
+    """LRU of scoring responses keyed on (namespace, model version, age group, quantized vitals)."""
+
+    def __init__(
+        self,
+        capacity=DEFAULT_CAPACITY,
+        ttl_seconds=None,
+        shared_path=None,
+        shared_capacity=DEFAULT_SHARED_CAPACITY,
+        version=None,
+        namespace="explain_vitals",
+        quanta=QUANTA
+    ):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.version = version or model_version()
+        self.namespace = namespace
+        self.quanta = quanta
+        self.shared = SharedStore(shared_path, shared_capacity) if shared_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        ttl = os.environ.get("VITALS_CACHE_TTL")
+        return cls(
+            capacity=int(os.environ.get("VITALS_CACHE_SIZE", DEFAULT_CAPACITY)),
+            ttl_seconds=float(ttl) if ttl else None,
+            shared_path=os.environ.get("VITALS_CACHE_PATH") or None,
+            shared_capacity=int(os.environ.get("VITALS_CACHE_SHARED_SIZE", DEFAULT_SHARED_CAPACITY)),
+            **kwargs
+        )
+
+    def key(self, quantized, age_group):
+        values = ",".join(repr(quantized[col]) for col in FEATURE_COLUMNS)
+        return f"{self.namespace}|{self.version}|{age_group}|{values}"
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _count(self, counter):
+        # Counters change under the lock: the threaded server runs lookups concurrently
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _put_local(self, key, value, now):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, vitals_dict, age_group, compute):
+        """
+        Cached response for these vitals, or compute(quantized_vitals, age_group).
+        Responses are shared between callers; treat them as read-only.
+        """
+        quantized = quantize(vitals_dict, self.quanta)
+        key = self.key(quantized, age_group)
+        now = time.monotonic()
+
+        value = self._get_local(key, now)
+        if value is not None:
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key, self.ttl_seconds)
+            if value is not None:
+                self._count("shared_hits")
+                self._put_local(key, value, now)
+                return value
+
+        self._count("misses")
+        value = compute(quantized, age_group)
+        self._put_local(key, value, now)
+        if self.shared is not None:
+            self.shared.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def after_fork(self):
+        if self.shared is not None:
+            self.shared.after_fork()
+
+    def stats(self):
+        with self._lock:
+            entries, hits, shared_hits = len(self._entries), self.hits, self.shared_hits
+            misses, evictions = self.misses, self.evictions
+        lookups = hits + shared_hits + misses
+        return {
+            "entries": entries,
+            "capacity": self.capacity,
+            "hits": hits,
+            "shared_hits": shared_hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_ratio": (hits + shared_hits) / lookups if lookups else 0.0,
+            "model_version": self.version,
+            "shared_path": self.shared.path if self.shared else None
+        }
@@ -0,0 +1,270 @@
+"""
+Streaming vitals ingestion.
+
+Monitors push timestamped raw samples per bed; this module keeps a
+fixed-size ring buffer per patient and signal and maintains a windowed
+least-squares slope for every trended vital, so the *_trend features in
+FEATURE_COLUMNS are always ready to hand to explain_vitals:
+
+    ingestor = VitalsIngestor(window=120)
+    ingestor.add_sample("bed-7", 1718000000, {"HeartRate_bpm": 131, "SpO2_percent": 93})
+    features = ingestor.feature_vector("bed-7")
+
+Command line: replay a JSONL file of samples and print the feature vectors
+
+    python models/vitals_stream.py samples.jsonl [--score --age-group preschool]
+"""
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+FEATURE_COLUMNS = [
+    "Temperature_C", "Temperature_trend",
+    "SpO2_percent", "SpO2_trend",
+    "HeartRate_bpm", "HeartRate_trend",
+    "RespRate_bpm", "RespRate_trend",
+    "Cough", "Retractions"
+]
+
+# Raw signal -> trend feature derived from it
+TREND_SIGNALS = {
+    "Temperature_C": "Temperature_trend",
+    "SpO2_percent": "SpO2_trend",
+    "HeartRate_bpm": "HeartRate_trend",
+    "RespRate_bpm": "RespRate_trend"
+}
+
+# Signals scored on their latest value only
+LATEST_SIGNALS = ("Cough", "Retractions")
+
+DEFAULT_WINDOW = 120            # samples per signal
+DEFAULT_TREND_UNIT_SECONDS = 3600.0   # trends are reported as change per hour
+
+# ----------------------------
+# WINDOWED SLOPE
+# ----------------------------
+
+class SlopeWindow:
+    """
+    Ring buffer of (time, value) with running least-squares sums.
+
+    push() is O(1): the sample leaving the window is subtracted from the
+    sums and the new one added. Times are kept relative to an origin that
+    moves forward each time the buffer wraps; at that point the sums are
+    rebuilt from the buffer, which costs O(capacity) once per capacity
+    samples (amortised O(1)) and stops float drift from accumulating.
+    """
+
+    __slots__ = ("capacity", "_t", "_y", "_next", "_count", "_origin",
+                 "_st", "_sy", "_stt", "_sty")
+
+    def __init__(self, capacity=DEFAULT_WINDOW):
+        if capacity < 2:
+            raise ValueError("Slope window needs at least 2 samples")
+        self.capacity = capacity
+        self._t = [0.0] * capacity
+        self._y = [0.0] * capacity
+        self._next = 0
+        self._count = 0
+        self._origin = None
+        self._st = self._sy = self._stt = self._sty = 0.0
+
+    def __len__(self):
+        return self._count
+
+    def _add(self, t, y, sign):
+        dt = t - self._origin
+        self._st += sign * dt
+        self._sy += sign * y
+        self._stt += sign * dt * dt
+        self._sty += sign * dt * y
+
+    def _rebuild(self):
+        oldest = self._next if self._count == self.capacity else 0
+        self._origin = self._t[oldest]
+        self._st = self._sy = self._stt = self._sty = 0.0
+        for i in range(self._count):
+            self._add(self._t[i], self._y[i], 1.0)
+
+    def push(self, t, y):
+        if self._origin is None:
+            self._origin = t
+
+        if self._count == self.capacity:
+            self._add(self._t[self._next], self._y[self._next], -1.0)
+        else:
+            self._count += 1
+
+        self._t[self._next] = t
+        self._y[self._next] = y
+        self._add(t, y, 1.0)
+
+        self._next = (self._next + 1) % self.capacity
+        if self._next == 0:
+            self._rebuild()
+
+    def latest(self):
+        if not self._count:
+            return None
+        return self._y[(self._next - 1) % self.capacity]
+
+    def slope(self):
+        """Least-squares slope in value units per second (0.0 until two distinct times)."""
+        n = self._count
+        if n < 2:
+            return 0.0
+        denominator = n * self._stt - self._st * self._st
+        if denominator <= 1e-12:
+            return 0.0
+        return (n * self._sty - self._st * self._sy) / denominator
+
+# ----------------------------
+# PER-PATIENT STATE
+# ----------------------------
+
+def to_seconds(timestamp):
+    """Epoch seconds from a number, a datetime or an ISO-8601 string."""
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+
+class PatientVitalsStream:
+    """Trend windows and latest values for one patient."""
+
+    def __init__(self, window=DEFAULT_WINDOW, trend_unit_seconds=DEFAULT_TREND_UNIT_SECONDS):
+        self.trend_unit_seconds = trend_unit_seconds
+        self.windows = {signal: SlopeWindow(window) for signal in TREND_SIGNALS}
+        self.latest = {}
+        self.last_timestamp = None
+        self.samples = 0
+        self.out_of_order = 0
+
+    def add_sample(self, timestamp, sample):
+        """
+        Adds one monitor reading. sample may carry any subset of the raw
+        signals; readings older than the newest one seen are dropped.
+        """
+        t = to_seconds(timestamp)
+        if self.last_timestamp is not None and t < self.last_timestamp:
+            self.out_of_order += 1
+            return False
+
+        for signal, window in self.windows.items():
+            value = sample.get(signal)
+            if value is not None:
+                window.push(t, float(value))
+        for signal in LATEST_SIGNALS:
+            value = sample.get(signal)
+            if value is not None:
+                self.latest[signal] = float(value)
+
+        self.last_timestamp = t
+        self.samples += 1
+        return True
+
+    def missing_signals(self):
+        missing = [s for s, w in self.windows.items() if not len(w)]
+        missing += [s for s in LATEST_SIGNALS if s not in self.latest]
+        return missing
+
+    def is_ready(self):
+        return not self.missing_signals()
+
+    def feature_vector(self):
+        """Feature dict in FEATURE_COLUMNS order, ready for explain_vitals."""
+        missing = self.missing_signals()
+        if missing:
+            raise ValueError(f"No samples yet for: {', '.join(missing)}")
+
+        features = {}
+        for signal, trend in TREND_SIGNALS.items():
+            window = self.windows[signal]
+            features[signal] = window.latest()
+            features[trend] = window.slope() * self.trend_unit_seconds
+        features.update({s: self.latest[s] for s in LATEST_SIGNALS})
+
+        return {col: features[col] for col in FEATURE_COLUMNS}
+
+# ----------------------------
+# WARD-LEVEL INGESTOR
+# ----------------------------
+
+class VitalsIngestor:
+    """Routes samples to per-patient streams and builds feature vectors on demand."""
+
+    def __init__(self, window=DEFAULT_WINDOW, trend_unit_seconds=DEFAULT_TREND_UNIT_SECONDS):
+        self.window = window
+        self.trend_unit_seconds = trend_unit_seconds
+        self.patients = {}
+
+    def stream(self, patient_id):
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            patient = PatientVitalsStream(self.window, self.trend_unit_seconds)
+            self.patients[patient_id] = patient
+        return patient
+
+    def add_sample(self, patient_id, timestamp, sample):
+        return self.stream(patient_id).add_sample(timestamp, sample)
+
+    def remove_patient(self, patient_id):
+        self.patients.pop(patient_id, None)
+
+    def feature_vector(self, patient_id):
+        return self.patients[patient_id].feature_vector()
+
+    def feature_vectors(self, patient_ids=None):
+        """Feature dicts for every listed (default: every ready) patient."""
+        ids = self.patients if patient_ids is None else patient_ids
+        return {
+            pid: self.patients[pid].feature_vector()
+            for pid in ids
+            if pid in self.patients and self.patients[pid].is_ready()
+        }
+
+    def score(self, patient_id, age_group):
+        """Runs explain_vitals on the patient's current feature vector."""
+        from vitals_api import explain_vitals
+
+        return explain_vitals(self.feature_vector(patient_id), age_group)
+
+# ----------------------------
+# MAIN
+# ----------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay timestamped vitals samples and build trend features")
+    parser.add_argument("samples", help="JSONL with patient_id, timestamp and raw vital fields per line")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--trend-unit-seconds", type=float, default=DEFAULT_TREND_UNIT_SECONDS)
+    parser.add_argument("--score", action="store_true", help="Run explain_vitals on each feature vector")
+    parser.add_argument("--age-group", default="preschool")
+    args = parser.parse_args()
+
+    try:
+        ingestor = VitalsIngestor(args.window, args.trend_unit_seconds)
+        age_groups = {}
+        with open(args.samples, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                pid = record.pop("patient_id")
+                age_groups[pid] = record.pop("age_group", age_groups.get(pid, args.age_group))
+                ingestor.add_sample(pid, record.pop("timestamp"), record)
+
+        output = {}
+        for pid, features in ingestor.feature_vectors().items():
+            output[pid] = ingestor.score(pid, age_groups[pid]) if args.score else features
+        print(json.dumps(output, default=float))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
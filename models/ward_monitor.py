@@ -0,0 +1,328 @@
+"""
+Asyncio ward monitor.
+
+Keeps per-bed vitals state for a whole ward or hospital, rescores every
+patient with new samples in one vectorized batch per tick and emits an
+event only when a patient's triage band changes:
+
+    monitor = WardMonitor(tick_seconds=5)
+    asyncio.create_task(monitor.run())
+    await monitor.submit("bed-7", time.time(), {"HeartRate_bpm": 131, ...})
+    event = await monitor.events.get()
+
+Band changes are damped in two ways. Hysteresis means a band is only left
+downwards once the score is `hysteresis` below its cutoff. Debouncing
+means a new band must be seen on `debounce_ticks` consecutive ticks
+before it is reported.
+
+Events wait in a bounded queue (event_queue_size). If nothing consumes
+them, the oldest are dropped and counted in counters["events_dropped"].
+The on_event callback still sees every event.
+
+Simulate a ward from the command line:
+
+    python models/ward_monitor.py --beds 2000 --seconds 30 --tick 1
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+
+import numpy as np
+
+from fusion_logic import TRIAGE_BANDS, TRIAGE_CUTOFFS, fused_score_batch, triage_band_batch
+from linear_vitals import LinearVitalsModel
+from vitals_stream import VitalsIngestor, DEFAULT_WINDOW, DEFAULT_TREND_UNIT_SECONDS
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_TICK_SECONDS = 5.0
+DEFAULT_HYSTERESIS = 0.03
+DEFAULT_DEBOUNCE_TICKS = 2
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_EVENT_QUEUE_SIZE = 10000
+METRICS_HISTORY = 720
+
+UNASSESSED = -1
+
+# ----------------------------
+# MONITOR
+# ----------------------------
+
+class WardMonitor:
+    """Continuous, batched rescoring of many patients with band-change events."""
+
+    def __init__(
+        self,
+        model=None,
+        tick_seconds=DEFAULT_TICK_SECONDS,
+        hysteresis=DEFAULT_HYSTERESIS,
+        debounce_ticks=DEFAULT_DEBOUNCE_TICKS,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        event_queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+        window=DEFAULT_WINDOW,
+        trend_unit_seconds=DEFAULT_TREND_UNIT_SECONDS,
+        cutoffs=TRIAGE_CUTOFFS,
+        on_event=None
+    ):
+        self.model = model or LinearVitalsModel.load()
+        self.tick_seconds = tick_seconds
+        self.hysteresis = hysteresis
+        self.debounce_ticks = debounce_ticks
+        self.cutoffs = tuple(cutoffs)
+        self.on_event = on_event
+
+        self.ingestor = VitalsIngestor(window, trend_unit_seconds)
+        self.samples = asyncio.Queue(maxsize=queue_size)
+        self.events = asyncio.Queue(maxsize=event_queue_size)
+        self.metrics = deque(maxlen=METRICS_HISTORY)
+        self.counters = {"samples": 0, "dropped": 0, "ticks": 0, "overruns": 0, "events": 0, "events_dropped": 0}
+
+        # Per-patient state lives in slot-indexed arrays so a tick is pure NumPy
+        self._slots = {}
+        self._patient_ids = []
+        self._band = np.full(0, UNASSESSED, dtype=np.int8)
+        self._pending = np.full(0, UNASSESSED, dtype=np.int8)
+        self._pending_ticks = np.zeros(0, dtype=np.int16)
+        self._probability = np.zeros(0, dtype=np.float64)
+        self._image_probability = np.full(0, np.nan, dtype=np.float64)
+
+        self._dirty = {}  # patient_id -> monotonic time of the oldest unscored sample
+        self._stopping = False
+
+    # ------------------------
+    # INPUT
+    # ------------------------
+
+    def submit_nowait(self, patient_id, timestamp, sample):
+        """Queues a sample; returns False (and counts a drop) when the queue is full."""
+        try:
+            self.samples.put_nowait((patient_id, timestamp, sample, time.monotonic()))
+            return True
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            return False
+
+    async def submit(self, patient_id, timestamp, sample):
+        """Queues a sample, waiting for room so fast producers are slowed down."""
+        await self.samples.put((patient_id, timestamp, sample, time.monotonic()))
+
+    def set_image_probability(self, patient_id, p_img):
+        """Latest X-ray probability; from then on the patient is triaged on the fused score."""
+        slot = self._slot(patient_id)
+        self._image_probability[slot] = np.nan if p_img is None else float(p_img)
+        self._dirty.setdefault(patient_id, time.monotonic())
+
+    def _slot(self, patient_id):
+        slot = self._slots.get(patient_id)
+        if slot is not None:
+            return slot
+
+        slot = len(self._patient_ids)
+        if slot == len(self._band):
+            grow = max(64, len(self._band))
+            self._band = np.concatenate([self._band, np.full(grow, UNASSESSED, dtype=np.int8)])
+            self._pending = np.concatenate([self._pending, np.full(grow, UNASSESSED, dtype=np.int8)])
+            self._pending_ticks = np.concatenate([self._pending_ticks, np.zeros(grow, dtype=np.int16)])
+            self._probability = np.concatenate([self._probability, np.zeros(grow)])
+            self._image_probability = np.concatenate([self._image_probability, np.full(grow, np.nan)])
+        self._slots[patient_id] = slot
+        self._patient_ids.append(patient_id)
+        return slot
+
+    def _drain(self):
+        """Moves every queued sample into the ingestor without blocking."""
+        while True:
+            try:
+                patient_id, timestamp, sample, queued_at = self.samples.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if self.ingestor.add_sample(patient_id, timestamp, sample):
+                self._slot(patient_id)
+                self._dirty.setdefault(patient_id, queued_at)
+            self.counters["samples"] += 1
+
+    # ------------------------
+    # SCORING
+    # ------------------------
+
+    def _next_bands(self, slots, score):
+        """Applies hysteresis and debouncing; returns the mask of committed changes."""
+        current = self._band[slots]
+        raw = triage_band_batch(score, self.cutoffs)
+        # Band the score would fall to if every cutoff were lowered by the hysteresis margin
+        lowered = triage_band_batch(score + self.hysteresis, self.cutoffs)
+
+        candidate = np.where(raw > current, raw, np.where(lowered < current, lowered, current))
+        candidate = np.where(current == UNASSESSED, raw, candidate).astype(np.int8)
+
+        same_pending = candidate == self._pending[slots]
+        pending_ticks = np.where(same_pending, self._pending_ticks[slots] + 1, 1)
+        pending_ticks = np.where(candidate == current, 0, pending_ticks)
+
+        commit = (candidate != current) & (
+            (current == UNASSESSED) | (pending_ticks >= self.debounce_ticks)
+        )
+
+        self._pending[slots] = candidate
+        self._pending_ticks[slots] = np.where(commit, 0, pending_ticks)
+        self._band[slots] = np.where(commit, candidate, current)
+        return commit, current
+
+    def tick(self):
+        """Rescores every patient with unscored samples. Returns the tick's metrics."""
+        started = time.monotonic()
+        self._drain()
+
+        patients = self.ingestor.patients
+        ready = [pid for pid in self._dirty if pid in patients and patients[pid].is_ready()]
+        oldest = min((self._dirty[pid] for pid in ready), default=started)
+        for pid in ready:
+            del self._dirty[pid]
+
+        emitted = 0
+        if ready:
+            features = self.ingestor.feature_vectors(ready)
+            ids = list(features)
+            slots = np.fromiter((self._slots[pid] for pid in ids), dtype=np.int64, count=len(ids))
+
+            probability = self.model.probability(self.model.matrix(features.values()))
+            self._probability[slots] = probability
+
+            # Fuse with imaging where an X-ray probability is known
+            p_img = self._image_probability[slots]
+            has_img = ~np.isnan(p_img)
+            score = probability.copy()
+            if has_img.any():
+                score[has_img] = fused_score_batch(p_img[has_img], probability[has_img])[0]
+
+            commit, previous = self._next_bands(slots, score)
+            now = time.time()
+            for i in np.flatnonzero(commit & (previous != UNASSESSED)):
+                event = {
+                    "patient_id": ids[i],
+                    "from_band": TRIAGE_BANDS[previous[i]][0],
+                    "to_band": TRIAGE_BANDS[self._band[slots[i]]][0],
+                    "score": float(score[i]),
+                    "vitals_probability": float(probability[i]),
+                    "timestamp": now
+                }
+                self._emit(event)
+                if self.on_event:
+                    self.on_event(event)
+                emitted += 1
+
+        finished = time.monotonic()
+        self.counters["ticks"] += 1
+        self.counters["events"] += emitted
+        metrics = {
+            "tick": self.counters["ticks"],
+            "scored": len(ready),
+            "events": emitted,
+            "duration_ms": round((finished - started) * 1000.0, 3),
+            "max_sample_lag_ms": round((finished - oldest) * 1000.0, 3),
+            "queue_depth": self.samples.qsize(),
+            "dropped_total": self.counters["dropped"],
+            "patients": len(self._patient_ids)
+        }
+        self.metrics.append(metrics)
+        return metrics
+
+    def _emit(self, event):
+        """Queues an event, dropping the oldest one when no consumer keeps up."""
+        if self.events.full():
+            self.events.get_nowait()
+            self.counters["events_dropped"] += 1
+        self.events.put_nowait(event)
+
+    # ------------------------
+    # LIFECYCLE
+    # ------------------------
+
+    async def run(self):
+        """Ticks on a fixed schedule until stop(); overrunning ticks are counted, not queued."""
+        next_tick = time.monotonic()
+        while not self._stopping:
+            self.tick()
+            next_tick += self.tick_seconds
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                self.counters["overruns"] += 1
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def stop(self):
+        self._stopping = True
+
+    def band(self, patient_id):
+        slot = self._slots.get(patient_id)
+        if slot is None or self._band[slot] == UNASSESSED:
+            return None
+        return TRIAGE_BANDS[self._band[slot]][0]
+
+    def summary(self):
+        durations = [m["duration_ms"] for m in self.metrics if m["scored"]]
+        return {
+            **self.counters,
+            "patients": len(self._patient_ids),
+            "tick_p50_ms": float(np.percentile(durations, 50)) if durations else None,
+            "tick_p99_ms": float(np.percentile(durations, 99)) if durations else None,
+            "max_tick_ms": max(durations) if durations else None
+        }
+
+# ----------------------------
+# SIMULATION
+# ----------------------------
+
+async def simulate(beds, seconds, tick_seconds, sample_interval, seed=0):
+    """Feeds random-walk vitals for `beds` patients into a monitor."""
+    rng = random.Random(seed)
+    monitor = WardMonitor(tick_seconds=tick_seconds)
+    state = {
+        f"bed-{i}": {
+            "Temperature_C": rng.uniform(36.5, 39.5),
+            "SpO2_percent": rng.uniform(88, 100),
+            "HeartRate_bpm": rng.uniform(85, 160),
+            "RespRate_bpm": rng.uniform(20, 50),
+            "Cough": float(rng.random() < 0.5),
+            "Retractions": float(rng.random() < 0.3)
+        }
+        for i in range(beds)
+    }
+    steps = {"Temperature_C": 0.05, "SpO2_percent": 0.4, "HeartRate_bpm": 2.0, "RespRate_bpm": 1.0}
+
+    runner = asyncio.create_task(monitor.run())
+    started = time.time()
+    while time.time() - started < seconds:
+        now = time.time()
+        for pid, vitals in state.items():
+            for signal, step in steps.items():
+                vitals[signal] += rng.gauss(0, step)
+            monitor.submit_nowait(pid, now, dict(vitals))
+        await asyncio.sleep(sample_interval)
+
+    monitor.stop()
+    await runner
+    return monitor.summary()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a ward under the continuous monitor")
+    parser.add_argument("--beds", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--tick", type=float, default=1.0, help="Seconds between rescoring ticks")
+    parser.add_argument("--sample-interval", type=float, default=2.0, help="Seconds between samples per bed")
+    args = parser.parse_args()
+
+    try:
+        summary = asyncio.run(simulate(args.beds, args.seconds, args.tick, args.sample_interval))
+        print(json.dumps(summary))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
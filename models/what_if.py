@@ -0,0 +1,108 @@
+"""
+What-if sensitivity curves for the vitals model.
+
+Sweeps one or two vitals over a range while holding the rest of a base
+vitals dict fixed, and evaluates every point in a single broadcast array
+operation over the linear model (see linear_vitals.py):
+
+    curve = sensitivity_grid(model, base_vitals, [
+        {"feature": "SpO2_percent", "min": 85, "max": 100, "steps": 16}
+    ])
+"""
+import numpy as np
+
+from linear_vitals import sigmoid
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+DEFAULT_STEPS = 31
+MAX_STEPS_PER_AXIS = 1000
+MAX_GRID_POINTS = 250_000
+
+# ----------------------------
+# SWEEP AXES
+# ----------------------------
+
+def axis_values(sweep):
+    """
+    Points of one sweep axis: an explicit "values" list, or "min"/"max"
+    with an optional "steps" (default 31) or "step" size.
+    """
+    if "values" in sweep:
+        values = np.asarray(sweep["values"], dtype=np.float64)
+    else:
+        low, high = float(sweep["min"]), float(sweep["max"])
+        if high < low:
+            raise ValueError(f"max must be >= min for {sweep['feature']}")
+        if "step" in sweep:
+            step = float(sweep["step"])
+            if step <= 0:
+                raise ValueError("step must be positive")
+            values = np.arange(low, high + step / 2, step)
+        else:
+            values = np.linspace(low, high, int(sweep.get("steps", DEFAULT_STEPS)))
+
+    if values.ndim != 1 or not len(values):
+        raise ValueError(f"No sweep values for {sweep.get('feature')}")
+    if len(values) > MAX_STEPS_PER_AXIS:
+        raise ValueError(f"At most {MAX_STEPS_PER_AXIS} points per axis")
+    return values
+
+# ----------------------------
+# GRID EVALUATION
+# ----------------------------
+
+def sensitivity_grid(model, base_vitals, sweeps):
+    """
+    Probability and SHAP contributions over a 1-D curve or 2-D grid.
+
+    Arrays are shaped (n,) for one sweep and (n_first, n_second) for two.
+    Contributions of the swept features are returned per point; every
+    other feature contributes a constant, returned once in fixed_shap_values.
+    """
+    if len(sweeps) not in (1, 2):
+        raise ValueError("Provide one or two features to sweep")
+
+    features = [s["feature"] for s in sweeps]
+    for feature in features:
+        if feature not in model.index:
+            raise ValueError(f"Unknown vital: {feature}")
+    if len(set(features)) != len(features):
+        raise ValueError("Sweep features must be different")
+
+    axes = [axis_values(s) for s in sweeps]
+    shape = tuple(len(a) for a in axes)
+    if int(np.prod(shape)) > MAX_GRID_POINTS:
+        raise ValueError(f"At most {MAX_GRID_POINTS} grid points")
+
+    base = model.matrix([base_vitals])[0]
+    base_contrib = model.contributions(model.scale_features(base))
+
+    # Contribution of each swept feature along its own axis, then broadcast into the grid
+    logit = model.intercept + base_contrib.sum()
+    swept_contrib = {}
+    for axis, (feature, values) in enumerate(zip(features, axes)):
+        i = model.index[feature]
+        contrib = model.coef[i] * (values - model.mean[i]) / model.scale[i]
+        view = [1] * len(axes)
+        view[axis] = len(values)
+        contrib = np.broadcast_to(contrib.reshape(view), shape)
+        swept_contrib[feature] = contrib
+        logit = logit + contrib - base_contrib[i]
+
+    probability = sigmoid(logit)
+
+    return {
+        "features": features,
+        "values": [a.tolist() for a in axes],
+        "probability": probability.tolist(),
+        "logit": logit.tolist(),
+        "shap_values": {f: c.tolist() for f, c in swept_contrib.items()},
+        "fixed_shap_values": {
+            f: float(base_contrib[model.index[f]])
+            for f in model.feature_columns if f not in swept_contrib
+        },
+        "base_value": float(model.expected_value)
+    }
@@ -1,3 +1,5 @@
+# Before TensorFlow/NumPy/OpenCV: thread pools and CPU affinity are read at load (see xray_threads.py)
+import xray_threads
 import tensorflow as tf
 import numpy as np
 import cv2
@@ -10,12 +12,19 @@ import os
 import warnings
 import logging
 
+from stage_timing import stage, collect_timings, timings_ms
+from tracing import Span
+import memory_profile    # MEMORY_PROFILE=1 turns on per-stage memory before the model loads
+
 # Suppress all warnings and TensorFlow logging
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 warnings.filterwarnings('ignore')
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
+# XRAY_THREADS etc. size the TF and OpenCV pools for co-located workers; a no-op when unset
+xray_threads.apply_runtime(tf, cv2)
+
 # Monkey-patch Keras Dense layer to ignore quantization_config
 original_dense_init = tf.keras.layers.Dense.__init__
 
@@ -27,21 +36,36 @@ def patched_dense_init(self, *args, **kwargs):
 tf.keras.layers.Dense.__init__ = patched_dense_init
 
 # Load model
-model_path = os.path.join(os.path.dirname(__file__), "pneumonia_binary_model.h5")
+# XRAY_MODEL_PATH lets benchmarks and tests load a different network
+model_path = os.environ.get("XRAY_MODEL_PATH") or os.path.join(os.path.dirname(__file__), "pneumonia_binary_model.h5")
 try:
-    model = tf.keras.models.load_model(model_path, compile=False)
+    # Load time is kept so a one-shot CLI run can report it alongside the request stages
+    with collect_timings() as load_timings, stage("xray", "model_load"):
+        model = tf.keras.models.load_model(model_path, compile=False)
 except Exception as e:
     print(json.dumps({"error": f"Model loading failed: {str(e)}"}))
     sys.exit(1)
 
 LAST_CONV_LAYER = "block_13_expand_relu"
+PNEUMONIA_THRESHOLD = 0.25
 
-def make_gradcam_heatmap(img_array, model, last_conv_layer_name):
-    grad_model = tf.keras.Model(
+# Tiered mode: Grad-CAM only near the label cutoff, or on request (see tiered_explain.py)
+from tiered_explain import explain_mode, should_explain, env_float, env_cutoffs, HandleStore
+EXPLAIN_CUTOFFS = env_cutoffs("XRAY_EXPLAIN_CUTOFFS", (PNEUMONIA_THRESHOLD,))
+EXPLAIN_MARGIN = env_float("XRAY_EXPLAIN_MARGIN", 0.1)
+handle_store = HandleStore()
+
+def make_grad_model(model, last_conv_layer_name):
+    return tf.keras.Model(
         [model.inputs],
         [model.get_layer(last_conv_layer_name).output, model.output]
     )
 
+def make_gradcam_heatmap(img_array, model, last_conv_layer_name, grad_model=None):
+    # Bulk callers build grad_model once and pass it in
+    if grad_model is None:
+        grad_model = make_grad_model(model, last_conv_layer_name)
+
     with tf.GradientTape() as tape:
         conv_outputs, predictions = grad_model(img_array)
         loss = predictions[:, 0]
@@ -117,51 +141,104 @@ def apply_lung_mask(heatmap):
 
     return heatmap * mask
 
-def process_xray(img_path):
-    img_array, raw_img = preprocess_image(img_path)
+def render_gradcam(img_array, raw_img, label, grad_model=None):
+    """Lung-masked Grad-CAM overlay (RGB array) at the original image size"""
+    with stage("xray", "gradcam"):
+        heatmap = make_gradcam_heatmap(img_array, model, LAST_CONV_LAYER, grad_model)
+        heatmap = apply_lung_mask(heatmap)
+
+    with stage("xray", "overlay"):
+        return overlay_heatmap_dynamic(
+            heatmap,
+            raw_img,
+            prediction_label=label
+        )
+
+def classify_xray(img_path):
+    """Decode and forward pass only: (img_array, raw_img, probability, label)"""
+    with stage("xray", "decode"):
+        img_array, raw_img = preprocess_image(img_path)
     
     # Suppress TensorFlow output during prediction
     import logging
     logging.getLogger('tensorflow').setLevel(logging.ERROR)
     
     # Predict with verbose=0 to suppress progress bars
-    prob = model.predict(img_array, verbose=0)[0][0]
-    label = "PNEUMONIA" if prob >= 0.25 else "NORMAL"
-
-    heatmap = make_gradcam_heatmap(img_array, model, LAST_CONV_LAYER)
-    heatmap = apply_lung_mask(heatmap)
-
-    overlay = overlay_heatmap_dynamic(
-        heatmap,
-        raw_img,
-        prediction_label=label
-    )
-
-    # Convert overlay to base64
-    overlay_pil = Image.fromarray(overlay.astype('uint8'))
-    buffered = BytesIO()
-    overlay_pil.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-
-    return {
+    with stage("xray", "cnn_forward"):
+        prob = float(model.predict(img_array, verbose=0)[0][0])
+    label = "PNEUMONIA" if prob >= PNEUMONIA_THRESHOLD else "NORMAL"
+    return img_array, raw_img, prob, label
+
+def encode_overlay(overlay):
+    """Overlay array as a base64 PNG string"""
+    with stage("xray", "png_encode"):
+        overlay_pil = Image.fromarray(overlay.astype('uint8'))
+        buffered = BytesIO()
+        overlay_pil.save(buffered, format="PNG")
+    with stage("xray", "base64_encode"):
+        return base64.b64encode(buffered.getvalue()).decode()
+
+def process_xray(img_path, explain=None):
+    """
+    Label, probability and Grad-CAM overlay. With explain="band" or "lazy"
+    (or XRAY_EXPLAIN_MODE) the overlay is skipped unless the probability is
+    near the cutoff, and an explanation_handle is returned instead.
+    """
+    mode = explain_mode(explain, "XRAY_EXPLAIN_MODE")
+    img_array, raw_img, prob, label = classify_xray(img_path)
+
+    if not should_explain(mode, prob, EXPLAIN_CUTOFFS, EXPLAIN_MARGIN):
+        return {
+            "label": label,
+            "probability": prob,
+            "explained": False,
+            "explanation_handle": handle_store.put(img_path)
+        }
+
+    overlay = render_gradcam(img_array, raw_img, label)
+
+    result = {
         "label": label,
-        "probability": float(prob),
-        "image": img_str
+        "probability": prob,
+        "image": encode_overlay(overlay)
     }
+    if mode != "always":
+        result["explained"] = True
+    return result
+
+def explain_from_handle(handle):
+    """Full result with Grad-CAM for a handle returned by a tiered process_xray"""
+    return dict(process_xray(handle_store.path(handle), explain="always"), explained=True)
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) < 2:
-            print(json.dumps({"error": "No image path provided"}))
-            sys.exit(1)
-        
-        img_path = sys.argv[1]
-        
-        if not os.path.exists(img_path):
-            print(json.dumps({"error": f"Image file not found: {img_path}"}))
-            sys.exit(1)
-        
-        result = process_xray(img_path)
+        # Usage: xray_api.py <image> [--explain always|band|lazy]
+        #        xray_api.py --explain-handle <handle>
+        args = sys.argv[1:]
+        if len(args) >= 2 and args[0] == "--explain-handle":
+            with Span("xray_api.explain_handle"), collect_timings() as timings:
+                result = explain_from_handle(args[1])
+        else:
+            if not args:
+                print(json.dumps({"error": "No image path provided"}))
+                sys.exit(1)
+
+            img_path = args[0]
+            explain = args[2] if len(args) >= 3 and args[1] == "--explain" else None
+
+            if not os.path.exists(img_path):
+                print(json.dumps({"error": f"Image file not found: {img_path}"}))
+                sys.exit(1)
+
+            with Span("xray_api"), collect_timings() as timings:
+                result = process_xray(img_path, explain)
+
+        # STAGE_TIMING_REPORT=1 adds per-stage durations for the caller's Server-Timing header
+        if os.environ.get("STAGE_TIMING_REPORT") == "1":
+            result["stage_timings_ms"] = timings_ms(load_timings + timings)
+            if memory_profile.ENABLED:
+                result["stage_memory"] = memory_profile.stage_memory()
+
         # Only output clean JSON to stdout
         print(json.dumps(result))
     except Exception as e:
@@ -0,0 +1,355 @@
+"""
+Asynchronous X-ray jobs.
+
+The /api/xray-jobs route stores the upload, inserts a row into a local
+SQLite queue and returns a job ID at once. Worker processes started here
+claim jobs (highest priority first), write the probability as soon as the
+forward pass finishes (status "scored"), then the Grad-CAM overlay
+(status "done"). The status route and its SSE stream read the same rows.
+The pool size is set independently of the web server:
+
+    python models/xray_jobs.py serve --workers 2 --threads 4 --pin
+    python models/xray_jobs.py submit chest_xray/test/PNEUMONIA/person1_virus_6.jpeg
+    python models/xray_jobs.py status <job_id>
+    python models/xray_jobs.py stats
+
+Each worker loads the model once, with its TF/OpenCV/BLAS pools sized to
+its share of the cores (see xray_threads.py). Workers refresh a job's
+lease while processing it; a job whose worker died is requeued (its
+partial result cleared) once the lease expires, up to MAX_ATTEMPTS, so
+nothing is lost on a crash, and serve respawns the dead worker in the
+same slot. Finished jobs and their images are pruned after JOB_RETENTION_SECONDS.
+
+The table layout is shared with src/lib/xrayJobs.ts; change both together.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DB_PATH = os.environ.get("XRAY_JOB_DB") or os.path.join(ROOT, "uploads", "xray_jobs.sqlite")
+
+DEFAULT_WORKERS = 1
+POLL_INTERVAL_SECONDS = 0.2
+LEASE_SECONDS = 120          # a running job untouched this long is presumed orphaned
+HEARTBEAT_SECONDS = 15       # workers refresh the lease this often while processing
+MAX_ATTEMPTS = 3
+JOB_RETENTION_SECONDS = 24 * 3600
+MAINTENANCE_INTERVAL_SECONDS = 10
+# A worker that dies sooner than this after starting (e.g. the model fails to load) counts
+# toward MAX_FAST_CRASHES in a row, after which serve gives up instead of respawning forever
+WORKER_MIN_UPTIME_SECONDS = 60
+MAX_FAST_CRASHES = 5
+
+STATUSES = ("queued", "running", "scored", "done", "failed")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS xray_jobs ("
+    "id TEXT PRIMARY KEY, "
+    "status TEXT NOT NULL, "
+    "priority INTEGER NOT NULL DEFAULT 0, "
+    "image_path TEXT NOT NULL, "
+    "created_at REAL NOT NULL, "
+    "started_at REAL, "
+    "updated_at REAL NOT NULL, "
+    "attempts INTEGER NOT NULL DEFAULT 0, "
+    "worker TEXT, "
+    "label TEXT, "
+    "probability REAL, "
+    "overlay TEXT, "
+    "error TEXT)",
+    "CREATE INDEX IF NOT EXISTS xray_jobs_queue ON xray_jobs (status, priority DESC, created_at)"
+)
+
+# ----------------------------
+# QUEUE
+# ----------------------------
+
+class JobQueue:
+    """SQLite-backed job table; safe to share between processes."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, image_path, priority=0):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO xray_jobs (id, status, priority, image_path, created_at, updated_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?)",
+            (job_id, int(priority), os.path.abspath(image_path), now, now)
+        )
+        return job_id
+
+    def claim(self, worker):
+        """Marks the next queued job running and returns it, or None if the queue is empty."""
+        conn = self._connection()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock first, so two workers never claim one job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM xray_jobs WHERE status = 'queued' "
+                "ORDER BY priority DESC, created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE xray_jobs SET status = 'running', worker = ?, started_at = ?, "
+                    "updated_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, now, row["id"])
+                )
+                # The caller sees the claimed state (status, attempts), not the queued row
+                row = conn.execute("SELECT * FROM xray_jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row is not None else None
+
+    def heartbeat(self, job_id, worker):
+        """Extends the lease of a job this worker still holds."""
+        self._connection().execute(
+            "UPDATE xray_jobs SET updated_at = ? WHERE id = ? AND worker = ? AND status IN ('running', 'scored')",
+            (time.time(), job_id, worker)
+        )
+
+    def _update(self, job_id, worker, **fields):
+        """
+        Writes a result only while worker still holds the job's lease, so a
+        worker whose job was requeued or failed cannot overwrite the new
+        attempt. Returns False when the lease was lost.
+        """
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        return self._connection().execute(
+            f"UPDATE xray_jobs SET {columns} WHERE id = ? AND worker = ? AND status IN ('running', 'scored')",
+            (*fields.values(), job_id, worker)
+        ).rowcount > 0
+
+    def scored(self, job_id, worker, label, probability):
+        return self._update(job_id, worker, status="scored", label=label, probability=float(probability))
+
+    def done(self, job_id, worker, overlay):
+        return self._update(job_id, worker, status="done", overlay=overlay)
+
+    def failed(self, job_id, worker, error):
+        return self._update(job_id, worker, status="failed", error=str(error))
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM xray_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def requeue_stale(self, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Returns orphaned running jobs to the queue, or fails them after max_attempts."""
+        cutoff = time.time() - lease_seconds
+        conn = self._connection()
+        conn.execute(
+            "UPDATE xray_jobs SET status = 'failed', error = 'worker lost too many times', updated_at = ? "
+            "WHERE status IN ('running', 'scored') AND updated_at < ? AND attempts >= ?",
+            (time.time(), cutoff, max_attempts)
+        )
+        # A requeued job starts over: the lost attempt's partial result is dropped
+        return conn.execute(
+            "UPDATE xray_jobs SET status = 'queued', worker = NULL, label = NULL, probability = NULL, "
+            "overlay = NULL, error = NULL, updated_at = ? "
+            "WHERE status IN ('running', 'scored') AND updated_at < ?",
+            (time.time(), cutoff)
+        ).rowcount
+
+    def prune(self, retention_seconds=JOB_RETENTION_SECONDS):
+        """Deletes finished jobs (and their images) older than retention_seconds."""
+        cutoff = time.time() - retention_seconds
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT id, image_path FROM xray_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (cutoff,)
+        ).fetchall()
+        for row in rows:
+            remove_quietly(row["image_path"])
+        conn.execute("DELETE FROM xray_jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        return len(rows)
+
+    def stats(self):
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM xray_jobs GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM xray_jobs WHERE status = 'queued'").fetchone()[0]
+        return {
+            "counts": {status: counts.get(status, 0) for status in STATUSES},
+            "oldest_queued_age_seconds": round(time.time() - oldest, 2) if oldest else None
+        }
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def public_job(job):
+    """Job row as returned to clients: no worker internals or file paths."""
+    if job is None:
+        return None
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "label": job["label"],
+        "probability": job["probability"],
+        "image": job["overlay"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+# ----------------------------
+# WORKERS
+# ----------------------------
+
+def _heartbeat(queue, job_id, worker_id, finished):
+    while not finished.wait(HEARTBEAT_SECONDS):
+        try:
+            queue.heartbeat(job_id, worker_id)
+        except sqlite3.Error:
+            pass    # a missed beat is retried; the lease outlasts several
+
+def run_worker(db_path=DB_PATH, worker_id=None, poll_interval=POLL_INTERVAL_SECONDS, stop=None, environ=None):
+    """Claims and processes jobs until stop is set; loads the model once."""
+    # Thread and affinity settings are read when xray_api imports xray_threads
+    os.environ.update(environ or {})
+    import xray_api    # model load happens here, in the worker process
+
+    queue = JobQueue(db_path)
+    worker_id = worker_id or f"{os.uname().nodename}:{os.getpid()}"
+    while stop is None or not stop.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        # Refreshes the lease so a slow Grad-CAM is not mistaken for a dead worker
+        processing = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(queue, job["id"], worker_id, processing), daemon=True)
+        beat.start()
+        try:
+            img_array, raw_img, prob, label = xray_api.classify_xray(job["image_path"])
+            # The probability is published before the slower Grad-CAM overlay
+            if queue.scored(job["id"], worker_id, label, prob):
+                overlay = xray_api.render_gradcam(img_array, raw_img, label)
+                if queue.done(job["id"], worker_id, xray_api.encode_overlay(overlay)):
+                    remove_quietly(job["image_path"])
+        except Exception as e:
+            queue.failed(job["id"], worker_id, e)
+        finally:
+            processing.set()
+            beat.join()
+
+def serve(workers=DEFAULT_WORKERS, db_path=DB_PATH, threads=None, pin=False):
+    """
+    Starts the worker pool and runs lease/retention maintenance until
+    interrupted. threads=None gives each worker cores // workers threads.
+    """
+    from xray_threads import layout_environ
+
+    queue = JobQueue(db_path)
+    stop = multiprocessing.Event()
+
+    started = [0.0] * workers
+    fast_crashes = [0] * workers
+
+    def start_worker(i):
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(db_path, None, POLL_INTERVAL_SECONDS, stop, layout_environ(i, workers, threads, pin)),
+            daemon=True
+        )
+        process.start()
+        started[i] = time.monotonic()
+        return process
+
+    processes = [start_worker(i) for i in range(workers)]
+    print(json.dumps({
+        "serving": True, "workers": workers, "threads": threads, "pinned": pin, "db": os.path.abspath(db_path)
+    }), flush=True)
+    try:
+        while True:
+            # A crashed worker is replaced in its own slot, keeping its cores and thread counts;
+            # its job is requeued by requeue_stale once the lease runs out
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    fast = time.monotonic() - started[i] < WORKER_MIN_UPTIME_SECONDS
+                    fast_crashes[i] = fast_crashes[i] + 1 if fast else 0
+                    if fast_crashes[i] >= MAX_FAST_CRASHES:
+                        raise RuntimeError(
+                            f"Worker {i} exited (code {process.exitcode}) {fast_crashes[i]} times "
+                            f"within {WORKER_MIN_UPTIME_SECONDS}s of starting"
+                        )
+                    print(json.dumps({"respawned": i, "exitcode": process.exitcode}), flush=True)
+                    processes[i] = start_worker(i)
+            queue.requeue_stale()
+            queue.prune()
+            time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=30)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite-backed X-ray job queue")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve", help="Run the worker pool")
+    serve_cmd.add_argument("--workers", type=int, default=int(os.environ.get("XRAY_JOB_WORKERS", DEFAULT_WORKERS)))
+    serve_cmd.add_argument("--threads", type=int, default=None,
+                           help="TF/OpenCV/BLAS threads per worker (default: cores // workers)")
+    serve_cmd.add_argument("--pin", action="store_true", help="Pin each worker to its own cores")
+    submit_cmd = commands.add_parser("submit", help="Queue an image")
+    submit_cmd.add_argument("image")
+    submit_cmd.add_argument("--priority", type=int, default=0)
+    status_cmd = commands.add_parser("status", help="Show a job")
+    status_cmd.add_argument("job_id")
+    commands.add_parser("stats", help="Job counts by status")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "serve":
+            # Workers import TensorFlow; spawn avoids forking a half-initialised runtime
+            multiprocessing.set_start_method("spawn", force=True)
+            serve(args.workers, args.db, args.threads, args.pin)
+        elif args.command == "submit":
+            print(json.dumps({"job_id": JobQueue(args.db).submit(args.image, args.priority)}))
+        elif args.command == "status":
+            job = public_job(JobQueue(args.db).get(args.job_id))
+            if job is None:
+                print(json.dumps({"error": f"Unknown job {args.job_id}"}))
+                sys.exit(1)
+            print(json.dumps(job))
+        else:
+            print(json.dumps(JobQueue(args.db).stats()))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
@@ -0,0 +1,375 @@
+"""
+Thread pools and CPU affinity for X-ray workers.
+
+TensorFlow sizes its intra-op and inter-op pools to the whole machine, and
+OpenCV and the BLAS library under NumPy do the same. One worker per host
+is fine, but N co-located workers start N x cores threads that fight over
+the same cores, so adding workers lowers throughput. xray_api imports this
+module before TensorFlow and NumPy and applies these settings:
+
+    XRAY_THREADS            intra-op threads per worker; also the default for
+                            OpenCV and BLAS (default: cores // XRAY_WORKER_COUNT)
+    XRAY_INTER_OP_THREADS   TF inter-op threads (default 1 once XRAY_THREADS
+                            is set; MobileNet is a chain of ops)
+    XRAY_CV2_THREADS        cv2.setNumThreads
+    XRAY_BLAS_THREADS       OpenBLAS/MKL/OpenMP threads
+    XRAY_CPU_AFFINITY       "auto" pins worker XRAY_WORKER_INDEX of
+                            XRAY_WORKER_COUNT to its own slice of cores;
+                            or an explicit list such as "0-3,8"
+
+With none of these set, nothing changes. `xray_jobs.py serve` sets the
+index and count for its workers (--threads, --pin). The bench command
+runs each workers x threads layout against real images and recommends
+the fastest:
+
+    python models/xray_threads.py bench chest_xray/test --seconds 20
+    python models/xray_threads.py bench chest_xray/test --layouts 1x8,2x4,4x2,8x1 --max-p95-ms 400
+    python models/xray_threads.py show
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+# ----------------------------
+# CONFIG
+# ----------------------------
+
+BLAS_ENV_VARS = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"
+)
+
+DEFAULT_BENCH_SECONDS = 20.0
+DEFAULT_BENCH_WARMUP = 3
+# Allowance for interpreter start, TensorFlow import, model load and warm-up per layout
+BENCH_STARTUP_SECONDS = 300.0
+# Slack past the measured window for the image in flight at the deadline
+BENCH_MARGIN_SECONDS = 60.0
+BENCH_STAGES = ("classify", "full")
+
+# ----------------------------
+# SETTINGS
+# ----------------------------
+
+def available_cpus():
+    """CPUs this process may run on (respects cgroup/taskset limits where the OS reports them)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def parse_cpu_list(spec):
+    """"0-3,8" -> [0, 1, 2, 3, 8]; ValueError on anything else."""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cpus.update(range(int(low), int(high) + 1))
+        else:
+            cpus.add(int(part))
+    if not cpus:
+        raise ValueError(f"Empty CPU list {spec!r}")
+    return sorted(cpus)
+
+def cpu_slice(cpus, index, count):
+    """The contiguous share of cpus for worker `index` of `count`; wraps when workers outnumber CPUs."""
+    per_worker = max(len(cpus) // max(count, 1), 1)
+    start = (index * per_worker) % len(cpus)
+    return cpus[start:start + per_worker]
+
+def _env_int(environ, name):
+    value = environ.get(name)
+    return int(value) if value else None
+
+def thread_settings(environ=os.environ):
+    """Per-worker settings resolved from the environment; None means leave the library default."""
+    cpus = available_cpus()
+    count = _env_int(environ, "XRAY_WORKER_COUNT")
+    index = _env_int(environ, "XRAY_WORKER_INDEX") or 0
+
+    affinity = None
+    spec = environ.get("XRAY_CPU_AFFINITY")
+    if spec == "auto":
+        if count:
+            affinity = cpu_slice(cpus, index, count)
+    elif spec:
+        affinity = parse_cpu_list(spec)
+
+    threads = _env_int(environ, "XRAY_THREADS")
+    if threads is None and affinity:
+        threads = len(affinity)
+    elif threads is None and count:
+        threads = max(len(cpus) // count, 1)
+
+    inter_op = _env_int(environ, "XRAY_INTER_OP_THREADS")
+    return {
+        "worker_index": index if count else None,
+        "worker_count": count,
+        "intra_op_threads": threads,
+        "inter_op_threads": inter_op if inter_op is not None else (1 if threads else None),
+        "cv2_threads": _env_int(environ, "XRAY_CV2_THREADS") or threads,
+        "blas_threads": _env_int(environ, "XRAY_BLAS_THREADS") or threads,
+        "cpu_affinity": affinity
+    }
+
+def layout_environ(index, workers, threads=None, pin=False):
+    """Environment for worker `index` of a pool of `workers`; used by xray_jobs.serve and bench."""
+    environ = {"XRAY_WORKER_INDEX": str(index), "XRAY_WORKER_COUNT": str(workers)}
+    if threads:
+        environ["XRAY_THREADS"] = str(threads)
+    if pin:
+        environ["XRAY_CPU_AFFINITY"] = "auto"
+    return environ
+
+# ----------------------------
+# APPLY
+# ----------------------------
+
+def configure(environ=os.environ):
+    """
+    Pins the process and sets the thread-count environment variables.
+    Must run before NumPy, OpenCV or TensorFlow are imported: the BLAS
+    and OpenMP pools read these once, at load.
+    """
+    settings = thread_settings(environ)
+    if settings["cpu_affinity"] and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, settings["cpu_affinity"])
+    if settings["blas_threads"]:
+        for name in BLAS_ENV_VARS:
+            os.environ[name] = str(settings["blas_threads"])
+    if settings["intra_op_threads"]:
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(settings["intra_op_threads"])
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(settings["inter_op_threads"])
+    return settings
+
+def apply_runtime(tf, cv2, settings=None):
+    """
+    Sets the TF and OpenCV pools through their APIs. Call after importing
+    them and before the model loads: TF refuses once its runtime has started.
+    """
+    settings = settings or SETTINGS
+    if settings["intra_op_threads"]:
+        tf.config.threading.set_intra_op_parallelism_threads(settings["intra_op_threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(settings["inter_op_threads"])
+    if settings["cv2_threads"]:
+        cv2.setNumThreads(settings["cv2_threads"])
+    if settings["blas_threads"]:
+        # Covers a BLAS that was already loaded before configure() ran
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(settings["blas_threads"])
+        except ImportError:
+            pass
+
+SETTINGS = configure()
+
+# ----------------------------
+# LAYOUT BENCHMARK
+# ----------------------------
+
+def candidate_layouts(cpus):
+    """workers x threads splits that use every core once: 1 x cpus, 2 x cpus/2, ... cpus x 1."""
+    return [(workers, cpus // workers) for workers in range(1, cpus + 1) if cpus % workers == 0]
+
+def parse_layouts(spec):
+    """"1x8,2x4" -> [(1, 8), (2, 4)]"""
+    layouts = []
+    for part in spec.split(","):
+        workers, threads = part.lower().strip().split("x")
+        layouts.append((int(workers), int(threads)))
+    return layouts
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def _bench_worker(environ, paths, stage, warmup, seconds, barrier, results):
+    """One worker of a layout: load the model, warm up, then score until the shared deadline."""
+    os.environ.update(environ)
+    try:
+        # This module may already be imported here (to unpickle this function) with the old environment
+        import xray_threads
+        xray_threads.SETTINGS = xray_threads.configure()
+        import xray_api
+
+        def score(path):
+            img_array, raw_img, prob, label = xray_api.classify_xray(path)
+            if stage == "full":
+                xray_api.encode_overlay(xray_api.render_gradcam(img_array, raw_img, label))
+
+        for i in range(warmup):
+            score(paths[i % len(paths)])
+    except Exception as e:
+        barrier.abort()
+        results.put({"error": str(e)})
+        return
+
+    try:
+        barrier.wait(timeout=BENCH_STARTUP_SECONDS)
+    except threading.BrokenBarrierError:
+        results.put({"error": "another worker of the layout failed"})
+        return
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    i = int(environ["XRAY_WORKER_INDEX"])    # workers start at different images
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            score(paths[i % len(paths)])
+            latencies.append(time.perf_counter() - started)
+            i += 1
+    except Exception as e:
+        results.put({"error": f"{paths[i % len(paths)]}: {e}"})
+        return
+    results.put({"latencies": latencies, "settings": xray_threads.SETTINGS})
+
+def _collect(processes, results, timeout):
+    """
+    One report per worker. A worker that exits without reporting (crash,
+    OOM kill) or a layout that overruns timeout ends collection with an
+    error report instead of waiting forever.
+    """
+    reports = []
+    deadline = time.monotonic() + timeout
+    while len(reports) < len(processes):
+        try:
+            reports.append(results.get(timeout=1.0))
+            continue
+        except queue.Empty:
+            pass
+        dead = [p for p in processes if p.exitcode not in (None, 0)]
+        if dead:
+            reports.append({"error": f"worker {dead[0].pid} exited with code {dead[0].exitcode}"})
+            break
+        if time.monotonic() > deadline:
+            reports.append({"error": f"no result within {timeout:.0f}s"})
+            break
+    return reports
+
+def bench_layout(paths, workers, threads, pin=False, stage="full",
+                 warmup=DEFAULT_BENCH_WARMUP, seconds=DEFAULT_BENCH_SECONDS):
+    """Aggregate throughput and latency of `workers` processes with `threads` threads each."""
+    import multiprocessing
+    context = multiprocessing.get_context("spawn")    # a fresh interpreter per worker, as in production
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_bench_worker,
+            args=(layout_environ(i, workers, threads, pin), paths, stage, warmup, seconds, barrier, results),
+            daemon=True
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = _collect(processes, results, BENCH_STARTUP_SECONDS + seconds + BENCH_MARGIN_SECONDS)
+    for process in processes:
+        # Survivors of a failed layout may be blocked on the barrier or mid-image
+        if process.is_alive() and any("error" in r for r in reports):
+            process.terminate()
+        process.join()
+
+    errors = [r["error"] for r in reports if "error" in r]
+    if errors:
+        raise RuntimeError(f"Layout {workers}x{threads} failed: {errors[0]}")
+    latencies = [latency for r in reports for latency in r["latencies"]]
+    return {
+        "workers": workers,
+        "threads": threads,
+        "pinned": pin,
+        "images": len(latencies),
+        "images_per_second": round(len(latencies) / seconds, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1)
+        } if latencies else None,
+        "worker_settings": [r["settings"] for r in reports]
+    }
+
+def recommend(results, max_p95_ms=None):
+    """Highest-throughput layout, among those within max_p95_ms when given."""
+    eligible = [r for r in results if r["latency_ms"]]
+    if max_p95_ms is not None:
+        eligible = [r for r in eligible if r["latency_ms"]["p95"] <= max_p95_ms]
+    if not eligible:
+        return None
+    best = max(eligible, key=lambda r: r["images_per_second"])
+    command = f"python models/xray_jobs.py serve --workers {best['workers']} --threads {best['threads']}"
+    return {
+        "workers": best["workers"],
+        "threads": best["threads"],
+        "pinned": best["pinned"],
+        "images_per_second": best["images_per_second"],
+        "p95_ms": best["latency_ms"]["p95"],
+        "command": command + (" --pin" if best["pinned"] else "")
+    }
+
+def bench(paths, layouts=None, pin=False, stage="full", warmup=DEFAULT_BENCH_WARMUP,
+          seconds=DEFAULT_BENCH_SECONDS, max_p95_ms=None, progress=sys.stderr):
+    if not paths:
+        raise ValueError("No images to benchmark with")
+    cpus = len(available_cpus())
+    layouts = layouts or candidate_layouts(cpus)
+    results = []
+    for workers, threads in layouts:
+        if progress:
+            print(f"layout {workers}x{threads}{' pinned' if pin else ''} ...", file=progress, flush=True)
+        results.append(bench_layout(paths, workers, threads, pin, stage, warmup, seconds))
+    return {
+        "cpus": cpus,
+        "stage": stage,
+        "seconds_per_layout": seconds,
+        "layouts": results,
+        "recommended": recommend(results, max_p95_ms)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thread and CPU layout for X-ray workers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="Print the settings this environment resolves to")
+    run = commands.add_parser("bench", help="Measure workers x threads layouts and recommend one")
+    run.add_argument("source", help="Image directory, CSV manifest or text file of paths")
+    run.add_argument("--layouts", default=None,
+                     help="Comma-separated WORKERSxTHREADS, e.g. 1x8,2x4 (default: every split of the cores)")
+    run.add_argument("--pin", action="store_true", help="Pin each worker to its own cores")
+    run.add_argument("--stage", choices=BENCH_STAGES, default="full",
+                     help="classify = forward pass only; full = with Grad-CAM overlay")
+    run.add_argument("--seconds", type=float, default=DEFAULT_BENCH_SECONDS, help="Measured time per layout")
+    run.add_argument("--warmup", type=int, default=DEFAULT_BENCH_WARMUP, help="Unmeasured images per worker")
+    run.add_argument("--max-p95-ms", type=float, default=None, help="Only recommend layouts within this p95")
+    run.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            print(json.dumps(dict(SETTINGS, available_cpus=available_cpus()), indent=2))
+            sys.exit(0)
+
+        from bulk_xray import find_images
+        report = bench(
+            find_images(args.source),
+            layouts=parse_layouts(args.layouts) if args.layouts else None,
+            pin=args.pin,
+            stage=args.stage,
+            warmup=args.warmup,
+            seconds=args.seconds,
+            max_p95_ms=args.max_p95_ms
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+    except Exception as e:
+        import traceback
+        print(json.dumps({"error": str(e), "traceback": traceback.format_exc()}))
+        sys.exit(1)
@@ -3,84 +3,109 @@ import { exec } from 'child_process';
 import { promisify } from 'util';
 import { join } from 'path';
 import { writeFile, unlink } from 'fs/promises';
+import { canonicalKey, singleFlight } from '@/lib/singleFlight';
+import { splitStageTimings } from '@/lib/serverTiming';
+import { Span, traceEnv, traceRoute, withSpan } from '@/lib/tracing';
 
 const execAsync = promisify(exec);
+const flight = singleFlight<Record<string, any>>('analyze-vitals');
 
 export async function POST(request: NextRequest) {
+  return traceRoute(request, 'POST /api/analyze-vitals', (span) => analyzeVitals(request, span));
+}
+
+async function analyzeVitals(request: NextRequest, span: Span) {
   console.log('[API] Received analyze-vitals request');
   
   try {
     const body = await request.json();
     console.log('[API] Request body:', body);
     
-    const { vitals, ageGroup } = body;
-
-    if (!vitals || !ageGroup) {
-      console.error('[API] Missing vitals or ageGroup');
-      return NextResponse.json(
-        { error: 'Missing vitals or ageGroup' },
-        { status: 400 }
-      );
-    }
+    const { vitals, ageGroup, explain, explanationHandle, fields, explanations, precision } = body;
 
-    // Prepare input for Python script
-    const inputData = {
-      vitals: {
-        Temperature_C: vitals.temp,
-        Temperature_trend: vitals.tempTrend,
-        SpO2_percent: vitals.spo2,
-        SpO2_trend: vitals.spo2Trend,
-        HeartRate_bpm: vitals.hr,
-        HeartRate_trend: vitals.hrTrend,
-        RespRate_bpm: vitals.rr,
-        RespRate_trend: vitals.rrTrend,
-        Cough: vitals.cough,
-        Retractions: vitals.retractions
-      },
-      age_group: ageGroup
+    // Output trimming passed through to vitals_api.py: fields, explanations: 'codes', precision
+    const responseOptions = {
+      ...(fields ? { fields } : {}),
+      ...(explanations ? { explanations } : {}),
+      ...(precision !== undefined ? { precision } : {})
     };
 
+    // Follow-up for an explanation skipped by a tiered request (explain: 'band' | 'lazy')
+    let inputData: Record<string, unknown>;
+    if (explanationHandle) {
+      inputData = { explain_handle: explanationHandle, ...responseOptions };
+    } else {
+      if (!vitals || !ageGroup) {
+        console.error('[API] Missing vitals or ageGroup');
+        return NextResponse.json(
+          { error: 'Missing vitals or ageGroup' },
+          { status: 400 }
+        );
+      }
+
+      // Prepare input for Python script
+      inputData = {
+        vitals: {
+          Temperature_C: vitals.temp,
+          Temperature_trend: vitals.tempTrend,
+          SpO2_percent: vitals.spo2,
+          SpO2_trend: vitals.spo2Trend,
+          HeartRate_bpm: vitals.hr,
+          HeartRate_trend: vitals.hrTrend,
+          RespRate_bpm: vitals.rr,
+          RespRate_trend: vitals.rrTrend,
+          Cough: vitals.cough,
+          Retractions: vitals.retractions
+        },
+        age_group: ageGroup,
+        ...(explain ? { explain } : {}),
+        ...responseOptions
+      };
+    }
+
     const inputJson = JSON.stringify(inputData);
     console.log('[API] Input for Python:', inputJson);
 
-    // Write input to temporary file to avoid command-line escaping issues on Windows
-    const tempInputFile = join(process.cwd(), 'uploads', `vitals_input_${Date.now()}.json`);
-    await writeFile(tempInputFile, inputJson);
+    // Identical concurrent requests share one Python run
+    const result = await flight.run(canonicalKey(inputData), async () => {
+      // Write input to temporary file to avoid command-line escaping issues on Windows
+      const tempInputFile = join(process.cwd(), 'uploads', `vitals_input_${Date.now()}_${Math.random().toString(36).slice(2)}.json`);
+      await writeFile(tempInputFile, inputJson);
 
-    try {
-      // Execute Python script with temp file
-      const pythonScript = join(process.cwd(), 'models', 'vitals_api.py');
-      const pythonCommand = `python "${pythonScript}" "${tempInputFile}"`;
-      console.log('[API] Executing Python command');
-      
-      const { stdout, stderr } = await execAsync(pythonCommand, {
-        maxBuffer: 1024 * 1024 * 10 // 10MB buffer
-      });
-      
-      if (stderr) console.log('[API] Python stderr:', stderr);
-      console.log('[API] Python stdout:', stdout);
+      try {
+        // Execute Python script with temp file
+        const pythonScript = join(process.cwd(), 'models', 'vitals_api.py');
+        const pythonCommand = `python "${pythonScript}" "${tempInputFile}"`;
+        console.log('[API] Executing Python command');
 
-      // Parse Python output
-      const result = JSON.parse(stdout.trim());
-      console.log('[API] Analysis result:', result);
+        const { stdout, stderr } = await withSpan(span, 'python.vitals_api', (spawn) =>
+          execAsync(pythonCommand, {
+            maxBuffer: 1024 * 1024 * 10, // 10MB buffer
+            env: traceEnv(spawn)
+          })
+        );
 
-      // Clean up temp file
-      await unlink(tempInputFile).catch(() => {});
+        if (stderr) console.log('[API] Python stderr:', stderr);
+        console.log('[API] Python stdout:', stdout);
 
-      if (result.error) {
-        return NextResponse.json(
-          { error: result.error, traceback: result.traceback },
-          { status: 500 }
-        );
+        // Parse Python output
+        return JSON.parse(stdout.trim());
+      } finally {
+        // Clean up temp file
+        await unlink(tempInputFile).catch(() => {});
       }
+    });
+    console.log('[API] Analysis result:', result);
 
-      return NextResponse.json(result);
-      
-    } catch (error) {
-      // Clean up temp file on error
-      await unlink(tempInputFile).catch(() => {});
-      throw error;
+    if (result.error) {
+      return NextResponse.json(
+        { error: result.error, traceback: result.traceback },
+        { status: 500 }
+      );
     }
+
+    const [body, headers] = splitStageTimings(result);
+    return NextResponse.json(body, { headers });
     
   } catch (error) {
     console.error('[API] Error analyzing vitals:', error);
@@ -3,18 +3,35 @@ import { writeFile, unlink } from 'fs/promises';
 import { join } from 'path';
 import { exec } from 'child_process';
 import { promisify } from 'util';
+import { bytesKey, singleFlight } from '@/lib/singleFlight';
+import { splitStageTimings } from '@/lib/serverTiming';
+import { Span, traceEnv, traceRoute, withSpan } from '@/lib/tracing';
+import { AdmissionRejected, priorityFrom, xrayAdmission } from '@/lib/admission';
 
 const execAsync = promisify(exec);
+const flight = singleFlight<Record<string, any>>('analyze-xray');
 
 export async function POST(request: NextRequest) {
+  return traceRoute(request, 'POST /api/analyze-xray', (span) => analyzeXray(request, span));
+}
+
+async function analyzeXray(request: NextRequest, span: Span) {
   console.log('[API] Received analyze-xray request');
   
   try {
     const formData = await request.formData();
     console.log('[API] FormData parsed');
     
+    // Follow-up for a Grad-CAM overlay skipped by a tiered request
+    const explanationHandle = formData.get('explanationHandle') as string | null;
+    if (explanationHandle) {
+      return explainFromHandle(explanationHandle, span);
+    }
+
     const file = formData.get('file') as File;
     console.log('[API] File from form:', file ? `${file.name} (${file.size} bytes)` : 'NO FILE');
+    // 'band' or 'lazy' skips Grad-CAM for clear-cut films and returns an explanation handle
+    const explain = formData.get('explain') as string | null;
 
     if (!file) {
       console.error('[API] No file in request');
@@ -24,55 +41,76 @@ export async function POST(request: NextRequest) {
       );
     }
 
+    // Sicker patients' films go first when the CNN is saturated
+    const probabilityField = formData.get('vitalsProbability');
+    const priority = priorityFrom(
+      probabilityField === null ? null : Number(probabilityField),
+      formData.get('triageBand') as string | null
+    );
+    span.attributes.priority = priority;
+
     // Save uploaded file temporarily
     console.log('[API] Converting file to buffer...');
     const bytes = await file.arrayBuffer();
     const buffer = Buffer.from(bytes);
     console.log('[API] Buffer created:', buffer.length, 'bytes');
     
-    const uploadDir = join(process.cwd(), 'uploads');
-    const tempFilePath = join(uploadDir, `temp_${Date.now()}_${file.name}`);
-    console.log('[API] Temp file path:', tempFilePath);
-    
-    console.log('[API] Writing file to disk...');
-    await writeFile(tempFilePath, buffer);
-    console.log('[API] File written successfully');
+    // The same image uploaded concurrently is classified once per priority, so a
+    // critical request never waits behind (or is shed with) a routine one's admission
+    const flightKey = `${bytesKey(buffer)}:${explain ?? ''}:${priority}`;
+    const result = await flight.run(flightKey, async () => {
+      const uploadDir = join(process.cwd(), 'uploads');
+      const tempFilePath = join(uploadDir, `temp_${Date.now()}_${Math.random().toString(36).slice(2)}_${file.name}`);
+      console.log('[API] Temp file path:', tempFilePath);
 
-    try {
-      // Execute Python script
-      const pythonScript = join(process.cwd(), 'models', 'xray_api.py');
-      const pythonCommand = `python "${pythonScript}" "${tempFilePath}"`;
-      console.log('[API] Executing Python command:', pythonCommand);
-      
-      const { stdout, stderr } = await execAsync(pythonCommand);
-      console.log('[API] Python stdout:', stdout);
-      if (stderr) console.log('[API] Python stderr:', stderr);
-      
-      // Parse result
-      console.log('[API] Parsing result...');
-      const result = JSON.parse(stdout);
-      console.log('[API] Result parsed successfully:', { label: result.label, probability: result.probability });
-
-      // Clean up temp file
-      console.log('[API] Cleaning up temp file...');
-      await unlink(tempFilePath);
-      console.log('[API] Temp file deleted');
+      console.log('[API] Writing file to disk...');
+      await writeFile(tempFilePath, buffer);
+      console.log('[API] File written successfully');
 
-      console.log('[API] Sending successful response');
-      return NextResponse.json(result);
-    } catch (error) {
-      // Clean up temp file even on error
-      console.error('[API] Error during Python execution or parsing:', error);
       try {
-        await unlink(tempFilePath);
-        console.log('[API] Temp file cleaned up after error');
-      } catch (cleanupError) {
-        console.error('[API] Failed to cleanup temp file:', cleanupError);
+        // Execute Python script
+        const pythonScript = join(process.cwd(), 'models', 'xray_api.py');
+        const explainArgs = explain && /^(always|band|lazy)$/.test(explain) ? ` --explain ${explain}` : '';
+        const pythonCommand = `python "${pythonScript}" "${tempFilePath}"${explainArgs}`;
+        console.log('[API] Executing Python command:', pythonCommand);
+
+        const { stdout, stderr } = await xrayAdmission().run(priority, () =>
+          withSpan(span, 'python.xray_api', (spawn) =>
+            execAsync(pythonCommand, { env: traceEnv(spawn) })
+          )
+        );
+        console.log('[API] Python stdout:', stdout);
+        if (stderr) console.log('[API] Python stderr:', stderr);
+
+        // Parse result
+        console.log('[API] Parsing result...');
+        return JSON.parse(stdout);
+      } catch (error) {
+        console.error('[API] Error during Python execution or parsing:', error);
+        throw error;
+      } finally {
+        // Clean up temp file whether or not the run succeeded
+        try {
+          await unlink(tempFilePath);
+          console.log('[API] Temp file deleted');
+        } catch (cleanupError) {
+          console.error('[API] Failed to cleanup temp file:', cleanupError);
+        }
       }
-      
-      throw error;
-    }
+    });
+    console.log('[API] Result parsed successfully:', { label: result.label, probability: result.probability });
+
+    console.log('[API] Sending successful response');
+    const [body, headers] = splitStageTimings(result);
+    return NextResponse.json(body, { headers });
   } catch (error) {
+    if (error instanceof AdmissionRejected) {
+      console.warn('[API] X-ray request shed:', error.priority, error.reason);
+      return NextResponse.json(
+        { error: 'X-ray analysis is busy, please retry', details: error.message, priority: error.priority },
+        { status: 503, headers: { 'Retry-After': String(error.retryAfterSeconds) } }
+      );
+    }
     console.error('[API] Top-level error processing X-ray:', error);
     return NextResponse.json(
       { error: 'Failed to process X-ray image', details: error instanceof Error ? error.message : String(error) },
@@ -80,3 +118,40 @@ export async function POST(request: NextRequest) {
     );
   }
 }
+
+async function explainFromHandle(handle: string, span: Span) {
+  // Handles are hex content hashes; anything else never reaches the shell
+  if (!/^[0-9a-f]{32}$/.test(handle)) {
+    return NextResponse.json({ error: 'Invalid explanation handle' }, { status: 400 });
+  }
+
+  const pythonScript = join(process.cwd(), 'models', 'xray_api.py');
+  const pythonCommand = `python "${pythonScript}" --explain-handle ${handle}`;
+  try {
+    const result = await flight.run(`explain:${handle}`, async () => {
+      // The decision was already returned, so an explanation can wait behind new films
+      const { stdout } = await xrayAdmission().run('moderate', () =>
+        withSpan(span, 'python.xray_api.explain', (spawn) =>
+          execAsync(pythonCommand, { env: traceEnv(spawn) })
+        )
+      );
+      return JSON.parse(stdout);
+    });
+    const [body, headers] = splitStageTimings(result);
+    return NextResponse.json(body, { headers });
+  } catch (error) {
+    if (error instanceof AdmissionRejected) {
+      return NextResponse.json(
+        { error: 'X-ray analysis is busy, please retry', details: error.message },
+        { status: 503, headers: { 'Retry-After': String(error.retryAfterSeconds) } }
+      );
+    }
+    // A failed run still prints its JSON error (e.g. an expired handle) before exiting 1
+    let details = error instanceof Error ? error.message : String(error);
+    try {
+      details = JSON.parse((error as { stdout?: string }).stdout ?? '').error ?? details;
+    } catch {}
+    const status = /handle/i.test(details) ? 404 : 500;
+    return NextResponse.json({ error: 'Failed to explain X-ray', details }, { status });
+  }
+}
@@ -3,10 +3,18 @@ import { exec } from 'child_process';
 import { promisify } from 'util';
 import { join } from 'path';
 import { writeFile, unlink } from 'fs/promises';
+import { canonicalKey, singleFlight } from '@/lib/singleFlight';
+import { splitStageTimings } from '@/lib/serverTiming';
+import { Span, traceEnv, traceRoute, withSpan } from '@/lib/tracing';
 
 const execAsync = promisify(exec);
+const flight = singleFlight<Record<string, any>>('generate-report');
 
 export async function POST(request: NextRequest) {
+  return traceRoute(request, 'POST /api/generate-report', (span) => generateReport(request, span));
+}
+
+async function generateReport(request: NextRequest, span: Span) {
   console.log('[API] Received generate-report request');
   
   try {
@@ -43,44 +51,46 @@ export async function POST(request: NextRequest) {
     const inputJson = JSON.stringify(inputData);
     console.log('[API] Input for Python:', inputJson);
 
-    // Write input to temporary file
-    const tempInputFile = join(process.cwd(), 'uploads', `report_input_${Date.now()}.json`);
-    await writeFile(tempInputFile, inputJson);
+    // Identical concurrent requests share one Python run
+    const result = await flight.run(canonicalKey(inputData), async () => {
+      // Write input to temporary file
+      const tempInputFile = join(process.cwd(), 'uploads', `report_input_${Date.now()}_${Math.random().toString(36).slice(2)}.json`);
+      await writeFile(tempInputFile, inputJson);
 
-    try {
-      // Execute Python script
-      const pythonScript = join(process.cwd(), 'models', 'report_generator.py');
-      const pythonCommand = `python "${pythonScript}" "${tempInputFile}"`;
-      console.log('[API] Executing Python command');
-      
-      const { stdout, stderr } = await execAsync(pythonCommand, {
-        maxBuffer: 1024 * 1024 * 10 // 10MB buffer
-      });
-      
-      if (stderr) console.log('[API] Python stderr:', stderr);
-      console.log('[API] Python stdout:', stdout);
+      try {
+        // Execute Python script with temp file
+        const pythonScript = join(process.cwd(), 'models', 'report_generator.py');
+        const pythonCommand = `python "${pythonScript}" "${tempInputFile}"`;
+        console.log('[API] Executing Python command');
 
-      // Parse Python output
-      const result = JSON.parse(stdout.trim());
-      console.log('[API] Report result:', result);
+        const { stdout, stderr } = await withSpan(span, 'python.report_generator', (spawn) =>
+          execAsync(pythonCommand, {
+            maxBuffer: 1024 * 1024 * 10, // 10MB buffer
+            env: traceEnv(spawn)
+          })
+        );
 
-      // Clean up temp file
-      await unlink(tempInputFile).catch(() => {});
+        if (stderr) console.log('[API] Python stderr:', stderr);
+        console.log('[API] Python stdout:', stdout);
 
-      if (result.error) {
-        return NextResponse.json(
-          { error: result.error, traceback: result.traceback },
-          { status: 500 }
-        );
+        // Parse Python output
+        return JSON.parse(stdout.trim());
+      } finally {
+        // Clean up temp file
+        await unlink(tempInputFile).catch(() => {});
       }
+    });
+    console.log('[API] Report result:', result);
 
-      return NextResponse.json(result);
-      
-    } catch (error) {
-      // Clean up temp file on error
-      await unlink(tempInputFile).catch(() => {});
-      throw error;
+    if (result.error) {
+      return NextResponse.json(
+        { error: result.error, traceback: result.traceback },
+        { status: 500 }
+      );
     }
+
+    const [body, headers] = splitStageTimings(result);
+    return NextResponse.json(body, { headers });
     
   } catch (error) {
     console.error('[API] Error generating report:', error);
@@ -0,0 +1,7 @@
+import { NextResponse } from 'next/server';
+import { singleFlightStats } from '@/lib/singleFlight';
+
+// How often concurrent identical requests shared one Python run, per route
+export async function GET() {
+  return NextResponse.json(singleFlightStats());
+}
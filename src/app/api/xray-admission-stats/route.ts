@@ -0,0 +1,7 @@
+import { NextResponse } from 'next/server';
+import { xrayAdmission } from '@/lib/admission';
+
+// Queue depth, in-flight work, shed counts and queue-wait percentiles per priority
+export async function GET() {
+  return NextResponse.json(xrayAdmission().stats());
+}
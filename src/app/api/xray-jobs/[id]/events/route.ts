@@ -0,0 +1,59 @@
+import { NextRequest } from 'next/server';
+import { FINAL_STATUSES, getJob } from '@/lib/xrayJobs';
+
+const POLL_INTERVAL_MS = 250;
+const HEARTBEAT_MS = 15_000;
+const MAX_STREAM_MS = 10 * 60_000;
+
+// Server-sent events for one job: an event named after each new status
+// ("running", "scored" with the probability, "done" with the overlay,
+// "failed"), then the stream closes.
+export async function GET(request: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  const { id } = await params;
+  const encoder = new TextEncoder();
+
+  const stream = new ReadableStream({
+    async start(controller) {
+      const send = (event: string, data: unknown) =>
+        controller.enqueue(encoder.encode(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`));
+      const started = Date.now();
+      let lastStatus: string | null = null;
+      let lastBeat = started;
+
+      try {
+        while (!request.signal.aborted && Date.now() - started < MAX_STREAM_MS) {
+          const job = await getJob(id);
+          if (!job) {
+            send('error', { error: 'Unknown job' });
+            break;
+          }
+          if (job.status !== lastStatus) {
+            lastStatus = job.status;
+            // The overlay is only sent once, with the final event
+            send(job.status, job.status === 'done' ? job : { ...job, image: null });
+            if (FINAL_STATUSES.includes(job.status)) break;
+          } else if (Date.now() - lastBeat > HEARTBEAT_MS) {
+            controller.enqueue(encoder.encode(': keep-alive\n\n'));
+            lastBeat = Date.now();
+          }
+          await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+        }
+      } catch (error) {
+        send('error', { error: error instanceof Error ? error.message : String(error) });
+      } finally {
+        // Already closed if the client went away
+        try {
+          controller.close();
+        } catch {}
+      }
+    }
+  });
+
+  return new Response(stream, {
+    headers: {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache, no-transform',
+      Connection: 'keep-alive'
+    }
+  });
+}
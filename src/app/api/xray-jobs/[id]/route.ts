@@ -0,0 +1,12 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { getJob } from '@/lib/xrayJobs';
+
+// Polling form of the job status: probability once "scored", overlay once "done"
+export async function GET(_request: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  const { id } = await params;
+  const job = await getJob(id);
+  if (!job) {
+    return NextResponse.json({ error: 'Unknown job' }, { status: 404 });
+  }
+  return NextResponse.json(job, { headers: { 'Cache-Control': 'no-store' } });
+}
@@ -0,0 +1,53 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { writeFile } from 'fs/promises';
+import { priorityFrom } from '@/lib/admission';
+import { jobCounts, jobImagePath, submitJob } from '@/lib/xrayJobs';
+
+// Asynchronous X-ray analysis: returns a job ID at once; progress comes from
+// GET /api/xray-jobs/<id> or the SSE stream at /api/xray-jobs/<id>/events.
+// Workers run separately: `python models/xray_jobs.py serve --workers N`.
+export async function POST(request: NextRequest) {
+  console.log('[API] Received xray-jobs submission');
+
+  try {
+    const formData = await request.formData();
+    const file = formData.get('file') as File;
+
+    if (!file) {
+      return NextResponse.json({ error: 'No file uploaded' }, { status: 400 });
+    }
+
+    const probabilityField = formData.get('vitalsProbability');
+    const priority = priorityFrom(
+      probabilityField === null ? null : Number(probabilityField),
+      formData.get('triageBand') as string | null
+    );
+
+    const imagePath = jobImagePath(file.name);
+    await writeFile(imagePath, Buffer.from(await file.arrayBuffer()));
+    const jobId = await submitJob(imagePath, priority);
+    console.log('[API] Queued X-ray job', jobId, 'priority', priority);
+
+    return NextResponse.json(
+      {
+        jobId,
+        status: 'queued',
+        priority,
+        statusUrl: `/api/xray-jobs/${jobId}`,
+        eventsUrl: `/api/xray-jobs/${jobId}/events`
+      },
+      { status: 202, headers: { Location: `/api/xray-jobs/${jobId}` } }
+    );
+  } catch (error) {
+    console.error('[API] Error queueing X-ray job:', error);
+    return NextResponse.json(
+      { error: 'Failed to queue X-ray job', details: error instanceof Error ? error.message : String(error) },
+      { status: 500 }
+    );
+  }
+}
+
+// Job counts by status, for sizing the worker pool
+export async function GET() {
+  return NextResponse.json(await jobCounts());
+}
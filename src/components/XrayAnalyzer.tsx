@@ -4,6 +4,7 @@ import React, { useState, useRef } from "react";
 import { Upload, Scan, AlertCircle, CheckCircle2, Loader2, X } from "lucide-react";
 import { motion, AnimatePresence } from "framer-motion";
 import { useXrayContext } from "@/contexts/XrayContext";
+import { useVitalsContext } from "@/contexts/VitalsContext";
 
 interface AnalysisResult {
   label: string;
@@ -17,6 +18,7 @@ export default function XrayAnalyzer() {
   const [error, setError] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const { setXrayResults, setXrayResult, xrayResult, previewUrl, setPreviewUrl, clearXray } = useXrayContext();
+  const { riskAnalysis } = useVitalsContext();
   
   // Feedback states
   const [showFeedback, setShowFeedback] = useState(false);
@@ -48,6 +50,10 @@ export default function XrayAnalyzer() {
 
     const formData = new FormData();
     formData.append('file', selectedFile);
+    // Lets the server prioritise this film by the patient's current vitals risk
+    if (riskAnalysis) {
+      formData.append('vitalsProbability', String(riskAnalysis.vitals_probability));
+    }
     console.log('[Client] FormData created with file');
 
     try {
@@ -59,6 +65,11 @@ export default function XrayAnalyzer() {
 
       console.log('[Client] Response status:', response.status, response.statusText);
 
+      if (response.status === 503) {
+        const retryAfter = response.headers.get('Retry-After');
+        throw new Error(`X-ray analysis is busy. Please retry${retryAfter ? ` in ${retryAfter}s` : ''}.`);
+      }
+
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
         console.error('[Client] Error response:', errorData);
@@ -0,0 +1,223 @@
+import { cpus } from 'os';
+
+// Bounded, priority-ordered admission in front of the X-ray CNN. Each
+// request gets a priority from the patient's latest vitals probability or
+// triage band (same cutoffs as models/fusion_logic.py). Lower priorities may
+// only hold part of the slots, so critical work always finds one free soon;
+// queued work is started highest priority first, and low-priority work is
+// shed with a Retry-After when its queue is full or it would miss its
+// queue-time deadline.
+
+export const PRIORITIES = ['critical', 'high', 'moderate', 'low'] as const;
+export type Priority = (typeof PRIORITIES)[number];
+
+const TRIAGE_CUTOFFS = [0.35, 0.6, 0.8];
+const BAND_PRIORITY: Record<string, Priority> = {
+  'CRITICAL RISK': 'critical',
+  'HIGH RISK': 'high',
+  'MODERATE RISK': 'moderate',
+  'LOW RISK': 'low'
+};
+
+// Unknown patients are treated as high, so missing vitals never push a film to the back
+export function priorityFrom(vitalsProbability?: number | null, triageBand?: string | null): Priority {
+  const band = triageBand?.trim().toUpperCase();
+  if (band && BAND_PRIORITY[band]) return BAND_PRIORITY[band];
+  if (band && (PRIORITIES as readonly string[]).includes(band.toLowerCase())) return band.toLowerCase() as Priority;
+  if (vitalsProbability == null || !Number.isFinite(vitalsProbability)) return 'high';
+  if (vitalsProbability >= TRIAGE_CUTOFFS[2]) return 'critical';
+  if (vitalsProbability >= TRIAGE_CUTOFFS[1]) return 'high';
+  if (vitalsProbability >= TRIAGE_CUTOFFS[0]) return 'moderate';
+  return 'low';
+}
+
+export interface PriorityPolicy {
+  slotShare: number;      // fraction of total slots this priority may hold
+  queueLimit: number;     // waiting requests before new ones are shed
+  deadlineMs: number;     // longest acceptable wait in the queue
+  sheddable: boolean;     // may be rejected early on a predicted deadline miss
+}
+
+export const DEFAULT_POLICY: Record<Priority, PriorityPolicy> = {
+  critical: { slotShare: 1.0, queueLimit: 256, deadlineMs: 120_000, sheddable: false },
+  high: { slotShare: 0.85, queueLimit: 64, deadlineMs: 60_000, sheddable: false },
+  moderate: { slotShare: 0.75, queueLimit: 32, deadlineMs: 20_000, sheddable: true },
+  low: { slotShare: 0.5, queueLimit: 16, deadlineMs: 8_000, sheddable: true }
+};
+
+export class AdmissionRejected extends Error {
+  constructor(
+    readonly priority: Priority,
+    readonly reason: 'queue_full' | 'deadline' | 'predicted_deadline',
+    readonly retryAfterSeconds: number
+  ) {
+    super(`X-ray inference is overloaded (${reason}); retry in ${retryAfterSeconds}s`);
+  }
+}
+
+interface Waiter {
+  enqueuedAt: number;
+  start: () => void;
+  timer: ReturnType<typeof setTimeout>;
+}
+
+const WAIT_HISTORY = 1024;
+const SERVICE_EWMA_ALPHA = 0.2;
+
+function percentile(sorted: number[], q: number): number | null {
+  if (!sorted.length) return null;
+  return sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+}
+
+export interface PriorityStats {
+  queueDepth: number;
+  inFlight: number;
+  slotLimit: number;
+  admitted: number;
+  shed: number;
+  expired: number;
+  waitMs: { p50: number | null; p95: number | null; p99: number | null; max: number | null };
+}
+
+export class AdmissionScheduler {
+  private inFlight = 0;
+  private running: Record<Priority, number> = { critical: 0, high: 0, moderate: 0, low: 0 };
+  private queues: Record<Priority, Waiter[]> = { critical: [], high: [], moderate: [], low: [] };
+  private counters = Object.fromEntries(
+    PRIORITIES.map((p) => [p, { admitted: 0, shed: 0, expired: 0 }])
+  ) as Record<Priority, { admitted: number; shed: number; expired: number }>;
+  private waits: Record<Priority, number[]> = { critical: [], high: [], moderate: [], low: [] };
+  private serviceMs = 0;
+
+  constructor(
+    readonly capacity: number,
+    readonly policy: Record<Priority, PriorityPolicy> = DEFAULT_POLICY
+  ) {}
+
+  private slotLimit(priority: Priority): number {
+    return Math.max(1, Math.floor(this.capacity * this.policy[priority].slotShare));
+  }
+
+  private canStart(priority: Priority): boolean {
+    return this.inFlight < this.capacity && this.inFlight < this.slotLimit(priority);
+  }
+
+  // Expected wait if queued behind everything of equal or higher priority
+  private predictedWaitMs(priority: Priority): number {
+    const rank = PRIORITIES.indexOf(priority);
+    const ahead = PRIORITIES.slice(0, rank + 1).reduce((n, p) => n + this.queues[p].length, 0);
+    return ((ahead + 1) * (this.serviceMs || 1000)) / Math.min(this.capacity, this.slotLimit(priority));
+  }
+
+  private retryAfter(priority: Priority): number {
+    return Math.max(1, Math.ceil(this.predictedWaitMs(priority) / 1000));
+  }
+
+  private shed(priority: Priority, reason: AdmissionRejected['reason']): AdmissionRejected {
+    this.counters[priority].shed += 1;
+    return new AdmissionRejected(priority, reason, this.retryAfter(priority));
+  }
+
+  private recordWait(priority: Priority, ms: number) {
+    const waits = this.waits[priority];
+    waits.push(ms);
+    if (waits.length > WAIT_HISTORY) waits.shift();
+  }
+
+  // Slots are taken synchronously, either here or in dispatch(), so a burst can't over-admit
+  private take(priority: Priority) {
+    this.inFlight += 1;
+    this.running[priority] += 1;
+    this.counters[priority].admitted += 1;
+  }
+
+  async run<T>(priority: Priority, fn: () => Promise<T>): Promise<T> {
+    const policy = this.policy[priority];
+    if (this.canStart(priority)) {
+      this.take(priority);
+      this.recordWait(priority, 0);
+    } else {
+      if (this.queues[priority].length >= policy.queueLimit) throw this.shed(priority, 'queue_full');
+      if (policy.sheddable && this.predictedWaitMs(priority) > policy.deadlineMs) {
+        throw this.shed(priority, 'predicted_deadline');
+      }
+      await this.enqueue(priority);
+    }
+
+    const started = Date.now();
+    try {
+      return await fn();
+    } finally {
+      const elapsed = Date.now() - started;
+      this.serviceMs = this.serviceMs ? this.serviceMs + SERVICE_EWMA_ALPHA * (elapsed - this.serviceMs) : elapsed;
+      this.inFlight -= 1;
+      this.running[priority] -= 1;
+      this.dispatch();
+    }
+  }
+
+  private enqueue(priority: Priority): Promise<void> {
+    return new Promise((resolve, reject) => {
+      const queue = this.queues[priority];
+      const waiter: Waiter = {
+        enqueuedAt: Date.now(),
+        start: () => {
+          clearTimeout(waiter.timer);
+          this.recordWait(priority, Date.now() - waiter.enqueuedAt);
+          resolve();
+        },
+        timer: setTimeout(() => {
+          const index = queue.indexOf(waiter);
+          if (index >= 0) queue.splice(index, 1);
+          this.counters[priority].expired += 1;
+          reject(new AdmissionRejected(priority, 'deadline', this.retryAfter(priority)));
+        }, this.policy[priority].deadlineMs)
+      };
+      queue.push(waiter);
+    });
+  }
+
+  // Starts queued work, highest priority first, while slots allow
+  private dispatch() {
+    for (const priority of PRIORITIES) {
+      const queue = this.queues[priority];
+      while (queue.length && this.canStart(priority)) {
+        this.take(priority);
+        queue.shift()!.start();
+      }
+    }
+  }
+
+  stats(): { capacity: number; inFlight: number; serviceMsEwma: number; priorities: Record<Priority, PriorityStats> } {
+    const priorities = Object.fromEntries(
+      PRIORITIES.map((p) => {
+        const sorted = [...this.waits[p]].sort((a, b) => a - b);
+        return [p, {
+          queueDepth: this.queues[p].length,
+          inFlight: this.running[p],
+          slotLimit: this.slotLimit(p),
+          ...this.counters[p],
+          waitMs: {
+            p50: percentile(sorted, 0.5),
+            p95: percentile(sorted, 0.95),
+            p99: percentile(sorted, 0.99),
+            max: sorted.length ? sorted[sorted.length - 1] : null
+          }
+        }];
+      })
+    ) as Record<Priority, PriorityStats>;
+    return { capacity: this.capacity, inFlight: this.inFlight, serviceMsEwma: Math.round(this.serviceMs), priorities };
+  }
+}
+
+// XRAY_MAX_CONCURRENCY caps concurrent CNN processes; defaults to half the cores
+const DEFAULT_CAPACITY = Math.max(1, Math.floor(cpus().length / 2));
+
+// Kept on globalThis so dev-server hot reloads don't reset the queue or counters
+const globalStore = globalThis as unknown as { __xrayAdmission?: AdmissionScheduler };
+
+export function xrayAdmission(): AdmissionScheduler {
+  return (globalStore.__xrayAdmission ??= new AdmissionScheduler(
+    Number(process.env.XRAY_MAX_CONCURRENCY) || DEFAULT_CAPACITY
+  ));
+}
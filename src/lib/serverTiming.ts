@@ -0,0 +1,22 @@
+// The Python scripts report per-stage durations (stage_timings_ms) when run
+// with STAGE_TIMING_REPORT=1; routes move them into a Server-Timing header.
+// Like api/app.py, this is off unless SERVER_TIMING=1, so internal timings
+// are not exposed to clients by default.
+
+const SERVER_TIMING = process.env.SERVER_TIMING === '1';
+
+export const STAGE_TIMING_ENV: NodeJS.ProcessEnv = SERVER_TIMING
+  ? { ...process.env, STAGE_TIMING_REPORT: '1' }
+  : { ...process.env };
+
+export function splitStageTimings<T extends Record<string, any>>(
+  result: T
+): [Omit<T, 'stage_timings_ms'>, Record<string, string> | undefined] {
+  const { stage_timings_ms: timings, ...body } = result;
+  if (!SERVER_TIMING || !timings || typeof timings !== 'object') return [body, undefined];
+
+  const header = Object.entries(timings as Record<string, number>)
+    .map(([stage, ms]) => `${stage};dur=${ms}`)
+    .join(', ');
+  return [body, { 'Server-Timing': header }];
+}
@@ -0,0 +1,79 @@
+import { createHash } from 'crypto';
+
+// Identical requests that arrive while one is already running share its
+// result instead of spawning another Python process. Nothing is kept after
+// the call settles, so this is not a cache: it only collapses bursts.
+
+export interface SingleFlightStats {
+  computed: number;
+  shared: number;
+  inFlight: number;
+  sharedRatio: number;
+}
+
+export class SingleFlight<T> {
+  private calls = new Map<string, Promise<T>>();
+  private computed = 0;
+  private shared = 0;
+
+  async run(key: string, fn: () => Promise<T>): Promise<T> {
+    const existing = this.calls.get(key);
+    if (existing) {
+      this.shared += 1;
+      return existing;
+    }
+
+    this.computed += 1;
+    const call = fn().finally(() => this.calls.delete(key));
+    this.calls.set(key, call);
+    return call;
+  }
+
+  stats(): SingleFlightStats {
+    const total = this.computed + this.shared;
+    return {
+      computed: this.computed,
+      shared: this.shared,
+      inFlight: this.calls.size,
+      sharedRatio: total ? this.shared / total : 0
+    };
+  }
+}
+
+function normalise(value: unknown): unknown {
+  if (Array.isArray(value)) return value.map(normalise);
+  if (value && typeof value === 'object') {
+    return Object.fromEntries(
+      Object.keys(value as Record<string, unknown>)
+        .sort()
+        .map((k) => [k, normalise((value as Record<string, unknown>)[k])])
+    );
+  }
+  return value;
+}
+
+// sha256 of the payload as key-sorted JSON
+export function canonicalKey(payload: unknown): string {
+  return createHash('sha256').update(JSON.stringify(normalise(payload))).digest('hex');
+}
+
+export function bytesKey(bytes: Buffer): string {
+  return createHash('sha256').update(bytes).digest('hex');
+}
+
+// Kept on globalThis so dev-server hot reloads don't reset in-flight calls or counters
+const globalStore = globalThis as unknown as { __singleFlights?: Map<string, SingleFlight<unknown>> };
+const registry = (globalStore.__singleFlights ??= new Map());
+
+export function singleFlight<T>(name: string): SingleFlight<T> {
+  let flight = registry.get(name);
+  if (!flight) {
+    flight = new SingleFlight<unknown>();
+    registry.set(name, flight);
+  }
+  return flight as SingleFlight<T>;
+}
+
+export function singleFlightStats(): Record<string, SingleFlightStats> {
+  return Object.fromEntries([...registry].map(([name, flight]) => [name, flight.stats()]));
+}
@@ -0,0 +1,104 @@
+import { randomBytes } from 'crypto';
+import { appendFile } from 'fs/promises';
+import { STAGE_TIMING_ENV } from '@/lib/serverTiming';
+
+// Request tracing shared with models/tracing.py. Each route opens a span from
+// the incoming traceparent header (or starts a trace), wraps the Python spawn
+// in a child span, and hands the spawn's context to the script through the
+// TRACEPARENT environment variable. Spans go to the same JSONL file as the
+// Python side (TRACE_LOG_PATH); inspect with `python models/tracing.py show <trace_id>`.
+
+const TRACE_LOG_PATH = process.env.TRACE_LOG_PATH;
+
+const TRACEPARENT_PATTERN = /^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$/;
+
+export class Span {
+  readonly spanId = randomBytes(8).toString('hex');
+  readonly startTime = Date.now() / 1000;
+  private readonly started = performance.now();
+
+  constructor(
+    readonly name: string,
+    readonly traceId: string,
+    readonly parentSpanId: string | null,
+    readonly attributes: Record<string, unknown> = {}
+  ) {}
+
+  get traceparent(): string {
+    return `00-${this.traceId}-${this.spanId}-01`;
+  }
+
+  child(name: string, attributes?: Record<string, unknown>): Span {
+    return new Span(name, this.traceId, this.spanId, attributes);
+  }
+
+  async end(error?: unknown): Promise<void> {
+    if (!TRACE_LOG_PATH) return;
+    const record: Record<string, unknown> = {
+      trace_id: this.traceId,
+      span_id: this.spanId,
+      parent_span_id: this.parentSpanId,
+      name: this.name,
+      service: 'next',
+      start_time: Number(this.startTime.toFixed(6)),
+      duration_ms: Number((performance.now() - this.started).toFixed(3)),
+      status: error ? 'error' : 'ok'
+    };
+    if (Object.keys(this.attributes).length) record.attributes = this.attributes;
+    if (error) record.error = error instanceof Error ? error.message : String(error);
+    // Tracing must never fail a request
+    await appendFile(TRACE_LOG_PATH, JSON.stringify(record) + '\n').catch(() => {});
+  }
+}
+
+// Root span for a route; continues the caller's trace if a valid traceparent was sent
+export function startRouteSpan(request: Request, name: string): Span {
+  const match = TRACEPARENT_PATTERN.exec(request.headers.get('traceparent') ?? '');
+  return match
+    ? new Span(name, match[1], match[2])
+    : new Span(name, randomBytes(16).toString('hex'), null);
+}
+
+// Wraps a route handler in a root span and adds the trace headers to its response
+export async function traceRoute(
+  request: Request,
+  name: string,
+  handler: (span: Span) => Promise<Response>
+): Promise<Response> {
+  const span = startRouteSpan(request, name);
+  const response = await handler(span);
+  span.attributes.status_code = response.status;
+  for (const [header, value] of Object.entries(traceHeaders(span))) {
+    response.headers.set(header, value);
+  }
+  await span.end(response.status >= 500 ? `HTTP ${response.status}` : undefined);
+  return response;
+}
+
+// Runs fn inside a child span, recording errors on the span before rethrowing
+export async function withSpan<T>(
+  parent: Span,
+  name: string,
+  fn: (span: Span) => Promise<T>,
+  attributes?: Record<string, unknown>
+): Promise<T> {
+  const span = parent.child(name, attributes);
+  try {
+    const result = await fn(span);
+    await span.end();
+    return result;
+  } catch (error) {
+    await span.end(error);
+    throw error;
+  }
+}
+
+// Environment for a Python spawn: stage timing plus the spawn span's trace context
+export function traceEnv(span: Span): NodeJS.ProcessEnv {
+  return { ...STAGE_TIMING_ENV, TRACEPARENT: span.traceparent };
+}
+
+// The trace ID doubles as the request ID clients can quote when reporting a slow call
+export function traceHeaders(span: Span): Record<string, string> {
+  return { 'x-request-id': span.traceId, traceparent: span.traceparent };
+}
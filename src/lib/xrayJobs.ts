@@ -0,0 +1,108 @@
+import { createClient, type Client } from '@libsql/client';
+import { join } from 'path';
+import { mkdir } from 'fs/promises';
+import { randomUUID } from 'crypto';
+import type { Priority } from '@/lib/admission';
+
+// Route side of the SQLite job queue in models/xray_jobs.py: the routes
+// insert queued rows and read progress; `python models/xray_jobs.py serve`
+// runs the workers. The table layout must match SCHEMA there.
+
+export const JOB_DB_PATH = process.env.XRAY_JOB_DB ?? join(process.cwd(), 'uploads', 'xray_jobs.sqlite');
+export const JOB_IMAGE_DIR = process.env.XRAY_JOB_DIR ?? join(process.cwd(), 'uploads', 'xray_jobs');
+
+const SCHEMA = [
+  'CREATE TABLE IF NOT EXISTS xray_jobs (' +
+    'id TEXT PRIMARY KEY, ' +
+    'status TEXT NOT NULL, ' +
+    'priority INTEGER NOT NULL DEFAULT 0, ' +
+    'image_path TEXT NOT NULL, ' +
+    'created_at REAL NOT NULL, ' +
+    'started_at REAL, ' +
+    'updated_at REAL NOT NULL, ' +
+    'attempts INTEGER NOT NULL DEFAULT 0, ' +
+    'worker TEXT, ' +
+    'label TEXT, ' +
+    'probability REAL, ' +
+    'overlay TEXT, ' +
+    'error TEXT)',
+  'CREATE INDEX IF NOT EXISTS xray_jobs_queue ON xray_jobs (status, priority DESC, created_at)'
+];
+
+export type JobStatus = 'queued' | 'running' | 'scored' | 'done' | 'failed';
+export const FINAL_STATUSES: JobStatus[] = ['done', 'failed'];
+
+// Workers claim higher numbers first
+const PRIORITY_RANK: Record<Priority, number> = { critical: 3, high: 2, moderate: 1, low: 0 };
+
+export interface XrayJob {
+  id: string;
+  status: JobStatus;
+  label: string | null;
+  probability: number | null;
+  image: string | null;
+  error: string | null;
+  created_at: number;
+  updated_at: number;
+}
+
+// Kept on globalThis so dev-server hot reloads reuse one connection
+const globalStore = globalThis as unknown as { __xrayJobDb?: Promise<Client> };
+
+function database(): Promise<Client> {
+  return (globalStore.__xrayJobDb ??= (async () => {
+    await mkdir(JOB_IMAGE_DIR, { recursive: true });
+    const client = createClient({ url: `file:${JOB_DB_PATH}` });
+    await client.execute('PRAGMA journal_mode=WAL');
+    await client.execute('PRAGMA busy_timeout=10000');
+    for (const statement of SCHEMA) await client.execute(statement);
+    return client;
+  })());
+}
+
+export function jobImagePath(fileName: string): string {
+  const safeName = fileName.replace(/[^A-Za-z0-9._-]/g, '_').slice(-80);
+  return join(JOB_IMAGE_DIR, `${randomUUID()}_${safeName}`);
+}
+
+export async function submitJob(imagePath: string, priority: Priority): Promise<string> {
+  const db = await database();
+  const id = randomUUID().replace(/-/g, '');
+  const now = Date.now() / 1000;
+  await db.execute({
+    sql:
+      "INSERT INTO xray_jobs (id, status, priority, image_path, created_at, updated_at) " +
+      "VALUES (?, 'queued', ?, ?, ?, ?)",
+    args: [id, PRIORITY_RANK[priority], imagePath, now, now]
+  });
+  return id;
+}
+
+// Same shape as public_job() in xray_jobs.py: no worker internals or file paths
+export async function getJob(id: string): Promise<XrayJob | null> {
+  const db = await database();
+  const { rows } = await db.execute({
+    sql:
+      'SELECT id, status, label, probability, overlay AS image, error, created_at, updated_at ' +
+      'FROM xray_jobs WHERE id = ?',
+    args: [id]
+  });
+  if (!rows.length) return null;
+  const row = rows[0];
+  return {
+    id: String(row.id),
+    status: row.status as JobStatus,
+    label: row.label === null ? null : String(row.label),
+    probability: row.probability === null ? null : Number(row.probability),
+    image: row.image === null ? null : String(row.image),
+    error: row.error === null ? null : String(row.error),
+    created_at: Number(row.created_at),
+    updated_at: Number(row.updated_at)
+  };
+}
+
+export async function jobCounts(): Promise<Record<string, number>> {
+  const db = await database();
+  const { rows } = await db.execute('SELECT status, COUNT(*) AS n FROM xray_jobs GROUP BY status');
+  return Object.fromEntries(rows.map((row) => [String(row.status), Number(row.n)]));
+}